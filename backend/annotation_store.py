@@ -0,0 +1,115 @@
+"""
+Incremental annotation store for one transcript.
+
+Every annotated atom is appended to <project>/annotated/<file>.checkpoint.jsonl as
+soon as it comes back from the LLM, keyed by atom id and a hash of its text. A run
+that dies at atom 450 of 500 resumes with the remaining 50, and re-submitting an
+edited atom list only annotates atoms that are new or whose text changed. Each
+entry also records the prompt and model version it was made with, so a prompt or
+model change re-annotates every atom.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from paths import get_annotation_checkpoint_path
+from persistence import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """Short, stable hash of an atom's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class AnnotationCheckpoint:
+    """Append-only log of per-atom annotations for one file, indexed in memory by atom id."""
+
+    def __init__(self, project_slug: str, filename: str, version: str):
+        self.path = get_annotation_checkpoint_path(project_slug, filename)
+        self.version = version  # prompt and model the annotations must come from
+        self.entries: Dict[str, dict] = {}
+        self.line_count = 0
+        self._torn_at: Optional[int] = None  # where a partial last line starts, until it is cut off
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if data and not data.endswith(b"\n"):
+            # A crash mid-append leaves a partial last line; the atom is simply redone, and the
+            # line is cut off before the next append so the new record does not extend it.
+            self._torn_at = data.rfind(b"\n") + 1
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping partial line in %s", self.path)
+                continue
+            self.entries[entry["id"]] = entry
+            self.line_count += 1
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def lookup(self, atom: dict) -> Optional[dict]:
+        """Return the stored annotation for an atom if its text, prompt and model are unchanged."""
+        entry = self.entries.get(str(atom.get("id")))
+        if entry and entry["text_hash"] == text_hash(atom.get("text", "")) and entry.get("version") == self.version:
+            return {"insights": entry["insights"], "tags": entry["tags"]}
+        return None
+
+    def append(self, atom: dict, annotation: dict) -> None:
+        """Record one atom's annotation durably."""
+        entry = {
+            "id": str(atom["id"]),
+            "text_hash": text_hash(atom.get("text", "")),
+            "version": self.version,
+            "insights": annotation.get("insights", []),
+            "tags": annotation.get("tags", []),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._torn_at is not None:
+                os.truncate(self.path, self._torn_at)
+                self._torn_at = None
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[entry["id"]] = entry
+            self.line_count += 1
+
+    def seed(self, annotated_atoms: Iterable[dict]) -> int:
+        """Import annotations from an existing annotated file. Returns how many were added."""
+        added = 0
+        for atom in annotated_atoms:
+            if "id" in atom and "insights" in atom and str(atom["id"]) not in self.entries:
+                self.append(atom, atom)
+                added += 1
+        return added
+
+    def pending(self, atoms: List[dict]) -> List[dict]:
+        """Atoms that are new, or whose text, prompt or model changed since they were annotated."""
+        return [atom for atom in atoms if self.lookup(atom) is None]
+
+    def compact(self, atoms: List[dict]) -> None:
+        """Rewrite the log keeping one line per current atom, once superseded lines pile up."""
+        if self.line_count <= 2 * max(len(atoms), 1):
+            return
+        keep_ids = {str(atom.get("id")) for atom in atoms}
+        with self._lock:
+            kept = [entry for atom_id, entry in self.entries.items() if atom_id in keep_ids]
+            atomic_write_text(self.path, "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in kept))
+            self.entries = {entry["id"]: entry for entry in kept}
+            self.line_count = len(kept)
+            self._torn_at = None
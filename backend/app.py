@@ -1,10 +1,13 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from paths import ensure_dirs
-from routes import upload, atoms, graph, comments, quality_guard, chat, board, qa
+from routes import upload, atoms, graph, graph_query, comments, quality_guard, chat, board, qa, jobs, llm_cache
+from jobs import job_manager
+from pdf_pages import shutdown_pool as shutdown_pdf_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,7 +15,17 @@ logger = logging.getLogger(__name__)
 
 ensure_dirs()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Resume background jobs left queued by the previous run; stop PDF workers on exit."""
+    job_manager.resume_pending()
+    yield
+    job_manager.shutdown()
+    shutdown_pdf_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS to allow requests from the frontend development server
 app.add_middleware(
@@ -39,8 +52,11 @@ async def global_exception_handler(request: Request, exc: Exception):
 app.include_router(upload.router)
 app.include_router(atoms.router)
 app.include_router(graph.router)
+app.include_router(graph_query.router)
 app.include_router(comments.router)
 app.include_router(quality_guard.router)
 app.include_router(chat.router)
 app.include_router(board.router)
 app.include_router(qa.router)
+app.include_router(jobs.router)
+app.include_router(llm_cache.router)
@@ -0,0 +1,157 @@
+"""
+Encoding of the atoms, annotated and graph artifacts.
+
+Two formats, chosen for writes with ARTIFACT_FORMAT and told apart on read by
+their first bytes, so readers never need to know which one a file uses:
+
+- "json": compact JSON, through orjson when it is installed. The /cached endpoint
+  can stream it as-is.
+- "msgpack-zstd": MAGIC followed by zstd-compressed msgpack. Smaller and faster
+  still; needs the msgpack and zstandard packages.
+
+Existing projects are converted with
+
+    python artifact_codec.py migrate [--format json|msgpack-zstd] [project ...]
+"""
+
+import os
+import json
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+from paths import DATA_DIR, get_project_graph_path, get_stage_path
+from persistence import atomic_write_bytes, precompress, remove_precompressed
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+try:
+    import msgpack
+    import zstandard
+except ModuleNotFoundError:
+    msgpack = zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("json", "msgpack-zstd")
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "json")
+ZSTD_LEVEL = 3
+
+# JSON never starts with these bytes.
+MAGIC = b"SLGM\x01"
+
+if orjson is None:
+    logger.warning("orjson is not installed; artifacts are encoded with the slower json module "
+                   "(pip install '.[fast-artifacts]')")
+
+
+def _binary_available() -> bool:
+    return msgpack is not None and zstandard is not None
+
+
+def _resolve_format(fmt: Optional[str]) -> str:
+    fmt = fmt or ARTIFACT_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown artifact format '{fmt}'. Expected one of: {', '.join(FORMATS)}")
+    if fmt == "msgpack-zstd" and not _binary_available():
+        logger.warning("msgpack-zstd needs the msgpack and zstandard packages "
+                       "(pip install '.[fast-artifacts]'); writing json instead")
+        return "json"
+    return fmt
+
+
+def dumps(data: Any, fmt: Optional[str] = None) -> bytes:
+    if _resolve_format(fmt) == "msgpack-zstd":
+        packed = msgpack.packb(data, use_bin_type=True)
+        return MAGIC + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(packed)
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(raw: bytes) -> Any:
+    if raw.startswith(MAGIC):
+        if not _binary_available():
+            raise RuntimeError("Artifact is msgpack-zstd encoded; install msgpack and zstandard to read it")
+        packed = zstandard.ZstdDecompressor().decompress(raw[len(MAGIC):])
+        return msgpack.unpackb(packed, raw=False, strict_map_key=False)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+def write_artifact(path: str, data: Any, fmt: Optional[str] = None) -> None:
+    """Atomically write a stage artifact in `fmt` (default ARTIFACT_FORMAT)."""
+    atomic_write_bytes(path, dumps(data, fmt))
+
+
+def read_artifact(path: str) -> Any:
+    """Read a stage artifact in whichever format it was written."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def is_binary(path: str) -> bool:
+    """True if the artifact is not JSON, so it can't be sent to a client as-is."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def migrate_project(project_slug: str, fmt: Optional[str] = None) -> Dict[str, int]:
+    """
+    Re-encode a project's atoms, annotated and graph artifacts (and its project graph)
+    in `fmt`. Lineage is restamped with the new output hashes, so nothing is rebuilt.
+    """
+    import lineage  # lineage imports this module
+
+    fmt = _resolve_format(fmt)
+    counts = {"converted": 0, "unchanged": 0}
+    uploads = sorted(name for name in os.listdir(get_stage_path(project_slug, "uploads"))
+                     if name.lower().endswith(".pdf"))
+    for filename in uploads:
+        for stage in ("atoms", "annotated", "graph"):
+            path = lineage.STAGE_PATHS[stage](project_slug, filename)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                raw = f.read()
+            encoded = dumps(loads(raw), fmt)
+            if encoded == raw:
+                counts["unchanged"] += 1
+                continue
+            atomic_write_bytes(path, encoded)
+            if stage != "graph" and not encoded.startswith(MAGIC):
+                precompress(path)
+            else:
+                remove_precompressed(path)
+            lineage.restamp(project_slug, filename, stage)
+            counts["converted"] += 1
+    project_graph_path = get_project_graph_path(project_slug)
+    if os.path.exists(project_graph_path):
+        write_artifact(project_graph_path, read_artifact(project_graph_path), fmt)
+        counts["converted"] += 1
+    return counts
+
+
+def migrate_all(fmt: Optional[str] = None, projects: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    if projects is None:
+        projects = sorted(name for name in os.listdir(DATA_DIR)
+                          if not name.startswith("_") and os.path.isdir(os.path.join(DATA_DIR, name, "uploads")))
+    results = {}
+    for project_slug in projects:
+        results[project_slug] = migrate_project(project_slug, fmt)
+        logger.info("Migrated %s: %s", project_slug, results[project_slug])
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Re-encode stored stage artifacts.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("projects", nargs="*", help="project slugs (default: all)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="target format (default: ARTIFACT_FORMAT)")
+    args = parser.parse_args()
+    print(json.dumps(migrate_all(args.format, args.projects or None), indent=2))
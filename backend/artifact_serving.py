@@ -0,0 +1,122 @@
+"""
+Serving stage artifacts straight from disk for /cached/{stage}/{filename}.
+
+Responses are FileResponses (sendfile where the server supports it) with a strong
+ETag derived from the file's content hash, so a UI reload that sends
+If-None-Match gets a 304 without the file being read. The .gz/.br siblings that
+persistence.precompress writes next to an artifact are served to clients that
+accept them. A sibling older than its artifact is ignored, so a stale one is
+never served.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+
+from artifact_codec import is_binary, read_artifact
+from lineage import file_hash
+from persistence import PRECOMPRESSED_EXTENSIONS
+
+ETAG_CACHE_SIZE = 1024
+
+_etags: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+_etags_lock = threading.Lock()
+
+
+def content_etag(*paths: str) -> Optional[str]:
+    """
+    Strong ETag for the contents of one or more files, hashed once per (mtime, size)
+    and then served from memory. None if the first file is missing.
+    """
+    digests = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if not digests:
+                return None
+            digests.append("-")
+            continue
+        with _etags_lock:
+            cached = _etags.get(path)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                _etags.move_to_end(path)
+                digests.append(cached[2])
+                continue
+        digest = file_hash(path)
+        with _etags_lock:
+            _etags[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            while len(_etags) > ETAG_CACHE_SIZE:
+                _etags.popitem(last=False)
+        digests.append(digest)
+    return f'"{"-".join(d[:32] for d in digests)}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    """If-None-Match check; encoded variants of the same content carry a suffixed ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == base or any(tag == f"{base}-{name}" for name in PRECOMPRESSED_EXTENSIONS):
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response if the client already holds this version, else None."""
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def _accepted_encodings(request: Request) -> Iterable[str]:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name.lower())
+    return accepted
+
+
+def _fresh_sibling(path: str, ext: str) -> Optional[str]:
+    sibling = path + ext
+    try:
+        if os.stat(sibling).st_mtime_ns >= os.stat(path).st_mtime_ns:
+            return sibling
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def file_response(request: Request, path: str, media_type: str) -> Response:
+    """Serve an artifact from disk: 304 on a matching ETag, else the best precompressed variant or the file itself."""
+    etag = content_etag(path)
+    if etag is None:
+        raise FileNotFoundError(path)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    if is_binary(path):
+        # msgpack-zstd artifacts have to be decoded for the client.
+        return JSONResponse(read_artifact(path), headers={"ETag": etag, "Cache-Control": "no-cache"})
+    base = etag.strip('"')
+    headers: Dict[str, str] = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    accepted = _accepted_encodings(request)
+    for name, ext in PRECOMPRESSED_EXTENSIONS.items():
+        sibling = _fresh_sibling(path, ext) if name in accepted else None
+        if sibling:
+            headers.update({"ETag": f'"{base}-{name}"', "Content-Encoding": name})
+            return FileResponse(sibling, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
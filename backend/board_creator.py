@@ -10,6 +10,7 @@ from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from pathlib import Path
 from paths import get_stage_path
+from persistence import atomic_write_json
 import asyncio
 try:
     from supabase import create_client, Client  # type: ignore
@@ -146,8 +147,7 @@ class BoardCreator:
         
         # Save to file
         board_file = self.boards_dir / f"{board_id}.json"
-        with open(board_file, 'w') as f:
-            json.dump(board_data, f, indent=2, default=str)
+        atomic_write_json(str(board_file), board_data, indent=2, default=str)
         
         # Save to Supabase if available
         if self.supabase:
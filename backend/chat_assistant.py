@@ -6,13 +6,22 @@ Interactive AI assistant providing guidance throughout the research synthesis pr
 import json
 import re
 import os
-from typing import Dict, List, Optional, Any
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Any, Set
 from datetime import datetime
 import logging
 from dataclasses import dataclass, asdict
 
-from paths import get_chat_history_path
-from llm import gemini_model
+from paths import get_chat_history_path, get_chat_log_path
+from llm import cached_model
+from chat_context import CHAT_RECENT_TURNS, RollingSummary, build_chat_prompt, message_line, split_window
+from persistence import atomic_write_text, file_lock
+
+# Assistants kept in memory across requests; the least recently used is dropped first.
+CHAT_SESSION_CACHE_SIZE = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "32"))
+# Most recent messages kept in memory per assistant; older ones are read from the log when summarized.
+CHAT_HISTORY_TAIL = max(int(os.getenv("CHAT_HISTORY_TAIL", "200")), CHAT_RECENT_TURNS * 2)
 
 @dataclass
 class ChatMessage:
@@ -27,69 +36,153 @@ class ChatAssistant:
     def __init__(self, project_slug: str):
         self.project_slug = project_slug
         self.logger = logging.getLogger(__name__)
-        self.conversation_history: List[ChatMessage] = []
-        self.context = {
+        # The last CHAT_HISTORY_TAIL messages, with message_line() of each alongside.
+        self.conversation_history: Deque[ChatMessage] = deque(maxlen=CHAT_HISTORY_TAIL)
+        self._prompt_lines: Deque[str] = deque(maxlen=CHAT_HISTORY_TAIL)
+        # Counts over the whole log, kept as messages are read.
+        self.message_count = 0
+        self._role_counts: Dict[str, int] = {}
+        self._topics: Set[str] = set()
+        self.context = self._default_context()
+        self.log_path = get_chat_log_path(project_slug)
+        self._log_inode = None
+        self._log_offset = 0
+        self._lock = threading.RLock()
+        self.summary = RollingSummary(project_slug)
+        self._load_history()
+
+    @staticmethod
+    def _default_context() -> Dict[str, Any]:
+        return {
             'current_stage': 'initial',
             'project_data': {},
             'user_goals': [],
             'pending_questions': []
         }
-        self._load_history()
+
+    @staticmethod
+    def _message_line(msg: ChatMessage) -> str:
+        msg_dict = asdict(msg)
+        msg_dict['timestamp'] = msg.timestamp.isoformat()
+        return json.dumps(msg_dict, ensure_ascii=False) + "\n"
 
     def _load_history(self):
-        history_path = get_chat_history_path(self.project_slug)
-        if not os.path.exists(history_path):
+        """Read the JSONL history, converting a legacy history.json the first time."""
+        if not os.path.exists(self.log_path):
+            self._migrate_legacy_history()
+        self._catch_up()
+        self.logger.info(f"Loaded {self.message_count} messages for {self.project_slug}")
+
+    def _migrate_legacy_history(self):
+        legacy_path = get_chat_history_path(self.project_slug)
+        if not os.path.exists(legacy_path):
             return
         try:
-            with open(history_path, 'r', encoding='utf-8') as f:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
                 history_data = json.load(f)
-                for msg_data in history_data:
-                    msg_data['timestamp'] = datetime.fromisoformat(msg_data['timestamp'])
-                    self.conversation_history.append(ChatMessage(**msg_data))
-            self.logger.info(f"Loaded {len(self.conversation_history)} messages for {self.project_slug}")
+            messages = []
+            for msg_data in history_data:
+                msg_data['timestamp'] = datetime.fromisoformat(msg_data['timestamp'])
+                messages.append(ChatMessage(**msg_data))
         except (json.JSONDecodeError, KeyError, TypeError) as e:
             self.logger.error(f"Failed to load or parse chat history for {self.project_slug}: {e}")
+            return
+        with file_lock(self.log_path):
+            if not os.path.exists(self.log_path):
+                atomic_write_text(self.log_path, "".join(self._message_line(msg) for msg in messages))
+                self.logger.info(f"Converted {len(messages)} messages of {legacy_path} to JSONL")
+
+    def _catch_up(self):
+        """Read messages appended since the last look, including by other workers."""
+        try:
+            stat = os.stat(self.log_path)
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+        if self._log_offset and (inode != self._log_inode or size < self._log_offset):
+            self._forget_log()  # the log was removed, replaced or truncated since we read it
+        self._log_inode = inode
+        if size <= self._log_offset:
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            chunk = f.read(size - self._log_offset)
+        # A message still being written has no newline yet; leave it for the next look.
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.decode('utf-8').splitlines():
+            try:
+                msg_data = json.loads(line)
+                msg_data['timestamp'] = datetime.fromisoformat(msg_data['timestamp'])
+                self._remember(ChatMessage(**msg_data))
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                self.logger.error(f"Skipping bad chat history line for {self.project_slug}: {e}")
+        self._log_offset += len(complete)
+
+    def _forget_log(self):
+        """Drop what was read from the log so the next read starts again from offset 0."""
+        self.conversation_history.clear()
+        self._prompt_lines.clear()
+        self.message_count = 0
+        self._role_counts = {}
+        self._topics = set()
+        self._log_offset = 0
 
-    def _save_history(self):
-        history_path = get_chat_history_path(self.project_slug)
+    def _remember(self, msg: ChatMessage):
+        """Add a stored message to the in-memory tail and the running counts."""
+        self.conversation_history.append(msg)
+        self._prompt_lines.append(message_line(msg.role, msg.content))
+        self.message_count += 1
+        self._role_counts[msg.role] = self._role_counts.get(msg.role, 0) + 1
+        self._topics.update(self._topics_in(msg.content))
+
+    def _append_history(self, messages: List[ChatMessage]):
+        """Append messages to the history file as single lines."""
         try:
-            os.makedirs(os.path.dirname(history_path), exist_ok=True)
-            history_data = []
-            for msg in self.conversation_history:
-                msg_dict = asdict(msg)
-                msg_dict['timestamp'] = msg.timestamp.isoformat()
-                history_data.append(msg_dict)
-            with open(history_path, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, indent=2, ensure_ascii=False)
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with file_lock(self.log_path):
+                self._catch_up()
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write("".join(self._message_line(msg) for msg in messages))
+                    f.flush()
+                    os.fsync(f.fileno())
+                stat = os.stat(self.log_path)
+                self._log_inode, self._log_offset = stat.st_ino, stat.st_size
+            for msg in messages:
+                self._remember(msg)
         except Exception as e:
             self.logger.error(f"Failed to save chat history for {self.project_slug}: {e}")
 
     def process_message(self, message: str, current_context: Dict[str, Any]) -> Dict[str, Any]:
         """Process user message and generate contextual response"""
-        
-        # Update context
-        self.context.update(current_context)
-        
-        # Add to conversation history
-        self.conversation_history.append(ChatMessage(
+        with self._lock:
+            self._catch_up()
+            # Context comes from this request only; the assistant object outlives it.
+            context = {**self._default_context(), **current_context}
+            self.context = context
+            history_lines = list(self._prompt_lines)
+            first_index = self.message_count - len(history_lines)
+
+        user_message = ChatMessage(
             role="user",
             content=message,
             timestamp=datetime.now(),
             context=current_context
-        ))
-        
-        # Determine intent and generate response
+        )
+
+        # Determine intent and generate response; the LLM calls run without the lock,
+        # so other requests for this project are not queued behind them.
         intent = self._detect_intent(message)
-        response = self._generate_response(message, intent)
-        
-        # Add assistant response to history
-        self.conversation_history.append(ChatMessage(
+        response = self._generate_response(message, intent, context,
+                                           history_lines + [message_line("user", message)], first_index)
+
+        assistant_message = ChatMessage(
             role="assistant",
             content=json.dumps(response), # Store dict as string
             timestamp=datetime.now()
-        ))
-        
-        self._save_history()
+        )
+        with self._lock:
+            # Appended after any messages other requests or workers wrote meanwhile.
+            self._append_history([user_message, assistant_message])
         return response
     
     def _detect_intent(self, message: str) -> str:
@@ -136,31 +229,18 @@ class ChatAssistant:
         
         return 'general_question'
     
-    def _generate_response(self, message: str, intent: str) -> Dict[str, Any]:
-        """Generate a response using the Gemini model and conversation history."""
-
-        history_lines = []
-        for msg in self.conversation_history:
-            content = msg.content
-            if msg.role == "assistant":
-                try:
-                    content = json.loads(content).get("response", content)
-                except json.JSONDecodeError:
-                    pass
-            history_lines.append(f"{msg.role}: {content}")
-
-        conversation_text = "\n".join(history_lines)
-
-        prompt = (
-            "You are a helpful assistant for UX research synthesis. "
-            f"The user's intent is '{intent}'. "
-            "Use the conversation history and provided context to craft your reply.\n\n"
-            f"Context: {json.dumps(self.context)}\n\n"
-            f"{conversation_text}\nassistant:"
-        )
+    def _generate_response(self, message: str, intent: str, context: Dict[str, Any],
+                           history_lines: List[str], first_index: int) -> Dict[str, Any]:
+        """
+        Generate a response using the Gemini model and conversation history.
+        `history_lines` ends with the current message and starts at history message `first_index`.
+        """
+        older_count = first_index + len(split_window(history_lines)[0])
+        self.summary.update(older_count, self._read_prompt_lines, self._summarize)
+        prompt = build_chat_prompt(intent, message, context, history_lines, self.summary, first_index=first_index)
 
         try:
-            result = gemini_model.generate_content(prompt)
+            result = cached_model.generate_content(prompt, stage="chat")
             response_text = getattr(result, "text", str(result)).strip()
         except Exception as e:
             self.logger.error(f"Gemini generation failed: {e}")
@@ -173,7 +253,29 @@ class ChatAssistant:
             'context': {'intent': intent}
         }
 
-    
+    def _read_prompt_lines(self, offset: int):
+        """Yield (prompt line, offset after it) for each logged message from byte `offset` on."""
+        try:
+            f = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for raw in f:
+                offset += len(raw)
+                if not raw.endswith(b"\n"):
+                    return  # still being written
+                try:
+                    msg_data = json.loads(raw)
+                    line = message_line(msg_data['role'], msg_data['content'])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue  # skipped by _catch_up too, so not counted as a message
+                yield line, offset
+
+    def _summarize(self, prompt: str) -> str:
+        result = cached_model.generate_content(prompt, stage="chat_summary")
+        return getattr(result, "text", str(result))
+
     def _explain_theme_response(self, message: str) -> Dict[str, Any]:
         """Explain themes and their significance"""
         
@@ -416,36 +518,63 @@ Key principles:
     
     def get_conversation_summary(self) -> Dict[str, Any]:
         """Get summary of conversation"""
-        
-        return {
-            'total_messages': len(self.conversation_history),
-            'user_messages': len([m for m in self.conversation_history if m.role == 'user']),
-            'assistant_messages': len([m for m in self.conversation_history if m.role == 'assistant']),
-            'last_interaction': self.conversation_history[-1].timestamp.isoformat() if self.conversation_history else None,
-            'topics_discussed': self._extract_topics()
-        }
+        with self._lock:
+            self._catch_up()
+            return {
+                'total_messages': self.message_count,
+                'user_messages': self._role_counts.get('user', 0),
+                'assistant_messages': self._role_counts.get('assistant', 0),
+                'last_interaction': self.conversation_history[-1].timestamp.isoformat() if self.conversation_history else None,
+                'topics_discussed': sorted(self._topics)
+            }
     
-    def _extract_topics(self) -> List[str]:
-        """Extract topics from conversation history"""
-        topics = []
-        
-        for message in self.conversation_history:
-            content = message.content.lower()
-            
-            if 'theme' in content:
-                topics.append('themes')
-            if 'evidence' in content:
-                topics.append('evidence')
-            if 'quality' in content:
-                topics.append('quality')
-            if 'methodology' in content:
-                topics.append('methodology')
-            if 'export' in content or 'share' in content:
-                topics.append('export')
-        
-        return list(set(topics))
+    @staticmethod
+    def _topics_in(content: str) -> Set[str]:
+        """Topics a message touches on"""
+        content = content.lower()
+        topics = set()
+        
+        if 'theme' in content:
+            topics.add('themes')
+        if 'evidence' in content:
+            topics.add('evidence')
+        if 'quality' in content:
+            topics.add('quality')
+        if 'methodology' in content:
+            topics.add('methodology')
+        if 'export' in content or 'share' in content:
+            topics.add('export')
+        
+        return topics
 
 # Usage example
 def create_chat_assistant(project_slug: str) -> ChatAssistant:
     """Create a new chat assistant instance"""
     return ChatAssistant(project_slug)
+
+
+_assistants: "OrderedDict[str, ChatAssistant]" = OrderedDict()
+_assistants_lock = threading.Lock()
+
+
+def get_chat_assistant(project_slug: str) -> ChatAssistant:
+    """The project's assistant, kept in a bounded LRU so its history is read from disk once."""
+    key = get_chat_log_path(project_slug)
+    with _assistants_lock:
+        assistant = _assistants.get(key)
+        if assistant is not None:
+            _assistants.move_to_end(key)
+            return assistant
+    assistant = ChatAssistant(project_slug)
+    with _assistants_lock:
+        assistant = _assistants.setdefault(key, assistant)
+        _assistants.move_to_end(key)
+        while len(_assistants) > CHAT_SESSION_CACHE_SIZE:
+            _assistants.popitem(last=False)
+    return assistant
+
+
+def forget_chat_assistant(project_slug: str) -> None:
+    """Drop the project's cached assistant, e.g. once the project has been deleted."""
+    with _assistants_lock:
+        _assistants.pop(get_chat_log_path(project_slug), None)
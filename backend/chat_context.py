@@ -0,0 +1,300 @@
+"""
+Token-budgeted prompt building for ChatAssistant.
+
+A chat prompt is made of, in order of priority:
+- the instructions and the current message, always kept;
+- the last CHAT_RECENT_TURNS turns verbatim;
+- a rolling summary of everything older. It is folded forward with one LLM call
+  once CHAT_SUMMARY_STEP turns have slid out of the window, oldest messages
+  first, and stored in chat/summary.json so it survives restarts;
+- the project context the frontend sent, trimmed to the keys the intent needs
+  and to what is left of the budget.
+
+Tokens are estimated at CHARS_PER_TOKEN characters each; the budget is a ceiling
+on prompt size, not an exact count.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from paths import get_chat_summary_path
+from persistence import atomic_write_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "6000"))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+CHAT_SUMMARY_STEP = int(os.getenv("CHAT_SUMMARY_STEP", "4"))
+CHARS_PER_TOKEN = 4
+# Share of the budget the project context may take; recent turns get the rest.
+CONTEXT_SHARE = 0.4
+SUMMARY_MAX_TOKENS = 600
+# Most history folded into the summary in one call; a longer backlog (e.g. an old
+# history seen for the first time) only has its newest part summarized.
+SUMMARY_INPUT_MAX_TOKENS = 8000
+
+# Context keys each intent needs; anything else the frontend sends is left out.
+BASE_CONTEXT_KEYS = ("current_stage", "user_goals", "pending_questions")
+INTENT_CONTEXT_KEYS = {
+    "explain_theme": ("themes",),
+    "suggest_improvement": ("themes",),
+    "add_evidence": ("themes", "atoms"),
+    "clarify_methodology": (),
+    "validate_quality": ("themes", "quality_report"),
+    "export_share": ("themes",),
+    "general_question": ("themes",),
+}
+# Fields kept when a theme has to be shortened to fit.
+THEME_BRIEF_FIELDS = ("name", "description", "insight")
+
+CHAT_SUMMARY_PROMPT = """You maintain a running summary of a conversation between a UX researcher and their research-synthesis assistant.
+
+Update the summary with the new messages below. Keep decisions, open questions, themes and findings discussed, and the user's goals and preferences. Drop pleasantries and anything superseded. Write at most 200 words of plain prose.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Return only the updated summary."""
+
+WORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max(max_chars - 3, 0)] + "..."
+
+
+def message_line(role: str, content: str) -> str:
+    """One history line for the prompt; assistant turns are stored as JSON and only their reply text is used."""
+    if role == "assistant":
+        try:
+            content = json.loads(content).get("response", content)
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    return f"{role}: {content}"
+
+
+def _fit_list(items: Sequence[Any], max_tokens: int, brief: Optional[Callable[[Any], Any]] = None) -> List[Any]:
+    """As many items as fit in max_tokens, in order, shortening them with `brief` first if that lets more fit."""
+    def pack(candidates: Sequence[Any]) -> List[Any]:
+        kept, used = [], 2
+        for item in candidates:
+            cost = estimate_tokens(json.dumps(item, ensure_ascii=False, default=str)) + 1
+            if used + cost > max_tokens:
+                break
+            kept.append(item)
+            used += cost
+        return kept
+
+    kept = pack(items)
+    if brief is not None and len(kept) < len(items):
+        briefed = pack([brief(item) for item in items])
+        if len(briefed) > len(kept):
+            return briefed
+    return kept
+
+
+def _brief_theme(theme: Any) -> Any:
+    if not isinstance(theme, dict):
+        return theme
+    brief = {field: theme[field] for field in THEME_BRIEF_FIELDS if field in theme}
+    for field in ("evidence", "atoms"):
+        if isinstance(theme.get(field), list):
+            brief[f"{field}_count"] = len(theme[field])
+    return brief
+
+
+def _rank_atoms(atoms: Sequence[Any], message: str) -> List[Any]:
+    """Atoms sharing the most words with the message first, so the evidence search sees likely matches."""
+    words = set(WORD_RE.findall(message.lower()))
+
+    def overlap(atom: Any) -> int:
+        text = atom.get("text", "") if isinstance(atom, dict) else str(atom)
+        return len(words & set(WORD_RE.findall(text.lower())))
+
+    return sorted(atoms, key=overlap, reverse=True)
+
+
+def trim_context(context: Dict[str, Any], intent: str, message: str, max_tokens: int) -> Dict[str, Any]:
+    """The part of the project context the intent needs, within max_tokens."""
+    keys = BASE_CONTEXT_KEYS + INTENT_CONTEXT_KEYS.get(intent, INTENT_CONTEXT_KEYS["general_question"])
+    trimmed: Dict[str, Any] = {}
+    remaining = max_tokens
+    present = [key for key in keys if key in context]
+    scalars = [key for key in present if not isinstance(context[key], list)]
+    lists = [key for key in present if isinstance(context[key], list)]
+    # Small scalar fields first; the lists then split what is left evenly.
+    for key in scalars:
+        cost = estimate_tokens(json.dumps(context[key], ensure_ascii=False, default=str))
+        if cost <= remaining:
+            trimmed[key] = context[key]
+            remaining -= cost
+    for i, key in enumerate(lists):
+        items = _rank_atoms(context[key], message) if key == "atoms" else context[key]
+        kept = _fit_list(items, remaining // (len(lists) - i), _brief_theme if key == "themes" else None)
+        trimmed[key] = kept
+        if len(kept) < len(items):
+            trimmed[f"{key}_omitted"] = len(items) - len(kept)
+        remaining -= estimate_tokens(json.dumps(kept, ensure_ascii=False, default=str)) + 5
+    return trimmed
+
+
+def _signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RollingSummary:
+    """
+    Summary of the messages before the recent window, advanced in steps and stored on disk.
+
+    `covered` counts the history messages folded into `text` and `offset` is where the
+    next one starts in the chat log, so messages waiting to be summarized are read back
+    from the log instead of being kept in memory. Workers share summary.json: it is
+    re-read whenever it changed, and an update computed from a stale copy is dropped.
+    """
+
+    def __init__(self, project_slug: str):
+        self.path = get_chat_summary_path(project_slug)
+        self.text = ""
+        self.covered = 0  # number of history messages folded into `text`
+        self.offset = 0  # byte offset in the chat log of the first message not covered
+        self._signature: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._reload()
+
+    def _reload(self) -> None:
+        signature = _signature(self.path)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self.text, self.covered, self.offset = "", 0, 0
+        if signature is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Without an offset the covered messages can't be found in the log; start over.
+            if "offset" in data:
+                self.text, self.covered, self.offset = data.get("summary", ""), int(data["covered"]), int(data["offset"])
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+            logger.warning("Ignoring unreadable chat summary %s: %s", self.path, e)
+
+    def update(self, older_count: int, read_older: Callable[[int], Iterable[Tuple[str, int]]],
+               generate: Callable[[str], str], step_messages: int = CHAT_SUMMARY_STEP * 2) -> None:
+        """
+        Fold the oldest messages not yet covered into the summary, once at least
+        `step_messages` of the first `older_count` history messages are waiting.
+        `read_older(offset)` yields (prompt line, offset after it) for the logged
+        messages from `offset` on. As many as fit in SUMMARY_INPUT_MAX_TOKENS are folded
+        per call; the rest wait for the next one. On failure the summary stays as it was.
+        """
+        with self._lock, file_lock(self.path):
+            self._reload()
+            loaded = (self.text, self.covered, self.offset)
+        text, covered, offset = loaded
+        if covered > older_count:
+            text, covered, offset = "", 0, 0  # history was cleared or replaced
+        pending = older_count - covered
+        if pending < step_messages:
+            return
+        batch, used, end_offset = [], 0, offset
+        for line, next_offset in read_older(offset):
+            cost = estimate_tokens(line) + 1
+            if len(batch) >= pending or (batch and used + cost > SUMMARY_INPUT_MAX_TOKENS):
+                break
+            batch.append(_truncate(line, SUMMARY_INPUT_MAX_TOKENS))
+            used += cost
+            end_offset = next_offset
+        if not batch:
+            return
+        prompt = (CHAT_SUMMARY_PROMPT
+                  .replace("{summary}", text or "(none yet)")
+                  .replace("{messages}", "\n".join(batch)))
+        try:
+            new_text = generate(prompt).strip()
+        except Exception as e:
+            logger.error("Chat summary update failed: %s", e)
+            return
+        if not new_text:
+            return
+        with self._lock, file_lock(self.path):
+            self._reload()
+            if (self.text, self.covered, self.offset) != loaded:
+                return  # another worker advanced the summary meanwhile
+            self.text = _truncate(new_text, SUMMARY_MAX_TOKENS)
+            self.covered, self.offset = covered + len(batch), end_offset
+            try:
+                atomic_write_json(self.path, {"summary": self.text, "covered": self.covered, "offset": self.offset})
+                self._signature = _signature(self.path)
+            except OSError as e:
+                logger.warning("Could not save chat summary %s: %s", self.path, e)
+
+    def pending(self, older_lines: List[str], first_index: int = 0) -> List[str]:
+        """
+        Older lines not in the summary yet; they go in verbatim if the budget allows.
+        `older_lines` are the history messages from index `first_index` on.
+        """
+        return older_lines[max(self.covered - first_index, 0):]
+
+
+def split_window(history_lines: List[str], recent_turns: int = CHAT_RECENT_TURNS):
+    """(older, recent): the lines before the verbatim window and the window itself."""
+    window = max(recent_turns * 2, 1)
+    return history_lines[:-window], history_lines[-window:]
+
+
+def build_chat_prompt(intent: str, message: str, context: Dict[str, Any], history_lines: List[str],
+                      summary: RollingSummary, budget: int = CHAT_PROMPT_TOKEN_BUDGET,
+                      recent_turns: int = CHAT_RECENT_TURNS, first_index: int = 0) -> str:
+    """
+    Assemble the chat prompt within `budget` tokens. `history_lines` ends with the
+    current user message and starts at history message `first_index`; summary must
+    already be updated for the older lines.
+    """
+    older, recent = split_window(history_lines, recent_turns)
+
+    header = (
+        "You are a helpful assistant for UX research synthesis. "
+        f"The user's intent is '{intent}'. "
+        "Use the conversation history and provided context to craft your reply.\n\n"
+    )
+    current = _truncate(recent[-1], budget // 4)
+    remaining = budget - estimate_tokens(header) - estimate_tokens(current) - estimate_tokens("\nassistant:")
+
+    summary_block = ""
+    if summary.text:
+        summary_block = f"Summary of the earlier conversation:\n{summary.text}\n\n"
+        remaining -= estimate_tokens(summary_block)
+
+    context_block = ""
+    if context:
+        trimmed = trim_context(context, intent, message, max(int(remaining * CONTEXT_SHARE), 0))
+        context_block = f"Context: {json.dumps(trimmed, ensure_ascii=False, default=str)}\n\n"
+        remaining -= estimate_tokens(context_block)
+
+    # Newest turns first until the budget runs out; unsummarized older lines come after the window.
+    candidates = recent[:-1][::-1] + summary.pending(older, first_index)[::-1]
+    kept: List[str] = []
+    for line in candidates:
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        kept.append(line)
+        remaining -= cost
+    conversation = "\n".join(kept[::-1] + [current])
+    return f"{header}{context_block}{summary_block}{conversation}\nassistant:"
@@ -0,0 +1,199 @@
+"""
+Comment store for one transcript: a snapshot plus an append-only event log.
+
+The snapshot is the existing <project>/comments/<file>.json. Every add or delete is
+appended as one line to <file>.log.jsonl, and applied to an in-memory index
+by comment id and by exchange id. So an edit costs one append, and delete and
+per-exchange reads are dict lookups. Once the log holds COMMENT_COMPACT_EVERY events
+it is folded into the snapshot and removed.
+
+Several workers may serve the same file. Each catches up on the log lines written
+since it last looked, and reloads fully when the snapshot has been compacted.
+Writes hold the file lock.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from paths import get_comments_path, get_comment_log_path
+from persistence import atomic_write_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+COMMENT_COMPACT_EVERY = int(os.getenv("COMMENT_COMPACT_EVERY", "500"))
+COMMENT_STORE_CACHE_SIZE = 64
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CommentStore:
+    """Comments on one transcript, indexed by comment id and exchange id."""
+
+    def __init__(self, project_slug: str, filename: str):
+        self.filename = filename
+        self.snapshot_path = get_comments_path(project_slug, filename)
+        self.log_path = get_comment_log_path(project_slug, filename)
+        self._lock = threading.RLock()
+        self._reload()
+
+    def _reload(self) -> None:
+        """Rebuild the index from the snapshot and the whole log."""
+        self.by_exchange: Dict[str, Dict[int, dict]] = {}
+        self.by_id: Dict[int, str] = {}
+        self.metadata = {"filename": self.filename, "created": datetime.now().isoformat()}
+        self.snapshot_signature = _signature(self.snapshot_path)
+        self.log_inode = None
+        self.log_offset = 0
+        self.log_events = 0
+        if self.snapshot_signature is not None:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.metadata = data.get("metadata", self.metadata)
+            for exchange_id, comments in data.get("comments", {}).items():
+                for comment in comments:
+                    self._apply_add(exchange_id, comment)
+        self._catch_up()
+
+    def _catch_up(self) -> None:
+        """Apply log lines appended since the last look, by this process or another one."""
+        if _signature(self.snapshot_path) != self.snapshot_signature:
+            self._reload()  # compacted (or deleted) elsewhere
+            return
+        try:
+            stat = os.stat(self.log_path)
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+        if self.log_offset and (inode != self.log_inode or size < self.log_offset):
+            self._reload()  # the log was removed or replaced since we read it
+            return
+        self.log_inode = inode
+        if size == self.log_offset:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self.log_offset)
+            chunk = f.read(size - self.log_offset)
+        # A line still being written has no newline yet; leave it for the next look.
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning("Skipping bad line in %s: %s", self.log_path, e)
+        self.log_offset += len(complete)
+
+    def _apply(self, event: dict) -> None:
+        if event["op"] == "add":
+            self._apply_add(event["exchange_id"], event["comment"])
+        elif event["op"] == "delete":
+            self._apply_delete(event["id"])
+        self.metadata["updated"] = event.get("at", self.metadata.get("updated"))
+        self.log_events += 1
+
+    def _apply_add(self, exchange_id: str, comment: dict) -> None:
+        comment_id = comment["id"]
+        if comment_id in self.by_id:
+            return  # replaying a log over its own snapshot; the stored comment is the newer one
+        self.by_exchange.setdefault(str(exchange_id), {})[comment_id] = comment
+        self.by_id[comment_id] = str(exchange_id)
+
+    def _apply_delete(self, comment_id: int) -> bool:
+        exchange_id = self.by_id.pop(comment_id, None)
+        if exchange_id is None:
+            return False
+        comments = self.by_exchange[exchange_id]
+        del comments[comment_id]
+        if not comments:
+            del self.by_exchange[exchange_id]
+        return True
+
+    def _append(self, event: dict) -> None:
+        event["at"] = datetime.now().isoformat()
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(event)
+        stat = os.stat(self.log_path)
+        self.log_inode, self.log_offset = stat.st_ino, stat.st_size
+        if self.log_events >= COMMENT_COMPACT_EVERY:
+            self._compact()
+
+    def add(self, exchange_id: str, comment: dict) -> bool:
+        """Add a comment. False if a comment with its id already exists."""
+        with self._lock, file_lock(self.snapshot_path):
+            self._catch_up()
+            if comment["id"] in self.by_id:
+                return False
+            self._append({"op": "add", "exchange_id": str(exchange_id), "comment": comment})
+            return True
+
+    def delete(self, comment_id: int) -> bool:
+        """Delete a comment by id. False if there is no such comment."""
+        with self._lock, file_lock(self.snapshot_path):
+            self._catch_up()
+            if comment_id not in self.by_id:
+                return False
+            self._append({"op": "delete", "id": comment_id})
+            return True
+
+    def compact(self) -> None:
+        """Fold the log into the snapshot and drop it."""
+        with self._lock, file_lock(self.snapshot_path):
+            self._catch_up()
+            self._compact()
+
+    def _compact(self) -> None:
+        # Snapshot first: if we die before the log is removed, replaying it again is harmless.
+        atomic_write_json(self.snapshot_path, self.snapshot(), indent=2)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.snapshot_signature = _signature(self.snapshot_path)
+        self.log_inode = None
+        self.log_offset = 0
+        self.log_events = 0
+
+    def exchange(self, exchange_id: str) -> List[dict]:
+        with self._lock:
+            self._catch_up()
+            return list(self.by_exchange.get(str(exchange_id), {}).values())
+
+    def snapshot(self) -> dict:
+        """All comments in the stored format: {"comments": {exchange_id: [...]}, "metadata": {...}}."""
+        with self._lock:
+            self._catch_up()
+            return {
+                "comments": {exchange_id: list(comments.values()) for exchange_id, comments in self.by_exchange.items()},
+                "metadata": dict(self.metadata),
+            }
+
+
+_stores: "OrderedDict[str, CommentStore]" = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def get_comment_store(project_slug: str, filename: str) -> CommentStore:
+    """The cached store for a transcript, created on first use."""
+    path = get_comments_path(project_slug, filename)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is not None:
+            _stores.move_to_end(path)
+            return store
+    store = CommentStore(project_slug, filename)
+    with _stores_lock:
+        store = _stores.setdefault(path, store)
+        while len(_stores) > COMMENT_STORE_CACHE_SIZE:
+            _stores.popitem(last=False)
+    return store
@@ -0,0 +1,224 @@
+"""
+Content-addressed storage for uploads and the artifacts derived from them.
+
+Uploads are stored once per SHA-256 of their bytes. Each project keeps a small
+filename -> hash map, and every stage artifact (cleaned, atoms, annotated, graph)
+is also published under the upload's hash, so the same transcript uploaded under
+another name or into another project reuses the finished work instead of calling
+the LLM again.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from paths import (
+    CONTENT_STORE_DIR,
+    get_blob_path,
+    get_content_artifact_path,
+    get_upload_hashes_path,
+    get_upload_path,
+)
+import lineage
+import project_index
+from artifact_codec import is_binary, read_artifact
+from project_graph import merge_file_into_project, remove_file_from_project
+from persistence import atomic_write_json, precompress, read_json, remove_precompressed, update_json
+from lineage import STAGE_PATHS  # stages whose artifacts derive from the upload and can be shared
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def store_upload(fileobj: BinaryIO) -> str:
+    """Stream an upload into the blob store, hashing it on the way, and return its SHA-256."""
+    digest = hashlib.sha256()
+    staging_dir = os.path.join(CONTENT_STORE_DIR, "blobs")
+    os.makedirs(staging_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+        content_hash = digest.hexdigest()
+        blob_path = get_blob_path(content_hash)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, blob_path)
+        return content_hash
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 of a file on disk."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_hashes(project_slug: str) -> Dict[str, str]:
+    return read_json(get_upload_hashes_path(project_slug), {})
+
+
+def _set_hash(project_slug: str, filename: str, content_hash: Optional[str]) -> None:
+    """Record (or with None, drop) one upload's hash without losing concurrent updates to others."""
+    def apply(hashes: Dict[str, str]) -> None:
+        if content_hash is None:
+            hashes.pop(filename, None)
+        else:
+            hashes[filename] = content_hash
+
+    update_json(get_upload_hashes_path(project_slug), apply, indent=2)
+
+
+def get_upload_hash(project_slug: str, filename: str) -> Optional[str]:
+    """Return the content hash of a project upload, hashing (and recording) older uploads lazily."""
+    hashes = _load_hashes(project_slug)
+    if filename in hashes:
+        return hashes[filename]
+    upload_path = get_upload_path(project_slug, filename)
+    if not os.path.exists(upload_path):
+        return None
+    content_hash = hash_file(upload_path)
+    _set_hash(project_slug, filename, content_hash)
+    return content_hash
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Place src at dst, hard-linking when the filesystem allows it."""
+    tmp_dst = f"{dst}.part"
+    if os.path.exists(tmp_dst):
+        os.remove(tmp_dst)
+    try:
+        os.link(src, tmp_dst)
+    except OSError:
+        shutil.copyfile(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+
+def _update_project_graph(change, project_slug: str, filename: str, *args) -> None:
+    # The project graph is derived data (and can be rebuilt); it must not fail an upload.
+    try:
+        change(project_slug, filename, *args)
+    except Exception as e:
+        logger.error("Project graph update failed for %s: %s", filename, e)
+
+
+def add_upload(project_slug: str, filename: str, content_hash: str) -> Tuple[bool, List[str]]:
+    """
+    Attach a stored blob to a project under `filename`.
+    Returns (changed, reused_stages): whether the name previously held different
+    content, and which stage artifacts were restored from the content store.
+    """
+    hashes = _load_hashes(project_slug)
+    previous = hashes.get(filename)
+    changed = previous is not None and previous != content_hash
+    if changed:
+        # Artifacts cached under this filename belong to the old content.
+        for get_path in STAGE_PATHS.values():
+            stale = get_path(project_slug, filename)
+            if os.path.exists(stale):
+                os.remove(stale)
+            remove_precompressed(stale)
+        lineage.forget(project_slug, filename)
+        _update_project_graph(remove_file_from_project, project_slug, filename)
+
+    _link_or_copy(get_blob_path(content_hash), get_upload_path(project_slug, filename))
+    _set_hash(project_slug, filename, content_hash)
+
+    reused = [stage for stage in STAGE_PATHS if restore_artifact(project_slug, filename, stage)]
+    project_index.refresh_file(project_slug, filename)
+    if "annotated" in reused:
+        atoms = read_artifact(STAGE_PATHS["annotated"](project_slug, filename))
+        _update_project_graph(merge_file_into_project, project_slug, filename, atoms)
+    return changed, reused
+
+
+def publish_artifact(project_slug: str, filename: str, stage: str) -> None:
+    """Copy a freshly written project artifact into the content store under its upload's hash."""
+    content_hash = get_upload_hash(project_slug, filename)
+    project_path = STAGE_PATHS[stage](project_slug, filename)
+    if not content_hash or not os.path.exists(project_path):
+        return
+    if lineage.is_incomplete(project_slug, filename, stage):
+        # Fallback output must not be handed to every later upload of the same content.
+        return
+    try:
+        shared_path = get_content_artifact_path(content_hash, stage)
+        shutil.copyfile(project_path, f"{shared_path}.part")
+        os.replace(f"{shared_path}.part", shared_path)
+        # The lineage entry travels with the artifact so a restore can check its fingerprint.
+        entry = lineage.get_entry(project_slug, filename, stage)
+        if entry:
+            atomic_write_json(f"{shared_path}.lineage.json", entry)
+    except OSError as e:
+        logger.warning("Could not publish %s for %s: %s", stage, filename, e)
+
+
+def _shared_lineage(shared_path: str) -> Optional[dict]:
+    sidecar = f"{shared_path}.lineage.json"
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def restore_artifact(project_slug: str, filename: str, stage: str, expected_fingerprint: Optional[str] = None) -> bool:
+    """
+    Copy a shared artifact into the project if the project lacks it. With
+    `expected_fingerprint`, only an artifact built from the same inputs is restored.
+    Returns True if copied.
+    """
+    project_path = STAGE_PATHS[stage](project_slug, filename)
+    if os.path.exists(project_path):
+        return False
+    content_hash = get_upload_hash(project_slug, filename)
+    if not content_hash:
+        return False
+    shared_path = get_content_artifact_path(content_hash, stage)
+    if not os.path.exists(shared_path):
+        return False
+    entry = _shared_lineage(shared_path)
+    if expected_fingerprint and (entry is None or entry.get("fingerprint") != expected_fingerprint):
+        return False
+    shutil.copyfile(shared_path, project_path)
+    if entry:
+        lineage.adopt(project_slug, filename, stage, entry)
+    project_index.refresh_file(project_slug, filename)
+    if stage != "graph" and not is_binary(project_path):
+        precompress(project_path)
+    logger.info("Reused %s for %s from content %s", stage, filename, content_hash[:12])
+    return True
+
+
+def remove_upload(project_slug: str, filename: str) -> List[str]:
+    """Delete a project upload and the stage artifacts under its name. Returns the removed stages."""
+    removed = []
+    upload_path = get_upload_path(project_slug, filename)
+    if os.path.exists(upload_path):
+        os.remove(upload_path)
+        removed.append("uploads")
+    for stage, get_path in STAGE_PATHS.items():
+        path = get_path(project_slug, filename)
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(stage)
+        remove_precompressed(path)
+    lineage.forget(project_slug, filename)
+    project_index.remove_file(project_slug, filename)
+    if filename in _load_hashes(project_slug):
+        _set_hash(project_slug, filename, None)
+    # The shared blob and artifacts stay: other projects or names may point at them.
+    return removed
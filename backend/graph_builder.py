@@ -0,0 +1,204 @@
+"""
+Edge construction shared by the per-file graph and the project graph.
+
+Atoms are linked when they carry the same (type, label) insight. Candidate pairs
+come from an inverted index over those pairs rather than an all-pairs scan.
+build_edges gives every such pair weight 1; build_weighted_edges scores pairs from
+their insight weights and can bound each node's degree.
+"""
+
+import os
+import bisect
+from typing import Dict, List, Optional, Tuple
+
+# Shared insights below this confidence (on either atom) do not link atoms.
+MIN_EDGE_WEIGHT = 0.7
+# Default per-node edge cap for weighted graphs; 0 keeps every qualifying edge.
+GRAPH_MAX_DEGREE = int(os.getenv("GRAPH_MAX_DEGREE", "20"))
+
+
+def find_shared_insights(node1: dict, node2: dict) -> List[tuple]:
+    """Return intersection of (type, label) insight pairs between two nodes."""
+    set1 = {(i["type"], i["label"]) for i in node1.get("insights", [])}
+    set2 = {(i["type"], i["label"]) for i in node2.get("insights", [])}
+    return list(set1 & set2)
+
+
+def insight_keys(node: dict) -> set:
+    """Return the set of (type, label) insight pairs on a node."""
+    return {(i["type"], i["label"]) for i in node.get("insights", [])}
+
+
+def build_insight_index(keys: List[set]) -> Dict[tuple, List[int]]:
+    """Map each (type, label) pair to the positions of the nodes carrying it, in node order."""
+    postings: Dict[tuple, List[int]] = {}
+    for position, node_keys in enumerate(keys):
+        for key in node_keys:
+            postings.setdefault(key, []).append(position)
+    return postings
+
+
+def _posting_pairs(members: List[int], limit: Optional[int]):
+    """Yield (i, j) position pairs from one posting list, stopping after `limit` pairs."""
+    emitted = 0
+    for a in range(len(members)):
+        for b in range(a + 1, len(members)):
+            if limit is not None and emitted >= limit:
+                return
+            yield members[a], members[b]
+            emitted += 1
+
+
+def make_edge(source_id: str, target_id: str, source_keys: set, target_keys: set) -> dict:
+    """Edge between two nodes whose insight sets overlap, labelled with a shared insight type."""
+    label, _ = list(source_keys & target_keys)[0]
+    return {
+        "source": source_id,
+        "target": target_id,
+        "label": label,
+        "weight": 1,
+    }
+
+
+def build_edges(nodes: List[dict], max_edges_per_label: Optional[int] = None) -> List[dict]:
+    """
+    Link every pair of nodes that share an insight, using an inverted index so only
+    pairs inside a posting list are ever compared. Output matches the old all-pairs
+    scan. `max_edges_per_label` caps the pairs a single label may contribute.
+    """
+    keys = [insight_keys(node) for node in nodes]
+    pairs = set()
+    for members in build_insight_index(keys).values():
+        pairs.update(_posting_pairs(members, max_edges_per_label))
+
+    return [make_edge(nodes[i]["id"], nodes[j]["id"], keys[i], keys[j]) for i, j in sorted(pairs)]
+
+
+def insight_weight(insight: dict, default: float = 1.0) -> float:
+    """An insight's weight, or `default` when the LLM left it out or gave something that is not a number."""
+    try:
+        return float(insight.get("weight", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def insight_weights(node: dict) -> Dict[tuple, float]:
+    """Return (type, label) -> highest insight weight on a node."""
+    weights: Dict[tuple, float] = {}
+    for i in node.get("insights", []):
+        key = (i["type"], i["label"])
+        weights[key] = max(weights.get(key, 0.0), insight_weight(i))
+    return weights
+
+
+def score_pair(source_weights: Dict[tuple, float], target_weights: Dict[tuple, float],
+               min_weight: float = MIN_EDGE_WEIGHT) -> Tuple[float, Optional[str]]:
+    """
+    Score two nodes from the insights they share. Each shared insight counts with the
+    smaller of its two weights, if that reaches `min_weight`. The scores combine by
+    noisy-or, so more shared insights give a stronger edge. Returns (score, type of
+    the strongest shared insight), or (0.0, None) when nothing qualifies.
+    """
+    best, label, miss = -1.0, None, 1.0
+    for key in sorted(source_weights.keys() & target_weights.keys()):
+        strength = min(source_weights[key], target_weights[key])
+        if strength < min_weight:
+            continue
+        miss *= 1.0 - strength
+        if strength > best:
+            best, label = strength, key[0]
+    return (1.0 - miss, label) if label is not None else (0.0, None)
+
+
+def _top_partners(members: List[int], strength: Dict[int, float], k: int):
+    """
+    Yield (i, j) pairs giving each member its k strongest partners on one insight, where
+    a pair's strength is the smaller of the two weights. Among equally strong partners
+    the nearest in document order win. Costs O(len(members) * k) rather than all pairs.
+    """
+    # Partners at least as strong as i all give the best possible strength, strength[i].
+    by_strength = sorted(members, key=lambda m: -strength[m])
+    positions: List[int] = []  # members seen so far, in document order
+    start = 0
+    while start < len(by_strength):
+        level = strength[by_strength[start]]
+        end = start
+        while end < len(by_strength) and strength[by_strength[end]] == level:
+            bisect.insort(positions, by_strength[end])
+            end += 1
+        for i in by_strength[start:end]:
+            if len(positions) - 1 >= k:
+                at = bisect.bisect_left(positions, i)
+                lo, hi, taken = at - 1, at + 1, 0
+                while taken < k:
+                    if hi >= len(positions) or (lo >= 0 and i - positions[lo] <= positions[hi] - i):
+                        j, lo = positions[lo], lo - 1
+                    else:
+                        j, hi = positions[hi], hi + 1
+                    yield min(i, j), max(i, j)
+                    taken += 1
+            else:
+                # Too few partners this strong: take them all, then the strongest of the rest.
+                for j in positions:
+                    if j != i:
+                        yield min(i, j), max(i, j)
+                for j in by_strength[end:end + k - (len(positions) - 1)]:
+                    yield min(i, j), max(i, j)
+        start = end
+
+
+def _label_pairs(members: List[int], key: tuple, weights: List[Dict[tuple, float]], min_weight: float,
+                 per_node: Optional[int], limit: Optional[int]) -> Dict[Tuple[int, int], Tuple[float, str]]:
+    """
+    Score the candidate pairs of one posting list: all of them, or with `per_node` each
+    member's per_node strongest on this insight. With `limit`, only the `limit` highest
+    scoring pairs are kept. Returns (i, j) -> (score, label).
+    """
+    if per_node is None:
+        pairs = _posting_pairs(members, None)
+    else:
+        pairs = set(_top_partners(members, {m: weights[m][key] for m in members}, per_node))
+    scored = []
+    for i, j in pairs:
+        score, label = score_pair(weights[i], weights[j], min_weight)
+        if label is not None:
+            scored.append((score, i, j, label))
+    if limit is not None:
+        scored = sorted(scored, key=lambda item: (-item[0], item[1], item[2]))[:limit]
+    return {(i, j): (score, label) for score, i, j, label in scored}
+
+
+def build_weighted_edges(nodes: List[dict], min_weight: float = MIN_EDGE_WEIGHT,
+                         max_degree: Optional[int] = GRAPH_MAX_DEGREE,
+                         max_edges_per_label: Optional[int] = None) -> List[dict]:
+    """
+    Link nodes sharing insights, weighted by score_pair. In posting lists longer than
+    max_degree + 1, each atom is only paired with its max_degree strongest partners on
+    that insight, nearest first among equals; pairs sharing several insights are also
+    found through the others. `max_edges_per_label` keeps a label's highest scoring pairs.
+    Edges are then accepted strongest first while both ends have fewer than max_degree
+    edges, so the graph grows linearly with the number of atoms.
+    """
+    weights = [insight_weights(node) for node in nodes]
+    qualifying = [{key for key, w in node_weights.items() if w >= min_weight} for node_weights in weights]
+    candidates: Dict[Tuple[int, int], Tuple[float, str]] = {}
+    for key, members in build_insight_index(qualifying).items():
+        per_node = max_degree if max_degree and len(members) > max_degree + 1 else None
+        candidates.update(_label_pairs(members, key, weights, min_weight, per_node, max_edges_per_label))
+
+    scored = [(score, i, j, label) for (i, j), (score, label) in candidates.items()]
+
+    if max_degree:
+        degree = [0] * len(nodes)
+        kept = []
+        for score, i, j, label in sorted(scored, key=lambda item: (-item[0], item[1], item[2])):
+            if degree[i] < max_degree and degree[j] < max_degree:
+                degree[i] += 1
+                degree[j] += 1
+                kept.append((score, i, j, label))
+        scored = kept
+
+    return [
+        {"source": nodes[i]["id"], "target": nodes[j]["id"], "label": label, "weight": round(score, 3)}
+        for score, i, j, label in sorted(scored, key=lambda item: (item[1], item[2]))
+    ]
@@ -0,0 +1,160 @@
+"""
+Compact on-disk format for per-file graph artifacts.
+
+The API shape ({"nodes": [atom, ...], "edges": [{"source", "target", "label", "weight"}]})
+copies every annotated atom into the graph and repeats full id strings in every edge.
+On disk the graph is stored instead as:
+
+    format       "csr-v1"
+    node_ids     interned node id table; edges refer to positions in it
+    payloads     "annotated" when node payloads live in the file's annotated
+                 artifact, plus `inline` payloads for nodes that differ from it
+    indptr       CSR row offsets (len = len(node_ids) + 1)
+    indices      target node index of each edge, grouped by source row
+    weights      edge weights, parallel to indices
+    label_ids    index into `labels`, parallel to indices
+    labels       interned edge label table
+    extras       [[edge position, {extra fields such as similarity}], ...]
+    meta         every other top-level key (clusters, facets, themes, *_desc)
+
+Referenced payloads are read from the annotated artifact when the graph is loaded, so
+nodes show the file's current annotations.
+
+expand_graph() turns it back into the API shape. Edges come back grouped by source
+node in node order. Files in the old shape are returned unchanged.
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional
+
+from paths import get_annotated_path
+from artifact_codec import read_artifact, write_artifact
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FORMAT = "csr-v1"
+EDGE_FIELDS = ("source", "target", "label", "weight")
+
+
+def is_compact(data: dict) -> bool:
+    return isinstance(data, dict) and data.get("format") == GRAPH_FORMAT
+
+
+def _load_annotated(project_slug: str, filename: str) -> Dict[str, dict]:
+    path = get_annotated_path(project_slug, filename)
+    if not os.path.exists(path):
+        return {}
+    atoms = read_artifact(path)
+    return {str(atom.get("id")): atom for atom in atoms if isinstance(atom, dict)}
+
+
+def compact_graph(graph: dict, annotated: Optional[Dict[str, dict]] = None) -> dict:
+    """
+    Convert an API-shaped graph to the compact format. Nodes identical to the atom
+    with the same id in `annotated` are stored by reference only.
+    """
+    nodes = graph.get("nodes", [])
+    node_ids = [str(node.get("id")) for node in nodes]
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    annotated = annotated or {}
+    inline = {str(i): node for i, node in enumerate(nodes) if annotated.get(node_ids[i]) != node}
+
+    labels: List[str] = []
+    label_index: Dict[str, int] = {}
+    rows: List[List[int]] = [[] for _ in nodes]
+    edges = graph.get("edges", [])
+    for position, edge in enumerate(edges):
+        source, target = index.get(str(edge["source"])), index.get(str(edge["target"]))
+        if source is None or target is None:
+            logger.warning("Dropping edge to unknown node: %s -> %s", edge["source"], edge["target"])
+            continue
+        rows[source].append(position)
+
+    indptr, indices, weights, label_ids, extras = [0], [], [], [], []
+    for row in rows:
+        for position in row:
+            edge = edges[position]
+            label = str(edge.get("label", ""))
+            if label not in label_index:
+                label_index[label] = len(labels)
+                labels.append(label)
+            extra = {key: value for key, value in edge.items() if key not in EDGE_FIELDS}
+            if extra:
+                extras.append([len(indices), extra])
+            indices.append(index[str(edge["target"])])
+            weights.append(edge.get("weight", 1))
+            label_ids.append(label_index[label])
+        indptr.append(len(indices))
+
+    return {
+        "format": GRAPH_FORMAT,
+        "node_ids": node_ids,
+        "payloads": {"source": "annotated" if len(inline) < len(nodes) else None, "inline": inline},
+        "indptr": indptr,
+        "indices": indices,
+        "weights": weights,
+        "label_ids": label_ids,
+        "labels": labels,
+        "extras": extras,
+        "meta": {key: value for key, value in graph.items() if key not in ("nodes", "edges")},
+    }
+
+
+def expand_graph(data: dict, project_slug: Optional[str] = None, filename: Optional[str] = None,
+                 annotated: Optional[Dict[str, dict]] = None) -> dict:
+    """Convert a compact graph back to the API shape. Old-shape graphs pass through."""
+    if not is_compact(data):
+        return data
+    node_ids = data["node_ids"]
+    inline = data["payloads"].get("inline", {})
+    if data["payloads"].get("source") == "annotated" and annotated is None and project_slug and filename:
+        annotated = _load_annotated(project_slug, filename)
+    annotated = annotated or {}
+
+    nodes = []
+    for i, node_id in enumerate(node_ids):
+        node = inline.get(str(i)) or annotated.get(node_id)
+        if node is None:
+            logger.warning("Graph node %s has no payload; returning its id only", node_id)
+            node = {"id": node_id}
+        nodes.append(node)
+
+    extras = {position: extra for position, extra in data.get("extras", [])}
+    indptr, indices, weights, label_ids, labels = (
+        data["indptr"], data["indices"], data["weights"], data["label_ids"], data["labels"],
+    )
+    edges = []
+    for row in range(len(node_ids)):
+        source = nodes[row].get("id", node_ids[row])
+        for position in range(indptr[row], indptr[row + 1]):
+            edge = {
+                "source": source,
+                "target": nodes[indices[position]].get("id", node_ids[indices[position]]),
+                "label": labels[label_ids[position]],
+                "weight": weights[position],
+            }
+            edge.update(extras.get(position, {}))
+            edges.append(edge)
+
+    return {"nodes": nodes, "edges": edges, **data.get("meta", {})}
+
+
+def write_graph(path: str, graph: dict, project_slug: str, filename: str) -> None:
+    """Write an API-shaped graph to `path` in the compact format."""
+    compact = compact_graph(graph, _load_annotated(project_slug, filename))
+    write_artifact(path, compact)
+
+
+def read_graph(path: str, project_slug: str, filename: str, atoms: Optional[List[dict]] = None) -> dict:
+    """
+    Read a graph artifact in either format and return it in the API shape. `atoms`
+    stand in for the annotated file when that file is missing.
+    """
+    data = read_artifact(path)
+    if not is_compact(data):
+        return data
+    annotated = _load_annotated(project_slug, filename)
+    if not annotated and atoms:
+        annotated = {str(atom.get("id")): atom for atom in atoms}
+    return expand_graph(data, annotated=annotated)
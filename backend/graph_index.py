@@ -0,0 +1,174 @@
+"""
+In-memory adjacency index over a stored graph, for the /graph/query endpoints.
+
+A graph file is parsed once into node and edge arrays, a per-node adjacency list,
+edges pre-sorted by weight, and lookups by edge label and insight label. Queries
+then only touch the nodes and edges they return. Indexes are kept in a small LRU
+keyed by the graph file's path and mtime, so a rebuilt graph is picked up on the
+next query.
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from graph_format import read_graph
+from paths import get_annotated_path, get_graph_path
+from project_graph import load_project_graph
+
+GRAPH_INDEX_CACHE_SIZE = int(os.getenv("GRAPH_INDEX_CACHE_SIZE", "8"))
+
+
+class GraphIndex:
+    """Adjacency index for one graph in the API shape."""
+
+    def __init__(self, graph: dict):
+        self.nodes: List[dict] = graph.get("nodes", [])
+        self.themes: List[dict] = graph.get("themes", []) or []
+        self.position: Dict[str, int] = {str(node.get("id")): i for i, node in enumerate(self.nodes)}
+        self.edges: List[dict] = []
+        self.adjacency: List[List[Tuple[int, int]]] = [[] for _ in self.nodes]
+        self.edges_by_label: Dict[str, List[int]] = {}
+        for edge in graph.get("edges", []):
+            source, target = self.position.get(str(edge["source"])), self.position.get(str(edge["target"]))
+            if source is None or target is None:
+                continue
+            edge_index = len(self.edges)
+            self.edges.append(edge)
+            self.adjacency[source].append((target, edge_index))
+            self.adjacency[target].append((source, edge_index))
+            self.edges_by_label.setdefault(str(edge.get("label", "")), []).append(edge_index)
+        self.by_weight = sorted(range(len(self.edges)), key=lambda e: (-float(self.edges[e].get("weight", 0)), e))
+        self.nodes_by_insight: Dict[str, List[int]] = {}
+        for i, node in enumerate(self.nodes):
+            for label in sorted({str(insight.get("label")) for insight in node.get("insights", [])}):
+                self.nodes_by_insight.setdefault(label, []).append(i)
+
+    def _result(self, node_positions: Iterable[int], edge_indices: Iterable[int], **extra) -> dict:
+        return {
+            "nodes": [self.nodes[i] for i in node_positions],
+            "edges": [self.edges[e] for e in edge_indices],
+            **extra,
+        }
+
+    def _induced(self, members: List[int], max_edges: Optional[int] = None) -> dict:
+        """Subgraph on `members` with every edge between them."""
+        inside = set(members)
+        edge_indices = sorted({e for i in members for j, e in self.adjacency[i] if j in inside})
+        truncated = max_edges is not None and len(edge_indices) > max_edges
+        if truncated:
+            edge_indices = sorted(edge_indices, key=lambda e: (-float(self.edges[e].get("weight", 0)), e))[:max_edges]
+        return self._result(members, edge_indices, truncated=truncated)
+
+    def neighbourhood(self, atom_id: str, hops: int = 1, max_nodes: int = 500) -> Optional[dict]:
+        """Nodes within `hops` edges of an atom (breadth first, capped at max_nodes) and the edges between them."""
+        start = self.position.get(str(atom_id))
+        if start is None:
+            return None
+        seen = {start: 0}
+        order = [start]
+        queue = deque([start])
+        truncated = False
+        while queue and not truncated:
+            current = queue.popleft()
+            if seen[current] >= hops:
+                continue
+            for neighbour, _ in self.adjacency[current]:
+                if neighbour in seen:
+                    continue
+                if len(order) >= max_nodes:
+                    truncated = True
+                    break
+                seen[neighbour] = seen[current] + 1
+                order.append(neighbour)
+                queue.append(neighbour)
+        result = self._induced(order)
+        result["truncated"] = truncated or result["truncated"]
+        result["hops"] = {str(self.nodes[i].get("id")): seen[i] for i in order}
+        return result
+
+    def top_edges(self, n: int, edge_label: Optional[str] = None) -> dict:
+        """The n heaviest edges (optionally of one label) and the nodes they touch."""
+        if edge_label is None:
+            chosen = self.by_weight[:n]
+        else:
+            label_edges = self.edges_by_label.get(edge_label, [])
+            chosen = sorted(label_edges, key=lambda e: (-float(self.edges[e].get("weight", 0)), e))[:n]
+        members: Dict[int, None] = {}
+        for e in chosen:
+            members[self.position[str(self.edges[e]["source"])]] = None
+            members[self.position[str(self.edges[e]["target"])]] = None
+        return self._result(members, chosen)
+
+    def label_subgraph(self, label: str, max_edges: Optional[int] = None) -> dict:
+        """Atoms carrying an insight with this label, and the edges among them."""
+        return self._induced(self.nodes_by_insight.get(label, []), max_edges)
+
+    def atoms_subgraph(self, atom_ids: Iterable[str], max_edges: Optional[int] = None) -> dict:
+        """Subgraph on a given set of atoms, e.g. the members of a theme."""
+        members = sorted({self.position[str(a)] for a in atom_ids if str(a) in self.position})
+        return self._induced(members, max_edges)
+
+    def theme_atom_ids(self, name: str) -> Optional[List[str]]:
+        """Atom ids of a theme stored with the graph, matched by name."""
+        for theme in self.themes:
+            if str(theme.get("name", "")).lower() == name.lower():
+                return [str(a) for a in theme.get("atom_ids", theme.get("atoms", []))]
+        return None
+
+    def page_nodes(self, offset: int, limit: int) -> dict:
+        return {"items": self.nodes[offset:offset + limit], "total": len(self.nodes), "offset": offset, "limit": limit}
+
+    def page_edges(self, offset: int, limit: int, edge_label: Optional[str] = None) -> dict:
+        indices = self.edges_by_label.get(edge_label, []) if edge_label is not None else range(len(self.edges))
+        return {
+            "items": [self.edges[e] for e in indices[offset:offset + limit]],
+            "total": len(indices),
+            "offset": offset,
+            "limit": limit,
+        }
+
+
+_cache: "OrderedDict[tuple, GraphIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _mtime(path: str) -> Optional[int]:
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def load_graph_index(project_slug: str, filename: Optional[str] = None) -> Optional[GraphIndex]:
+    """
+    Index for a file's stored graph, or for the project graph when no filename is
+    given. Returns None if the graph has not been built.
+    """
+    project_graph = None
+    if filename:
+        path = get_graph_path(project_slug, filename)
+        # Compact graphs read node payloads from the annotated file, so it is part of the key.
+        key = (path, _mtime(path), _mtime(get_annotated_path(project_slug, filename)))
+        if key[1] is None:
+            return None
+    else:
+        # The project graph is a snapshot plus a log of later merges; both are in its stamp.
+        project_graph = load_project_graph(project_slug)
+        path = project_graph.path
+        key = (path, project_graph.stamp)
+        if not any(project_graph.stamp):
+            return None
+
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+
+    index = GraphIndex(project_graph.to_dict() if project_graph else read_graph(path, project_slug, filename))
+    with _cache_lock:
+        for stale in [k for k in _cache if k[0] == path]:
+            del _cache[stale]
+        _cache[key] = index
+        while len(_cache) > GRAPH_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
@@ -3,6 +3,7 @@ Human Checkpoint System for slugg.e
 Interactive QA system for human-in-the-loop validation
 """
 
+import os
 import json
 import re
 from typing import Dict, List, Optional, Any
@@ -10,6 +11,8 @@ from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 
+from persistence import update_json
+
 class CheckpointType(Enum):
     THEME_QA = "theme_qa"
     ANNOTATION_REVIEW = "annotation_review"
@@ -240,27 +243,34 @@ class HumanCheckpointManager:
     
     def save_questions(self, questions: List[ClarifyingQuestion]):
         """Save questions to project QA directory"""
-        self.questions.extend(questions)
-        
-        # Save to JSON file
+        by_id = {q.question_id: q for q in self.questions}
+        for q in questions:
+            by_id[q.question_id] = q
+        self.questions = list(by_id.values())
+
+        # Save to JSON file, keeping questions another worker saved in the meantime
         qa_file = f"{self.checkpoint_dir}/questions.json"
-        os.makedirs(os.path.dirname(qa_file), exist_ok=True)
-        
-        with open(qa_file, 'w') as f:
-            json.dump([
-                {
-                    'question_id': q.question_id,
-                    'checkpoint_type': q.checkpoint_type.value,
-                    'context': q.context,
-                    'question': q.question,
-                    'options': q.options,
-                    'current_answer': q.current_answer,
-                    'confidence_score': q.confidence_score,
-                    'created_at': q.created_at.isoformat(),
-                    'answered_at': q.answered_at.isoformat() if q.answered_at else None
-                }
-                for q in self.questions
-            ], f, indent=2)
+        saved = [
+            {
+                'question_id': q.question_id,
+                'checkpoint_type': q.checkpoint_type.value,
+                'context': q.context,
+                'question': q.question,
+                'options': q.options,
+                'current_answer': q.current_answer,
+                'confidence_score': q.confidence_score,
+                'created_at': q.created_at.isoformat(),
+                'answered_at': q.answered_at.isoformat() if q.answered_at else None
+            }
+            for q in self.questions
+        ]
+        saved_ids = {q['question_id'] for q in saved}
+        update_json(
+            qa_file,
+            lambda existing: [q for q in existing if q.get('question_id') not in saved_ids] + saved,
+            default_factory=list,
+            indent=2,
+        )
     
     def load_existing_questions(self):
         """Load existing questions from project"""
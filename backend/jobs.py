@@ -0,0 +1,204 @@
+"""
+Background jobs for the LLM-heavy pipeline stages.
+
+A job runs one stage (normalize, atomise, annotate, graph) for a
+(project_slug, filename) pair on a worker pool, off the event loop. Job state is
+written to <project>/jobs/<job_id>.json on every transition, so queued and
+interrupted jobs are picked up again after a restart. Only unfinished jobs are kept
+in memory; finished ones are read back from their file.
+
+The process that queues a job holds a lease (an exclusive file lock) on it until the
+job finishes. The lock dies with the process, so on startup each worker resumes
+only the jobs whose lease it can take: those left behind by a stopped process, not
+those another live worker is running.
+"""
+
+import os
+import json
+import logging
+import threading
+from uuid import uuid4
+from datetime import datetime
+from dataclasses import dataclass, asdict, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Callable, Dict, List, Optional
+
+from paths import DATA_DIR, get_job_path, get_stage_path
+from persistence import acquire_lease, atomic_write_json, release_lease
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+# A stage runner takes (project_slug, filename, payload) and returns a JSON-serialisable result.
+StageRunner = Callable[[str, str, Dict[str, Any]], Any]
+
+
+@dataclass
+class Job:
+    """A single stage run for one file in a project."""
+    job_id: str
+    project_slug: str
+    stage: str
+    filename: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+    status: str = QUEUED
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Job state without the (possibly large) payload and result."""
+        data = asdict(self)
+        data.pop("payload")
+        data.pop("result")
+        return data
+
+
+class JobManager:
+    """Queues stage jobs, runs them on a thread pool and persists their state."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._runners: Dict[str, StageRunner] = {}
+        self._jobs: Dict[str, Job] = {}  # unfinished jobs owned by this process
+        self._leases: Dict[str, IO] = {}
+        self._lock = threading.Lock()
+
+    def register(self, stage: str, runner: StageRunner) -> None:
+        """Make a stage available for background execution."""
+        self._runners[stage] = runner
+
+    @property
+    def stages(self) -> List[str]:
+        return sorted(self._runners)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        return self._executor
+
+    def _save(self, job: Job) -> None:
+        atomic_write_json(get_job_path(job.project_slug, job.job_id), asdict(job))
+
+    def submit(self, project_slug: str, stage: str, filename: str, payload: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue a stage run, reusing an identical job that is still queued or running."""
+        if stage not in self._runners:
+            raise ValueError(f"Unknown stage '{stage}'. Expected one of: {', '.join(self.stages)}")
+        payload = payload or {}
+        with self._lock:
+            for job in self._jobs.values():
+                if (job.project_slug, job.stage, job.filename) == (project_slug, stage, filename) \
+                        and job.status not in TERMINAL_STATUSES and job.payload == payload:
+                    return job
+            job = Job(job_id=uuid4().hex, project_slug=project_slug, stage=stage, filename=filename, payload=payload)
+            self._leases[job.job_id] = acquire_lease(get_job_path(project_slug, job.job_id))
+            self._jobs[job.job_id] = job
+            self._save(job)
+        self._pool().submit(self._run, job)
+        logger.info("Queued %s job %s for %s/%s", stage, job.job_id, project_slug, filename)
+        return job
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            job.status = RUNNING
+            job.started_at = datetime.now().isoformat()
+            self._save(job)
+        try:
+            result = self._runners[job.stage](job.project_slug, job.filename, job.payload)
+            with self._lock:
+                job.result = result
+                job.status = SUCCEEDED
+        except Exception as e:
+            logger.error("Job %s (%s for %s) failed: %s", job.job_id, job.stage, job.filename, e)
+            with self._lock:
+                job.error = str(e)
+                job.status = FAILED
+        with self._lock:
+            job.finished_at = datetime.now().isoformat()
+            self._save(job)
+            # The state file is the record from here on.
+            self._jobs.pop(job.job_id, None)
+            release_lease(self._leases.pop(job.job_id, None))
+
+    def get(self, project_slug: str, job_id: str) -> Optional[Job]:
+        """Return a job from memory, or from its state file if another process ran it."""
+        job = self._jobs.get(job_id)
+        if job and job.project_slug == project_slug:
+            return job
+        return self._load(get_job_path(project_slug, job_id))
+
+    @staticmethod
+    def _load(path: str) -> Optional[Job]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return Job(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def list_jobs(self, project_slug: str) -> List[Job]:
+        """Return every job recorded for a project, newest first."""
+        jobs_dir = get_stage_path(project_slug, "jobs")
+        jobs = []
+        for name in os.listdir(jobs_dir):
+            if name.endswith(".json"):
+                job = self.get(project_slug, name[:-len(".json")])
+                if job:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def resume_pending(self) -> int:
+        """Re-queue jobs that were queued or running in a process that has since stopped."""
+        if not os.path.exists(DATA_DIR):
+            return 0
+        resumed = 0
+        for project_slug in os.listdir(DATA_DIR):
+            jobs_dir = os.path.join(DATA_DIR, project_slug, "jobs")
+            if project_slug.startswith("_") or not os.path.isdir(jobs_dir):
+                continue
+            for name in os.listdir(jobs_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(jobs_dir, name)
+                try:
+                    job = self._load(path)
+                except (json.JSONDecodeError, TypeError) as e:
+                    logger.error("Skipping unreadable job file %s: %s", name, e)
+                    continue
+                if job is None or job.status in TERMINAL_STATUSES or job.stage not in self._runners:
+                    continue
+                lease = acquire_lease(path)
+                if lease is None:
+                    continue  # a live worker owns it
+                # Re-read under the lease: the owner may have finished it just before letting go.
+                job = self._load(path)
+                if job is None or job.status in TERMINAL_STATUSES:
+                    release_lease(lease)
+                    continue
+                job.status = QUEUED
+                job.started_at = None
+                with self._lock:
+                    self._leases[job.job_id] = lease
+                    self._jobs[job.job_id] = job
+                    self._save(job)
+                self._pool().submit(self._run, job)
+                resumed += 1
+        if resumed:
+            logger.info("Resumed %d pending job(s)", resumed)
+        return resumed
+
+    def shutdown(self) -> None:
+        """Stop accepting work; queued jobs stay on disk and resume on the next start."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+job_manager = JobManager(max_workers=int(os.getenv("JOB_WORKERS", "2")))
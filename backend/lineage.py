@@ -0,0 +1,206 @@
+"""
+Per-file lineage manifest and stage fingerprints.
+
+Each stage artifact (cleaned, atoms, annotated, graph) is stamped in
+<project>/lineage/<file>.json with a fingerprint of its inputs: the upstream
+artifact or posted atoms hash, the prompt version, the model name and any build
+parameters. A stage is reused only while its fingerprint matches. When a stage is
+rewritten with a different output, the stages built from it are invalidated; the
+others are left alone.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from paths import (
+    get_lineage_path,
+    get_cleaned_path,
+    get_atoms_path,
+    get_annotated_path,
+    get_graph_path,
+)
+from persistence import atomic_write_json, file_lock, precompress, remove_precompressed
+import project_index
+from artifact_codec import is_binary
+
+logger = logging.getLogger(__name__)
+
+STAGE_PATHS = {
+    "cleaned": get_cleaned_path,
+    "atoms": get_atoms_path,
+    "annotated": get_annotated_path,
+    "graph": get_graph_path,
+}
+
+# Stages built from each stage's output.
+DEPENDENTS = {
+    "cleaned": ("atoms",),
+    "atoms": ("annotated",),
+    "annotated": ("graph",),
+    "graph": (),
+}
+
+_lock = threading.Lock()
+
+
+def content_hash(value: Any) -> str:
+    """Stable hash of text or JSON-serialisable input, e.g. posted atoms or a prompt."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def prompt_version(*prompts: str) -> str:
+    """Short hash identifying the prompt text a stage was produced with."""
+    return content_hash("\n".join(prompts))[:12]
+
+
+def file_hash(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(stage: str, inputs: Dict[str, Any]) -> str:
+    """Fingerprint of everything a stage's output depends on."""
+    return content_hash({"stage": stage, "inputs": inputs})
+
+
+def load_manifest(project_slug: str, filename: str) -> Dict[str, dict]:
+    path = get_lineage_path(project_slug, filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(project_slug: str, filename: str, manifest: Dict[str, dict]) -> None:
+    path = get_lineage_path(project_slug, filename)
+    if not manifest:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    atomic_write_json(path, manifest, indent=2)
+
+
+def get_entry(project_slug: str, filename: str, stage: str) -> Optional[dict]:
+    return load_manifest(project_slug, filename).get(stage)
+
+
+def is_reusable(project_slug: str, filename: str, stage: str, expected: str,
+                adopt_legacy: bool = False, inputs: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    True if the stage artifact exists and was built from inputs with this fingerprint.
+    With `adopt_legacy`, an artifact written before lineage existed is stamped with
+    the current fingerprint and reused.
+    """
+    if not os.path.exists(STAGE_PATHS[stage](project_slug, filename)):
+        return False
+    entry = get_entry(project_slug, filename, stage)
+    if entry is None:
+        if adopt_legacy:
+            record(project_slug, filename, stage, expected, {**(inputs or {}), "adopted": True})
+            return True
+        return False
+    return entry.get("fingerprint") == expected
+
+
+def _invalidate(project_slug: str, filename: str, manifest: Dict[str, dict], stage: str) -> List[str]:
+    removed = []
+    for dependent in DEPENDENTS[stage]:
+        path = STAGE_PATHS[dependent](project_slug, filename)
+        if dependent in manifest or os.path.exists(path):
+            manifest.pop(dependent, None)
+            if os.path.exists(path):
+                os.remove(path)
+            remove_precompressed(path)
+            removed.append(dependent)
+        removed.extend(_invalidate(project_slug, filename, manifest, dependent))
+    return removed
+
+
+def record(project_slug: str, filename: str, stage: str, expected: str,
+           inputs: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Stamp a freshly written artifact with its fingerprint and output hash. If the
+    output differs from what was there before, dependent stages are removed so they
+    rebuild. Returns the invalidated stages.
+    """
+    return _stamp(project_slug, filename, stage, {"fingerprint": expected, "inputs": inputs or {}})
+
+
+def mark_incomplete(project_slug: str, filename: str, stage: str,
+                    inputs: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Stamp an artifact that was written with failures in it (e.g. fallback text) with
+    no fingerprint, so it is never reused, adopted as legacy or published, and the
+    next run rebuilds it. Dependents are invalidated as by record.
+    """
+    return _stamp(project_slug, filename, stage, {"fingerprint": None, "incomplete": True, "inputs": inputs or {}})
+
+
+def _stamp(project_slug: str, filename: str, stage: str, fields: Dict[str, Any]) -> List[str]:
+    path = STAGE_PATHS[stage](project_slug, filename)
+    output_hash = file_hash(path)
+    with _lock, file_lock(get_lineage_path(project_slug, filename)):
+        manifest = load_manifest(project_slug, filename)
+        previous = manifest.get(stage)
+        manifest[stage] = {
+            **fields,
+            "output_hash": output_hash,
+            "updated_at": datetime.now().isoformat(),
+        }
+        invalidated: List[str] = []
+        if previous and previous.get("output_hash") != output_hash:
+            invalidated = _invalidate(project_slug, filename, manifest, stage)
+        _save_manifest(project_slug, filename, manifest)
+    project_index.refresh_file(project_slug, filename)
+    if stage != "graph" and not is_binary(path):  # only JSON artifacts are served as-is
+        precompress(path)
+    if invalidated:
+        logger.info("%s changed for %s; invalidated %s", stage, filename, ", ".join(invalidated))
+    return invalidated
+
+
+def is_incomplete(project_slug: str, filename: str, stage: str) -> bool:
+    """True if this stage, or a stage it was built from, was written with failures."""
+    manifest = load_manifest(project_slug, filename)
+    upstream = [name for name, dependents in DEPENDENTS.items() if stage in dependents]
+    return bool(manifest.get(stage, {}).get("incomplete")) or any(
+        is_incomplete(project_slug, filename, name) for name in upstream)
+
+
+def restamp(project_slug: str, filename: str, stage: str) -> None:
+    """Update a stage's output hash after re-encoding it without changing its content; nothing is invalidated."""
+    output_hash = file_hash(STAGE_PATHS[stage](project_slug, filename))
+    with _lock, file_lock(get_lineage_path(project_slug, filename)):
+        manifest = load_manifest(project_slug, filename)
+        if stage in manifest:
+            manifest[stage]["output_hash"] = output_hash
+            _save_manifest(project_slug, filename, manifest)
+
+
+def adopt(project_slug: str, filename: str, stage: str, entry: dict) -> None:
+    """Record a lineage entry that came with an artifact, e.g. one restored from the content store."""
+    with _lock, file_lock(get_lineage_path(project_slug, filename)):
+        manifest = load_manifest(project_slug, filename)
+        manifest[stage] = entry
+        _save_manifest(project_slug, filename, manifest)
+
+
+def forget(project_slug: str, filename: str, stages: Optional[List[str]] = None) -> None:
+    """Drop the lineage of some stages, or the whole manifest when `stages` is None."""
+    with _lock, file_lock(get_lineage_path(project_slug, filename)):
+        manifest = load_manifest(project_slug, filename)
+        for stage in list(manifest) if stages is None else stages:
+            manifest.pop(stage, None)
+        _save_manifest(project_slug, filename, manifest)
@@ -1,9 +1,206 @@
 import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from paths import get_llm_cache_path
+
 load_dotenv()
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 gemini_model = genai.GenerativeModel(model_name="models/gemini-2.5-flash")
+
+
+class TokenBucket:
+    """Thread-safe token bucket that holds callers to a requests-per-minute budget."""
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent, then consume one token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Shared by every thread that calls Gemini in bulk, so concurrent files share one budget.
+llm_rate_limiter = TokenBucket(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+    burst=int(os.getenv("LLM_RATE_BURST", "4")),
+)
+
+
+class LLMResponseCache:
+    """On-disk prompt -> response cache with TTLs and size-bounded LRU eviction."""
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits on success, rolls back on error and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """Key a response by model, prompt hash and generation config."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps([model_name, prompt_hash, generation_config or {}], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _count(self, counter: Dict[str, int], stage: str) -> None:
+        counter[stage] = counter.get(stage, 0) + 1
+
+    def get(self, key: str, stage: str = "default") -> Optional[str]:
+        """Return a cached response, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._count(self.hits, stage)
+                return row[0]
+            if row:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count(self.misses, stage)
+            return None
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response, then evict least recently used entries until under max_bytes."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                conn.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, size and per-stage hit/miss counters for this process."""
+        with self._lock, self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+
+class CachedResponse:
+    """Minimal stand-in for a Gemini response served from the cache."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class CachedModel:
+    """Wraps gemini_model.generate_content with the response cache; stages can opt out."""
+
+    def __init__(self, model, cache: LLMResponseCache, enabled: bool = True, disabled_stages: Iterable[str] = ()):
+        self.model = model
+        self.cache = cache
+        self.enabled = enabled
+        self.disabled_stages = set(disabled_stages)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.model, "model_name", "unknown")
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                         stage: str = "default", use_cache: bool = True, refresh: bool = False,
+                         validate: Optional[Callable[[str], Any]] = None):
+        """
+        Return the model's response for a prompt, from the cache when possible.
+        `refresh` skips the lookup but stores the new reply; retries use it so a bad
+        cached reply is replaced rather than served again. With `validate`, only replies
+        it accepts (returns truthy without raising) are stored or served from the cache,
+        so a reply the caller can't parse is never kept.
+        """
+        cacheable = use_cache and self.enabled and stage not in self.disabled_stages
+        key = LLMResponseCache.make_key(self.model.model_name, prompt, generation_config) if cacheable else None
+        if key and not refresh:
+            cached = self.cache.get(key, stage)
+            if cached is not None and _accepts(validate, cached):
+                return CachedResponse(cached)
+
+        kwargs = {"generation_config": generation_config} if generation_config else {}
+        response = self.model.generate_content(prompt, **kwargs)
+        if key and response.text.strip() and _accepts(validate, response.text):
+            self.cache.put(key, response.text)
+        return response
+
+
+def _accepts(validate: Optional[Callable[[str], Any]], text: str) -> bool:
+    if validate is None:
+        return True
+    try:
+        return bool(validate(text))
+    except Exception:
+        return False
+
+
+cached_model = CachedModel(
+    gemini_model,
+    LLMResponseCache(
+        get_llm_cache_path(),
+        max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 86400,
+    ),
+    enabled=os.getenv("LLM_CACHE_ENABLED", "1") != "0",
+    # Chat replies depend on the whole conversation, so they are not cached by default.
+    disabled_stages=[s.strip() for s in os.getenv("LLM_CACHE_DISABLED_STAGES", "chat").split(",") if s.strip()],
+)
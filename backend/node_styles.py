@@ -0,0 +1,187 @@
+"""
+Per-node style cache for /enhance-graph.
+
+A node's color, icon, label and category depend only on its content (text,
+speaker, insights, tags), so each style is stored under a hash of that content
+and the prompt version. Opening the graph again costs no LLM call, and new atoms
+go to the LLM in small batches that run in parallel.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from llm import cached_model, llm_rate_limiter
+from paths import get_node_style_cache_path
+
+logger = logging.getLogger(__name__)
+
+ENHANCE_BATCH_SIZE = int(os.getenv("ENHANCE_BATCH_SIZE", "40"))
+ENHANCE_MAX_CONCURRENCY = int(os.getenv("ENHANCE_MAX_CONCURRENCY", "4"))
+# A batch whose reply misses some nodes is asked again this many times, bypassing the LLM cache.
+ENHANCE_ATTEMPTS = 2
+
+ENHANCE_GRAPH_PROMPT = '''\
+Analyze these user research insights and assign each one:
+1. A color (hex code) - red for pain points, green for positive behaviors, blue for technical issues, orange for comparisons, purple for emotions
+2. An emoji icon that represents the content
+3. A short 1-2 word label that captures the essence
+4. A category (pain, behavior, technical, comparison, emotion, other)
+
+Return JSON array with: [{"id": "...", "color": "#ff4757", "icon": "😤", "label": "frustration", "category": "pain"}]
+
+Insights: {insights}
+'''
+
+STYLE_FIELDS = ("color", "icon", "label", "category")
+# Styles cached under an older prompt are not reused once the prompt changes.
+PROMPT_VERSION = hashlib.sha256(ENHANCE_GRAPH_PROMPT.encode("utf-8")).hexdigest()[:8]
+CONTENT_FIELDS = ("text", "speaker", "insights", "tags")
+
+
+def node_style_key(node: dict) -> str:
+    """Hash of the parts of a node the style depends on; the node id is not included."""
+    content = json.dumps([PROMPT_VERSION] + [node.get(field) for field in CONTENT_FIELDS],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class NodeStyleCache:
+    """SQLite map from node content hash to its style."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_node_style_cache_path()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS styles (key TEXT PRIMARY KEY, style TEXT NOT NULL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits on success, rolls back on error and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        """Return the cached styles for whichever of `keys` are present."""
+        found: Dict[str, dict] = {}
+        unique = sorted(set(keys))
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, style in conn.execute(f"SELECT key, style FROM styles WHERE key IN ({placeholders})", chunk):
+                    found[key] = json.loads(style)
+        return found
+
+    def put_many(self, styles: Dict[str, dict]) -> None:
+        """Store styles by content hash."""
+        if not styles:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO styles (key, style) VALUES (?, ?)",
+                [(key, json.dumps(style, ensure_ascii=False)) for key, style in styles.items()],
+            )
+
+
+def _parse_styles(raw: str) -> list:
+    """The style list in an enhance-graph reply; raises if it is not a JSON list."""
+    raw = raw.strip()
+    if raw.startswith("```json"):
+        raw = raw[len("```json"):].strip()
+    if raw.endswith("```"):
+        raw = raw[:-3].strip()
+    items = json.loads(raw)
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of styles")
+    return items
+
+
+def _batch_styles(raw: str, count: int) -> Dict[int, dict]:
+    """Position in the batch -> style, for the positions an enhance-graph reply covers."""
+    styles = {}
+    for item in _parse_styles(raw):
+        if not isinstance(item, dict):
+            continue
+        try:
+            position = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= position < count:
+            styles[position] = {field: item.get(field) for field in STYLE_FIELDS if item.get(field) is not None}
+    return styles
+
+
+def _style_batch(nodes: List[dict]) -> Dict[int, dict]:
+    """
+    Style a batch of nodes in one LLM call. Nodes are sent with their position as id,
+    since node ids can repeat. Returns position -> style for the nodes the reply
+    covers; a reply missing some is asked again, and only complete replies are cached.
+    """
+    numbered = [{**node, "id": str(position)} for position, node in enumerate(nodes)]
+    prompt = ENHANCE_GRAPH_PROMPT.replace("{insights}", json.dumps(numbered, ensure_ascii=False))
+
+    def complete(raw: str) -> bool:
+        return len(_batch_styles(raw, len(nodes))) == len(nodes)
+
+    styles: Dict[int, dict] = {}
+    for attempt in range(ENHANCE_ATTEMPTS):
+        llm_rate_limiter.acquire()
+        response = cached_model.generate_content(prompt, stage="enhance_graph", refresh=attempt > 0, validate=complete)
+        try:
+            styles.update(_batch_styles(response.text, len(nodes)))
+        except (json.JSONDecodeError, ValueError, AttributeError, TypeError) as e:
+            logger.warning("enhance_graph reply unreadable (attempt %d of %d): %s", attempt + 1, ENHANCE_ATTEMPTS, e)
+        if len(styles) == len(nodes):
+            break
+    return styles
+
+
+def style_nodes(nodes: List[dict], batch_size: int = ENHANCE_BATCH_SIZE,
+                max_workers: int = ENHANCE_MAX_CONCURRENCY, cache: Optional[NodeStyleCache] = None) -> List[dict]:
+    """
+    Return [{id, color, icon, label, category}] for `nodes`, styling only nodes whose
+    content has not been seen before. Nodes from a failed batch are left out, and
+    are retried the next time the graph is opened.
+    """
+    cache = cache or NodeStyleCache()
+    keys = [node_style_key(node) for node in nodes]
+    styles = cache.get_many(keys)
+
+    # One representative node per uncached content hash.
+    missing: Dict[str, dict] = {}
+    for node, key in zip(nodes, keys):
+        if key not in styles and key not in missing:
+            missing[key] = node
+    if missing:
+        pending = list(missing.items())
+        batches = [pending[i:i + max(1, batch_size)] for i in range(0, len(pending), max(1, batch_size))]
+
+        def run(batch) -> Dict[str, dict]:
+            try:
+                batch_styles = _style_batch([node for _, node in batch])
+            except Exception as e:
+                logger.error("enhance_graph batch of %d nodes failed: %s", len(batch), e)
+                return {}
+            return {batch[position][0]: style for position, style in batch_styles.items()}
+
+        new_styles: Dict[str, dict] = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for batch_styles in pool.map(run, batches):
+                new_styles.update(batch_styles)
+        cache.put_many(new_styles)
+        styles.update(new_styles)
+        logger.info("enhance_graph: %d cached, %d styled in %d calls",
+                    len(nodes) - len(missing), len(new_styles), len(batches))
+
+    return [{"id": node.get("id"), **styles[key]} for node, key in zip(nodes, keys) if key in styles]
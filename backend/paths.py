@@ -6,6 +6,10 @@ from datetime import datetime
 # All projects and their associated files will be stored here.
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'data'))
 
+# Content-addressed storage shared by every project. sanitize_slug never produces a
+# leading underscore, so this directory can't collide with a project.
+CONTENT_STORE_DIR = os.path.join(DATA_DIR, '_cas')
+
 def ensure_dirs():
     """Ensure that the base data directory exists."""
     os.makedirs(DATA_DIR, exist_ok=True)
@@ -73,6 +77,16 @@ def get_chat_history_path(project_slug: str) -> str:
     safe_slug = sanitize_slug(project_slug)
     return os.path.join(DATA_DIR, safe_slug, "chat", "history.json")
 
+def get_chat_log_path(project_slug: str) -> str:
+    """Get the path of a project's append-only chat history (one JSON message per line)."""
+    safe_slug = sanitize_slug(project_slug)
+    return os.path.join(DATA_DIR, safe_slug, "chat", "history.jsonl")
+
+def get_chat_summary_path(project_slug: str) -> str:
+    """Get the path of the rolling summary of a project's older chat messages."""
+    safe_slug = sanitize_slug(project_slug)
+    return os.path.join(DATA_DIR, safe_slug, "chat", "summary.json")
+
 def get_graph_path(project_slug: str, filename: str) -> str:
     """Returns the full path for a graph JSON file within its project."""
     base, _ = os.path.splitext(filename)
@@ -83,7 +97,77 @@ def get_comments_path(project_slug: str, filename: str) -> str:
     base, _ = os.path.splitext(filename)
     return os.path.join(get_stage_path(project_slug, 'comments'), f"{base}.json")
 
+def get_comment_log_path(project_slug: str, filename: str) -> str:
+    """Returns the path of the append-only log of comment edits made since the last snapshot."""
+    base, _ = os.path.splitext(filename)
+    return os.path.join(get_stage_path(project_slug, 'comments'), f"{base}.log.jsonl")
+
 def get_quality_report_path(project_slug: str) -> str:
     """Get the absolute path for a project's quality report file."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return os.path.join(get_stage_path(project_slug, 'quality'), f"report_{timestamp}.json")
+
+def get_blob_path(content_hash: str) -> str:
+    """Returns the path of an uploaded file in the content-addressed store."""
+    blob_dir = os.path.join(CONTENT_STORE_DIR, 'blobs', content_hash[:2])
+    os.makedirs(blob_dir, exist_ok=True)
+    return os.path.join(blob_dir, f"{content_hash}.pdf")
+
+def get_node_style_cache_path() -> str:
+    """Returns the path of the shared per-node graph style cache, keyed by node content."""
+    os.makedirs(CONTENT_STORE_DIR, exist_ok=True)
+    return os.path.join(CONTENT_STORE_DIR, 'node_styles.sqlite')
+
+def get_content_artifact_path(content_hash: str, stage: str) -> str:
+    """Returns the path of a stage artifact derived from the upload with the given content hash."""
+    artifact_dir = os.path.join(CONTENT_STORE_DIR, 'artifacts', content_hash[:2], content_hash)
+    os.makedirs(artifact_dir, exist_ok=True)
+    ext = '.txt' if stage == 'cleaned' else '.json'
+    return os.path.join(artifact_dir, f"{stage}{ext}")
+
+def get_upload_hashes_path(project_slug: str) -> str:
+    """Returns the path of the filename -> content hash map for a project's uploads."""
+    return os.path.join(get_stage_path(project_slug, 'uploads'), '.hashes.json')
+
+def get_job_path(project_slug: str, job_id: str) -> str:
+    """Returns the path of a background job's state file within its project."""
+    return os.path.join(get_stage_path(project_slug, 'jobs'), f"{job_id}.json")
+
+def get_annotation_report_path(project_slug: str, filename: str) -> str:
+    """Returns the path of the report for a file's last annotation run."""
+    base, _ = os.path.splitext(filename)
+    return os.path.join(get_stage_path(project_slug, 'reports'), f"{base}.annotate.json")
+
+def get_llm_cache_path() -> str:
+    """Returns the path of the shared on-disk LLM response cache."""
+    cache_dir = os.path.join(DATA_DIR, '_llm_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, 'responses.sqlite')
+
+def get_annotation_checkpoint_path(project_slug: str, filename: str) -> str:
+    """Returns the path of the per-atom annotation log for a file."""
+    base, _ = os.path.splitext(filename)
+    return os.path.join(get_stage_path(project_slug, 'annotated'), f"{base}.checkpoint.jsonl")
+
+def get_project_graph_path(project_slug: str) -> str:
+    """Returns the path of the project-wide graph merged across all transcripts."""
+    return os.path.join(get_project_path(project_slug), 'project_graph.json')
+
+def get_project_graph_log_path(project_slug: str) -> str:
+    """Returns the path of the log of project graph changes made since its last snapshot."""
+    return os.path.join(get_project_path(project_slug), 'project_graph.log.jsonl')
+
+def get_theme_progress_path(project_slug: str, run_key: str) -> str:
+    """Returns the path of the intermediate results of a hierarchical theme clustering run."""
+    return os.path.join(get_stage_path(project_slug, 'themes'), f"{run_key}.json")
+
+def get_lineage_path(project_slug: str, filename: str) -> str:
+    """Returns the path of a file's lineage manifest (stage fingerprints and output hashes)."""
+    base, _ = os.path.splitext(filename)
+    return os.path.join(get_stage_path(project_slug, 'lineage'), f"{base}.json")
+
+def get_project_index_path() -> str:
+    """Returns the path of the SQLite index of projects, uploads and their stage status."""
+    index_dir = os.path.join(DATA_DIR, '_index')
+    os.makedirs(index_dir, exist_ok=True)
+    return os.path.join(index_dir, 'projects.sqlite')
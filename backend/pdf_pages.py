@@ -0,0 +1,92 @@
+"""
+Page-by-page PDF text extraction over a shared process pool.
+
+The pool is created once per process, on first use, and started with forkserver
+(spawn where that is unavailable). Forking the server itself would copy its job
+and threadpool threads' locks into the children, which can deadlock them. This
+module imports only fitz, so that is all a worker process loads.
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import fitz
+
+# PDFs shorter than this are read on the calling thread; the pool costs more than it saves.
+PDF_PARALLEL_MIN_PAGES = 16
+PDF_PAGES_PER_TASK = 8
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_EXTRACT_WORKERS),
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) from a PDF. Runs inside a worker process."""
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(
+    pdf_path: str,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    max_pages_in_memory: Optional[int] = None,
+) -> Iterator[str]:
+    """Yield the text of each PDF page in order, extracting page ranges across the process pool.
+
+    With `max_pages_in_memory` set, no more than that many pages of text are
+    extracted-but-not-yet-consumed at any moment.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if page_count < PDF_PARALLEL_MIN_PAGES:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    if max_pages_in_memory:
+        pages_per_task = max(1, min(pages_per_task, max_pages_in_memory))
+    ranges = iter([(start, min(start + pages_per_task, page_count))
+                   for start in range(0, page_count, pages_per_task)])
+    max_in_flight = max(1, max_pages_in_memory // pages_per_task) if max_pages_in_memory else page_count
+
+    pool = _get_pool()
+    pending = deque()
+    try:
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            yield from pending.popleft().result()
+            # Refill only after the consumer has taken the previous range, so the bound holds.
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_page_range, pdf_path, *next_range))
+    finally:
+        # The consumer stopped early or a range failed; drop what it will never read.
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,210 @@
+"""
+Crash-safe, multi-process-safe writes for the JSON files under DATA_DIR.
+
+- atomic_write_json / atomic_write_text write to a temp file in the same
+  directory, fsync it and rename it over the target. Readers see the old file or
+  the new one, never a truncated one.
+- file_lock takes an advisory fcntl lock on a lock file for the path, so
+  read-modify-write cycles (update_json) stay serialized across uvicorn workers.
+  Lock files for paths under DATA_DIR live in their project's .locks directory
+  rather than beside every artifact. Without fcntl (Windows) it falls back to a
+  per-path in-process lock. acquire_lease takes the same lock without waiting and
+  keeps it, e.g. while a job runs.
+- precompress writes .gz (and .br, if brotli is installed) siblings of an artifact
+  for artifact_serving to send as-is.
+"""
+
+import os
+import gzip
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Dict, Optional
+
+import paths
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_PRECOMPRESS = os.getenv("ARTIFACT_PRECOMPRESS", "1") == "1"
+# Smaller files gain nothing from compression.
+PRECOMPRESS_MIN_BYTES = 1024
+# Content-Encoding -> sibling extension, in order of preference.
+PRECOMPRESSED_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+LOCK_DIR_NAME = ".locks"
+
+_local_locks: Dict[str, threading.RLock] = {}
+_local_locks_guard = threading.Lock()
+
+
+def _fsync_dir(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """Replace `path` with `text` via temp file + fsync + rename."""
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """Replace `path` with `data` via temp file + fsync + rename."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = None, **kwargs) -> None:
+    """Serialize `data` and replace `path` with it atomically."""
+    kwargs.setdefault("ensure_ascii", False)
+    atomic_write_text(path, json.dumps(data, indent=indent, **kwargs))
+
+
+def lock_path(path: str) -> str:
+    """
+    The lock file guarding `path`: <DATA_DIR>/<project>/.locks/<path inside the
+    project, "/" as "%">.lock, or "<path>.lock" for paths outside a project folder.
+    """
+    path = os.path.abspath(path)
+    relative = os.path.relpath(path, paths.DATA_DIR)
+    parts = relative.split(os.sep)
+    if relative.startswith("..") or len(parts) < 2:
+        return f"{path}.lock"
+    return os.path.join(paths.DATA_DIR, parts[0], LOCK_DIR_NAME, "%".join(parts[1:]) + ".lock")
+
+
+def _open_lock(path: str) -> IO:
+    target = lock_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return open(target, "a")
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Advisory lock guarding `path` (held on its lock file) for the duration of the block."""
+    if fcntl is None:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(os.path.abspath(path), threading.RLock())
+        with lock:
+            yield
+        return
+    with _open_lock(path) as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def acquire_lease(path: str) -> Optional[IO]:
+    """
+    Try to take an exclusive lock on `path` without waiting, held until release_lease
+    or until this process exits, so a crashed owner's lease frees itself. Returns None
+    if someone else (another process, or another lease in this one) holds it.
+    """
+    lease = _open_lock(path)
+    if fcntl is None:
+        return lease  # single-process fallback: nothing to contend with
+    try:
+        fcntl.flock(lease.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lease.close()
+        return None
+    return lease
+
+
+def release_lease(lease: Optional[IO]) -> None:
+    if lease is not None:
+        lease.close()  # closing the file drops the lock
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Load JSON from `path`, or return `default` if it does not exist."""
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_json(path: str, mutate: Callable[[Any], Any], default_factory: Callable[[], Any] = dict,
+                indent: Optional[int] = None) -> Any:
+    """
+    Locked read-modify-write: load `path` (or default_factory()), let `mutate` change it
+    in place or return a replacement, write it back atomically, and return it.
+    """
+    with file_lock(path):
+        data = read_json(path)
+        if data is None:
+            data = default_factory()
+        result = mutate(data)
+        if result is not None:
+            data = result
+        atomic_write_json(path, data, indent=indent)
+        return data
+
+
+def precompress(path: str) -> None:
+    """Write compressed siblings of a freshly written artifact, dropping any it no longer warrants."""
+    if not ARTIFACT_PRECOMPRESS or not os.path.exists(path):
+        return
+    if os.path.getsize(path) < PRECOMPRESS_MIN_BYTES:
+        remove_precompressed(path)
+        return
+    names = ["gzip"] + (["br"] if brotli is not None else [])
+    mtime = os.stat(path).st_mtime_ns
+    stale = [name for name in names if not os.path.exists(path + PRECOMPRESSED_EXTENSIONS[name])
+             or os.stat(path + PRECOMPRESSED_EXTENSIONS[name]).st_mtime_ns < mtime]
+    if not stale:
+        return
+    with open(path, "rb") as f:
+        raw = f.read()
+    compressors = {"gzip": lambda: gzip.compress(raw, compresslevel=6, mtime=0),
+                   "br": lambda: brotli.compress(raw, quality=5)}
+    for name in stale:
+        compress = compressors[name]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress())
+            os.replace(tmp_path, path + PRECOMPRESSED_EXTENSIONS[name])
+        except OSError as e:
+            logger.warning("Could not precompress %s: %s", path, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def remove_precompressed(path: str) -> None:
+    for ext in PRECOMPRESSED_EXTENSIONS.values():
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
+
@@ -0,0 +1,355 @@
+"""
+Project-wide insight graph across every transcript in a project.
+
+The graph is updated one file at a time: when a file's annotated atoms land, its
+old nodes are dropped, the new nodes are added, and only edges touching the new
+nodes are computed, using an in-memory (type, label) -> node ids index. Edges are
+weighted with graph_builder.score_pair and each node keeps at most
+GRAPH_MAX_DEGREE of them, a stronger new edge displacing a node's weakest one.
+
+On disk it is a snapshot, <project>/project_graph.json, plus an append-only log of
+the merges and removals made since, <project>/project_graph.log.jsonl. A merge
+appends one line instead of rewriting the graph; the log is folded into a new
+snapshot once it outgrows it. The log's first line names the snapshot it follows,
+so a log left behind by an interrupted compaction is ignored.
+"""
+
+import os
+import json
+import logging
+import threading
+from uuid import uuid4
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from paths import get_project_graph_path, get_project_graph_log_path, get_annotated_path, get_stage_path
+from graph_builder import GRAPH_MAX_DEGREE, MIN_EDGE_WEIGHT, insight_weights, score_pair
+from persistence import file_lock, atomic_write_text
+from artifact_codec import read_artifact, write_artifact
+import lineage
+
+logger = logging.getLogger(__name__)
+
+# Nodes looked at per shared insight for each new node, as a multiple of the degree cap.
+CANDIDATES_PER_SLOT = 2
+
+# One lock per project so concurrent annotation jobs don't overwrite each other's merges.
+_project_locks: Dict[str, threading.Lock] = {}
+_project_locks_guard = threading.Lock()
+# Last loaded graph per project, reused while its files are unchanged on disk.
+_graphs: Dict[str, Tuple[tuple, "ProjectGraph"]] = {}
+
+
+@contextmanager
+def project_lock(project_slug: str):
+    """Hold the lock guarding a project's graph file, across threads and worker processes."""
+    with _project_locks_guard:
+        lock = _project_locks.setdefault(project_slug, threading.Lock())
+    with lock, file_lock(get_project_graph_path(project_slug)):
+        yield
+
+
+def _edge_key(a: str, b: str) -> Tuple[str, str]:
+    return (a, b) if a <= b else (b, a)
+
+
+class ProjectGraph:
+    """Cross-transcript graph for one project, merged incrementally per file."""
+
+    def __init__(self, project_slug: str, max_degree: Optional[int] = GRAPH_MAX_DEGREE,
+                 min_weight: float = MIN_EDGE_WEIGHT):
+        self.project_slug = project_slug
+        self.path = get_project_graph_path(project_slug)
+        self.log_path = get_project_graph_log_path(project_slug)
+        self.max_degree = max_degree or None
+        self.min_weight = min_weight
+        self.nodes: Dict[str, dict] = {}
+        self.edges: Dict[Tuple[str, str], dict] = {}
+        self.files: Dict[str, List[str]] = {}
+        self.file_hashes: Dict[str, str] = {}
+        self.log_id: Optional[str] = None
+        self.log_bytes = 0
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.exists(self.path):
+            data = read_artifact(self.path)
+            self.nodes = {node["id"]: node for node in data.get("nodes", [])}
+            self.edges = {_edge_key(e["source"], e["target"]): e for e in data.get("edges", [])}
+            self.files = data.get("files", {})
+            self.file_hashes = data.get("file_hashes", {})
+            self.log_id = data.get("log_id")
+        self._reindex()
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except json.JSONDecodeError:
+            header = {}
+        if header.get("log_id") != self.log_id:
+            # Written before the current snapshot; its changes are already in it.
+            return
+        for line in lines[1:]:
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append can leave one partial line; that merge simply never happened.
+                logger.warning("Skipping partial line in %s", self.log_path)
+                continue
+            self._apply(op)
+        self.log_bytes = sum(len(line.encode("utf-8")) for line in lines)
+
+    def _reindex(self) -> None:
+        self.weights: Dict[str, Dict[tuple, float]] = {}
+        self.postings: Dict[tuple, Dict[float, List[str]]] = {}
+        self.adjacency: Dict[str, Dict[str, float]] = {node_id: {} for node_id in self.nodes}
+        for node_id, node in self.nodes.items():
+            self._index_node(node_id, node)
+        for (a, b), edge in self.edges.items():
+            self.adjacency[a][b] = self.adjacency[b][a] = edge["weight"]
+
+    def _index_node(self, node_id: str, node: dict) -> None:
+        weights = {key: w for key, w in insight_weights(node).items() if w >= self.min_weight}
+        self.weights[node_id] = weights
+        self.adjacency.setdefault(node_id, {})
+        for key, w in weights.items():
+            self.postings.setdefault(key, {}).setdefault(w, []).append(node_id)
+
+    def _unindex_node(self, node_id: str) -> None:
+        for key, w in self.weights.pop(node_id, {}).items():
+            buckets = self.postings.get(key, {})
+            members = buckets.get(w, [])
+            if node_id in members:
+                members.remove(node_id)
+            if not members:
+                buckets.pop(w, None)
+            if not buckets:
+                self.postings.pop(key, None)
+
+    def _add_edge(self, a: str, b: str, score: float, label: str) -> dict:
+        edge = {"source": a, "target": b, "label": label, "weight": round(score, 3)}
+        self.edges[_edge_key(a, b)] = edge
+        self.adjacency[a][b] = self.adjacency[b][a] = edge["weight"]
+        return edge
+
+    def _remove_edge(self, a: str, b: str) -> None:
+        self.edges.pop(_edge_key(a, b), None)
+        self.adjacency.get(a, {}).pop(b, None)
+        self.adjacency.get(b, {}).pop(a, None)
+
+    def _candidates(self, node_id: str) -> List[str]:
+        """Nodes sharing a qualifying insight with `node_id`, strongest on each insight first."""
+        limit = self.max_degree * CANDIDATES_PER_SLOT if self.max_degree else None
+        candidates = set()
+        for key, w in self.weights[node_id].items():
+            taken = 0
+            # A partner's strength on this insight is min(w, its weight); newest first among equals.
+            for bucket_weight in sorted(self.postings.get(key, {}), reverse=True):
+                for other_id in reversed(self.postings[key][bucket_weight]):
+                    if other_id == node_id:
+                        continue
+                    candidates.add(other_id)
+                    taken += 1
+                    if limit is not None and taken >= limit:
+                        break
+                if limit is not None and taken >= limit:
+                    break
+        return sorted(candidates)
+
+    def _link(self, node_id: str) -> Tuple[List[dict], List[List[str]]]:
+        """Add the strongest edges for a new node within the degree cap. Returns (added, removed)."""
+        scored = []
+        for other_id in self._candidates(node_id):
+            score, label = score_pair(self.weights[other_id], self.weights[node_id], self.min_weight)
+            if label is not None:
+                scored.append((score, other_id, label))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        added, removed = [], []
+        for score, other_id, label in scored:
+            if self.max_degree and len(self.adjacency[node_id]) >= self.max_degree:
+                break
+            rounded = round(score, 3)
+            if self.max_degree and len(self.adjacency[other_id]) >= self.max_degree:
+                weakest = min(self.adjacency[other_id], key=lambda n: (self.adjacency[other_id][n], n))
+                if self.adjacency[other_id][weakest] >= rounded:
+                    continue
+                self._remove_edge(other_id, weakest)
+                removed.append([other_id, weakest])
+            added.append(self._add_edge(other_id, node_id, score, label))
+        return added, removed
+
+    def _apply(self, op: dict) -> None:
+        """Replay one logged merge or removal."""
+        self.remove_file(op["filename"])
+        if op["op"] != "merge":
+            return
+        for node in op["nodes"]:
+            self.nodes[node["id"]] = node
+            self._index_node(node["id"], node)
+        for a, b in op["edges_removed"]:
+            self._remove_edge(a, b)
+        for edge in op["edges_added"]:
+            self._add_edge(edge["source"], edge["target"], edge["weight"], edge["label"])
+        self.files[op["filename"]] = [node["id"] for node in op["nodes"]]
+        if op.get("file_hash"):
+            self.file_hashes[op["filename"]] = op["file_hash"]
+
+    def to_dict(self) -> dict:
+        """Graph in the same shape as the per-file graph, plus the file -> node ids map."""
+        return {
+            "nodes": list(self.nodes.values()),
+            "edges": list(self.edges.values()),
+            "files": self.files,
+            "clusters": {},
+            "facets": [],
+            "themes": [],
+            "nodes_desc": "Every atom across the project's transcripts.",
+            "edges_desc": "Links between atoms sharing high-weight insights, across transcripts.",
+        }
+
+    def save(self) -> None:
+        """Write a full snapshot and start a new, empty log after it."""
+        self.log_id = uuid4().hex
+        write_artifact(self.path, {**self.to_dict(), "file_hashes": self.file_hashes, "log_id": self.log_id})
+        header = json.dumps({"log_id": self.log_id}) + "\n"
+        atomic_write_text(self.log_path, header)
+        self.log_bytes = len(header)
+
+    def append(self, op: dict) -> None:
+        """Record one merge or removal durably, compacting the log once it outgrows the snapshot."""
+        if not os.path.exists(self.path):
+            self.save()
+            return
+        snapshot_bytes = os.path.getsize(self.path)
+        if self.log_bytes > snapshot_bytes:
+            self.save()
+            return
+        line = json.dumps(op, ensure_ascii=False) + "\n"
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"log_id": self.log_id}) + "\n")
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self.log_bytes = f.tell()
+
+    @property
+    def stamp(self) -> tuple:
+        """Identifies the on-disk state this object was loaded from or last wrote."""
+        stats = (os.stat(p) if os.path.exists(p) else None for p in (self.path, self.log_path))
+        return tuple((st.st_mtime_ns, st.st_size) if st else None for st in stats)
+
+    def remove_file(self, filename: str) -> int:
+        """Drop a file's nodes and every edge touching them. Returns the number of nodes removed."""
+        removed = self.files.pop(filename, [])
+        self.file_hashes.pop(filename, None)
+        for node_id in removed:
+            for other_id in list(self.adjacency.get(node_id, {})):
+                self._remove_edge(node_id, other_id)
+            self.adjacency.pop(node_id, None)
+            self._unindex_node(node_id)
+            self.nodes.pop(node_id, None)
+        return len(removed)
+
+    def merge_file(self, filename: str, atoms: List[dict], file_hash: Optional[str] = None) -> dict:
+        """Replace a file's nodes with `atoms` and add only the edges that touch them."""
+        removed = self.remove_file(filename)
+        nodes: List[dict] = []
+        edges_added: List[dict] = []
+        edges_removed: List[List[str]] = []
+        for atom in atoms:
+            node_id = str(atom["id"])
+            if node_id in self.nodes:
+                # Atom ids come from the LLM and can repeat, across files or within one; keep every node.
+                base_id, n = f"{node_id}@{filename}", 1
+                node_id = base_id
+                while node_id in self.nodes:
+                    n += 1
+                    node_id = f"{base_id}#{n}"
+                logger.warning("Duplicate atom id in project %s; storing as %s", self.project_slug, node_id)
+            node = {**atom, "id": node_id, "source_pdf": filename}
+            self.nodes[node_id] = node
+            self._index_node(node_id, node)
+            added, dropped = self._link(node_id)
+            edges_added.extend(added)
+            edges_removed.extend(dropped)
+            nodes.append(node)
+
+        # Edges displaced later in this merge are not replayed.
+        edges_added = [e for e in edges_added if _edge_key(e["source"], e["target"]) in self.edges]
+        self.files[filename] = [node["id"] for node in nodes]
+        if file_hash:
+            self.file_hashes[filename] = file_hash
+        op = {"op": "merge", "filename": filename, "file_hash": file_hash, "nodes": nodes,
+              "edges_added": edges_added, "edges_removed": edges_removed}
+        return {"filename": filename, "nodes_removed": removed, "nodes_added": len(nodes),
+                "edges_added": len(edges_added), "edges_removed": len(edges_removed), "op": op}
+
+
+def _load(project_slug: str) -> ProjectGraph:
+    """The project's graph, from memory if nothing changed on disk since it was last read. Call under project_lock."""
+    cached = _graphs.get(project_slug)
+    if cached is not None:
+        stamp, graph = cached
+        if stamp == graph.stamp:
+            return graph
+    graph = ProjectGraph(project_slug)
+    _graphs[project_slug] = (graph.stamp, graph)
+    return graph
+
+
+@contextmanager
+def _editing(project_slug: str):
+    """Load the project graph for changes; a failed change drops it from memory so it is re-read."""
+    with project_lock(project_slug):
+        graph = _load(project_slug)
+        try:
+            yield graph
+        except BaseException:
+            _graphs.pop(project_slug, None)
+            raise
+        _graphs[project_slug] = (graph.stamp, graph)
+
+
+def load_project_graph(project_slug: str) -> ProjectGraph:
+    """The current project graph, read-only."""
+    with project_lock(project_slug):
+        return _load(project_slug)
+
+
+def merge_file_into_project(project_slug: str, filename: str, atoms: List[dict]) -> dict:
+    """Merge one file's annotated atoms into the project graph; a no-op if they are already in it."""
+    file_hash = lineage.content_hash(atoms)
+    with _editing(project_slug) as graph:
+        if graph.file_hashes.get(filename) == file_hash:
+            return {"filename": filename, "unchanged": True}
+        stats = graph.merge_file(filename, atoms, file_hash)
+        graph.append(stats.pop("op"))
+    logger.info("Project graph %s: %s", project_slug, stats)
+    return stats
+
+
+def remove_file_from_project(project_slug: str, filename: str) -> int:
+    """Remove a deleted or replaced file's nodes from the project graph. Returns the number removed."""
+    with _editing(project_slug) as graph:
+        removed = graph.remove_file(filename)
+        if removed:
+            graph.append({"op": "remove", "filename": filename})
+    return removed
+
+
+def rebuild_project_graph(project_slug: str) -> dict:
+    """Recreate the project graph by merging every uploaded file's annotated atoms."""
+    with _editing(project_slug) as graph:
+        graph.nodes, graph.edges, graph.files, graph.file_hashes = {}, {}, {}, {}
+        graph._reindex()
+        for filename in sorted(os.listdir(get_stage_path(project_slug, "uploads"))):
+            annotated_path = get_annotated_path(project_slug, filename)
+            if not filename.lower().endswith(".pdf") or not os.path.exists(annotated_path):
+                continue
+            atoms = read_artifact(annotated_path)
+            graph.merge_file(filename, atoms, lineage.content_hash(atoms))
+        graph.save()
+    return {"files": len(graph.files), "nodes": len(graph.nodes), "edges": len(graph.edges)}
@@ -0,0 +1,193 @@
+"""
+SQLite index of projects, their uploads and which stage artifacts exist.
+
+/projects reads only this index instead of walking DATA_DIR and stat-ing every
+stage file. The index is updated wherever an artifact appears or disappears:
+lineage.record (every stage write and cascade invalidation), content-store
+restores, uploads and deletes. If files are changed behind the app's back,
+rebuild it from disk:
+
+    python project_index.py rebuild
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from paths import DATA_DIR, get_project_index_path, sanitize_slug
+
+logger = logging.getLogger(__name__)
+
+# Artifact extension per stage, as in paths.get_cleaned_path etc. Building the paths
+# here avoids the getters' makedirs calls, which is most of what made the walk slow.
+STAGE_EXTENSIONS = {"cleaned": ".txt", "atoms": ".json", "annotated": ".json", "graph": ".json"}
+STAGES = tuple(STAGE_EXTENSIONS)
+
+
+def _stage_status(project_slug: str, filename: str) -> Dict[str, bool]:
+    project_dir = os.path.join(DATA_DIR, sanitize_slug(project_slug))
+    base, _ = os.path.splitext(filename)
+    return {stage: os.path.exists(os.path.join(project_dir, stage, base + ext))
+            for stage, ext in STAGE_EXTENSIONS.items()}
+
+
+class ProjectIndex:
+    """One row per (project, upload) with a done flag per stage."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_project_index_path()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " project TEXT NOT NULL, filename TEXT NOT NULL,"
+                + "".join(f" {stage} INTEGER NOT NULL DEFAULT 0," for stage in STAGES)
+                + " updated_at TEXT NOT NULL, PRIMARY KEY (project, filename))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @property
+    def is_built(self) -> bool:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone() is not None
+
+    def upsert(self, project_slug: str, filename: str, status: Dict[str, bool]) -> None:
+        columns = ", ".join(STAGES)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO files (project, filename, {columns}, updated_at)"
+                f" VALUES (?, ?, {', '.join('?' * len(STAGES))}, ?)",
+                (project_slug, filename, *(int(status.get(stage, False)) for stage in STAGES),
+                 datetime.now().isoformat()),
+            )
+
+    def remove_file(self, project_slug: str, filename: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE project = ? AND filename = ?", (project_slug, filename))
+
+    def remove_project(self, project_slug: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE project = ?", (project_slug,))
+
+    def replace_all(self, rows: Iterable[Tuple[str, str, Dict[str, bool]]]) -> int:
+        """Swap the whole index for `rows` in one transaction. Returns the row count."""
+        now = datetime.now().isoformat()
+        values = [(project, filename, *(int(status[stage]) for stage in STAGES), now)
+                  for project, filename, status in rows]
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM files")
+            conn.executemany(
+                f"INSERT INTO files (project, filename, {', '.join(STAGES)}, updated_at)"
+                f" VALUES (?, ?, {', '.join('?' * len(STAGES))}, ?)",
+                values,
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (now,))
+        return len(values)
+
+    def list_projects(self, offset: int = 0, limit: Optional[int] = None, stage: Optional[str] = None,
+                      done: Optional[bool] = None) -> Tuple[Dict[str, Dict[str, Dict[str, bool]]], int]:
+        """
+        {project: {filename: {stage: bool}}} for one page of projects, ordered by slug,
+        and the total number of matching projects. With `stage` and `done`, only files
+        whose stage is (or is not) done are listed, and projects without such files are left out.
+        """
+        where, params = "", []
+        if stage is not None and done is not None:
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}'. Expected one of: {', '.join(STAGES)}")
+            where, params = f"WHERE {stage} = ?", [int(done)]
+        with self._lock, self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(DISTINCT project) FROM files {where}", params).fetchone()[0]
+            page = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT project FROM files {where} ORDER BY project LIMIT ? OFFSET ?",
+                [*params, -1 if limit is None else limit, offset],
+            )]
+            projects: Dict[str, Dict[str, Dict[str, bool]]] = {project: {} for project in page}
+            if page:
+                placeholders = ",".join("?" * len(page))
+                clause = f"project IN ({placeholders})" + (f" AND {stage} = ?" if where else "")
+                for project, filename, *flags in conn.execute(
+                    f"SELECT project, filename, {', '.join(STAGES)} FROM files WHERE {clause}"
+                    " ORDER BY project, filename",
+                    [*page, *params],
+                ):
+                    projects[project][filename] = dict(zip(STAGES, map(bool, flags)))
+        return projects, total
+
+
+_indexes: Dict[str, ProjectIndex] = {}
+_indexes_guard = threading.Lock()
+
+
+def get_project_index() -> ProjectIndex:
+    path = get_project_index_path()
+    with _indexes_guard:
+        if path not in _indexes:
+            _indexes[path] = ProjectIndex(path)
+        return _indexes[path]
+
+
+def refresh_file(project_slug: str, filename: str) -> None:
+    """Re-read one upload's stage status from disk into the index."""
+    if not filename.lower().endswith(".pdf"):
+        return
+    try:
+        get_project_index().upsert(sanitize_slug(project_slug), filename, _stage_status(project_slug, filename))
+    except sqlite3.Error as e:
+        logger.warning("Could not update project index for %s/%s: %s", project_slug, filename, e)
+
+
+def remove_file(project_slug: str, filename: str) -> None:
+    get_project_index().remove_file(sanitize_slug(project_slug), filename)
+
+
+def remove_project(project_slug: str) -> None:
+    get_project_index().remove_project(sanitize_slug(project_slug))
+
+
+def scan_data_dir() -> List[Tuple[str, str, Dict[str, bool]]]:
+    """Walk DATA_DIR the slow way: every project's uploads and their stage artifacts."""
+    rows = []
+    if not os.path.isdir(DATA_DIR):
+        return rows
+    for project_slug in sorted(os.listdir(DATA_DIR)):
+        if project_slug.startswith("_"):
+            continue  # shared stores such as the content-addressed cache
+        upload_dir = os.path.join(DATA_DIR, project_slug, "uploads")
+        if not os.path.isdir(upload_dir):
+            continue
+        for filename in sorted(os.listdir(upload_dir)):
+            if filename.lower().endswith(".pdf"):
+                rows.append((project_slug, filename, _stage_status(project_slug, filename)))
+    return rows
+
+
+def rebuild_project_index() -> dict:
+    """Recreate the index from what is on disk."""
+    rows = scan_data_dir()
+    count = get_project_index().replace_all(rows)
+    projects = len({project for project, _, _ in rows})
+    logger.info("Project index rebuilt: %d projects, %d files", projects, count)
+    return {"projects": projects, "files": count}
+
+
+def ensure_project_index() -> ProjectIndex:
+    """The index, built from disk first if it never has been (e.g. on upgrade)."""
+    index = get_project_index()
+    if not index.is_built:
+        rebuild_project_index()
+    return index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit(f"usage: python {os.path.basename(__file__)} rebuild")
+    print(rebuild_project_index())
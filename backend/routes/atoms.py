@@ -3,18 +3,31 @@ import re
 import json
 import time
 import logging
+import threading
 from uuid import uuid4
-from typing import List
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Query, Body
-
-from llm import gemini_model
-from paths import get_cleaned_path, get_upload_path, get_atoms_path, get_annotated_path
-from shared_utils import run_llm_normalizer, extract_text_from_pdf
+from starlette.concurrency import run_in_threadpool
+
+from llm import cached_model, llm_rate_limiter
+from paths import get_atoms_path, get_annotated_path, get_annotation_report_path
+from shared_utils import normalize_upload
+from content_store import publish_artifact, restore_artifact
+import lineage
+from annotation_store import AnnotationCheckpoint
+from persistence import atomic_write_json
+from artifact_codec import read_artifact, write_artifact
+from project_graph import merge_file_into_project
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Upper bound on chunk atomisation calls in flight for one transcript.
+ATOMISE_MAX_IN_FLIGHT = int(os.getenv("ATOMISE_MAX_IN_FLIGHT", "4"))
+
 
 ATOMISER_PROMPT = """You are a hyper-granular insight atomiser for UX research.
 
@@ -66,69 +79,82 @@ def fix_json_syntax(raw_json: str) -> str:
     return raw_json
 
 
-def chunk_and_atomise(full_text: str, source_file: str) -> List[dict]:
-    """Split large text into chunks and atomise each one."""
+def chunk_and_atomise(full_text: str, source_file: str, max_in_flight: int = ATOMISE_MAX_IN_FLIGHT) -> List[dict]:
+    """Split large text into chunks and atomise them concurrently, keeping chunk order."""
     lines = full_text.split('\n')
     chunks = []
     current_chunk = ""
     for line in lines:
         if len(current_chunk) + len(line) > 14000:
-            chunks.append(current_chunk.strip())
+            if current_chunk.strip():
+                chunks.append(current_chunk.strip())
             current_chunk = line + '\n'
         else:
             current_chunk += line + '\n'
     if current_chunk.strip():
         chunks.append(current_chunk.strip())
     logger.info("Split into %d chunks", len(chunks))
-    all_atoms: List[dict] = []
-    for i, chunk in enumerate(chunks):
+
+    def atomise_chunk(i: int) -> List[dict]:
+        llm_rate_limiter.acquire()
         print(f"\U0001F501 Processing chunk {i + 1}/{len(chunks)}")
-        chunk_atoms = run_llm_atomiser_single(chunk, source_file, i + 1)
-        all_atoms.extend(chunk_atoms)
-        time.sleep(0.5)
+        return run_llm_atomiser_single(chunks[i], source_file, i + 1)
+
+    all_atoms: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        for chunk_atoms in pool.map(atomise_chunk, range(len(chunks))):
+            all_atoms.extend(chunk_atoms)
     return all_atoms
 
 
-def run_llm_atomiser_single(chunk_text: str, source_file: str, chunk_num: int) -> List[dict]:
-    """Atomise a single chunk of text."""
+def _parse_atoms(raw: str) -> list:
+    """The atom list in an atomiser reply; raises if it is not a JSON list."""
+    raw = re.sub(r'^```(?:json)?', '', raw.strip(), flags=re.MULTILINE)
+    raw = re.sub(r'```$', '', raw, flags=re.MULTILINE)
+    atoms = json.loads(fix_json_syntax(raw.strip()))
+    if not isinstance(atoms, list):
+        raise ValueError("Expected list of atoms")
+    return atoms
+
+
+def run_llm_atomiser_single(chunk_text: str, source_file: str, chunk_num: int, attempts: int = 3) -> List[dict]:
+    """
+    Atomise a single chunk of text, retrying bad replies with a fresh call. Raises if
+    every attempt fails, so a transcript is never stored with a chunk silently missing.
+    """
     prompt = ATOMISER_PROMPT.replace("{transcript}", chunk_text)
-    try:
-        response = gemini_model.generate_content(prompt)
-        raw = response.text.strip()
-        raw = re.sub(r'^```(?:json)?', '', raw, flags=re.MULTILINE)
-        raw = re.sub(r'```$', '', raw, flags=re.MULTILINE)
-        raw = raw.strip()
-        raw = fix_json_syntax(raw)
-        atoms = json.loads(raw)
-        if isinstance(atoms, list):
-            for atom in atoms:
-                atom.setdefault("id", str(uuid4()))
-                atom["source_file"] = f"{source_file} (chunk {chunk_num})"
-            return atoms
-    except Exception as e:
-        print(f"Chunk {chunk_num} failed: {e}")
-    return []
+    for attempt in range(attempts):
+        try:
+            response = cached_model.generate_content(prompt, stage="atomise", refresh=attempt > 0,
+                                                     validate=_parse_atoms)
+            atoms = _parse_atoms(response.text)
+        except Exception as e:
+            logger.warning("Chunk %d failed (attempt %d of %d): %s", chunk_num, attempt + 1, attempts, e)
+            if attempt + 1 < attempts:
+                time.sleep(1)
+                llm_rate_limiter.acquire()
+            continue
+        for atom in atoms:
+            atom.setdefault("id", str(uuid4()))
+            atom["source_file"] = f"{source_file} (chunk {chunk_num})"
+        return atoms
+    raise RuntimeError(f"Atomising chunk {chunk_num} of {source_file} failed after {attempts} attempts")
 
 
 def run_llm_atomiser(full_text: str, source_file: str) -> List[dict]:
-    """Run the atomiser on text, chunking if necessary."""
+    """Run the atomiser on text, chunking if necessary. Raises if every attempt fails."""
     if len(full_text) > 15000:
         print(f"\U0001F4CF Text too long ({len(full_text)} chars), chunking...")
         return chunk_and_atomise(full_text, source_file)
     prompt = ATOMISER_PROMPT.replace("{transcript}", full_text)
     for attempt in range(3):
         try:
-            response = gemini_model.generate_content(prompt)
+            response = cached_model.generate_content(prompt, stage="atomise", refresh=attempt > 0,
+                                                     validate=_parse_atoms)
             raw = response.text.strip()
             print(f"\U0001F9E0 GEMINI RAW (Atomiser, attempt {attempt + 1}):")
             print(repr(raw[:500]) + ("..." if len(raw) > 500 else ""))
-            raw = re.sub(r'^```(?:json)?', '', raw, flags=re.MULTILINE)
-            raw = re.sub(r'```$', '', raw, flags=re.MULTILINE)
-            raw = raw.strip()
-            raw = fix_json_syntax(raw)
-            atoms = json.loads(raw)
-            if not isinstance(atoms, list):
-                raise ValueError("Expected list of atoms")
+            atoms = _parse_atoms(raw)
             valid_atoms = []
             for atom in atoms:
                 if isinstance(atom, dict) and "text" in atom:
@@ -149,32 +175,10 @@ def run_llm_atomiser(full_text: str, source_file: str) -> List[dict]:
             if attempt < 2:
                 time.sleep(1)
                 continue
-    print("\U0001F6AB All atomisation attempts failed, returning error atom")
-    return [{
-        "id": str(uuid4()),
-        "speaker": "ERROR",
-        "text": f"[Atomiser failed after 3 attempts. Text length: {len(full_text)} chars. Last error: JSON parsing failed]",
-        "context": "",
-        "entities": {"objects": [], "tasks": [], "emotions": []},
-        "confidence": "low",
-        "source_file": source_file,
-    }]
-
-
-ANNOTATOR_PROMPT = """You are a UX-insight extractor.
-
-You will be given a single atomic insight from a user's speech.
-
-Return a JSON object with the following structure:
+    raise RuntimeError(f"Atomising {source_file} failed after 3 attempts")
 
-{
-  "insights": [
-    {"type": "<meta-category>", "label": "<3 words>", "weight": 0.0-1.0}
-  ],
-  "tags": ["keyword1", "keyword2"]
-}
 
-Allowed types & examples
+ANNOTATION_GUIDE = """Allowed types & examples
 persona: mobile user | admin | new hire
 pain: login friction | hidden cost | broken flow
 emotion: annoyance | anxiety | delight
@@ -191,27 +195,276 @@ Rules
 - weight = confidence 0-1
 - labels verbatim when possible
 - skip any you can’t ground
+"""
+
+ANNOTATOR_PROMPT = """You are a UX-insight extractor.
+
+You will be given a single atomic insight from a user's speech.
 
+Return a JSON object with the following structure:
+
+{
+  "insights": [
+    {"type": "<meta-category>", "label": "<3 words>", "weight": 0.0-1.0}
+  ],
+  "tags": ["keyword1", "keyword2"]
+}
+
+""" + ANNOTATION_GUIDE + """
 Quote:
 {atom_text}
 """
 
+BATCH_ANNOTATOR_PROMPT = """You are a UX-insight extractor.
+
+You will be given a JSON list of atomic insights from users' speech, each with an "id" and a "text".
+Annotate every quote on its own, exactly as if it were the only one.
+
+Return one JSON object keyed by atom id, with an entry for every id you were given:
+
+{
+  "<atom id>": {
+    "insights": [
+      {"type": "<meta-category>", "label": "<3 words>", "weight": 0.0-1.0}
+    ],
+    "tags": ["keyword1", "keyword2"]
+  }
+}
+
+""" + ANNOTATION_GUIDE + """
+Quotes:
+{atoms_json}
+"""
+
+# Atoms per batched annotation call (1 = the original one-call-per-atom mode), and batches in flight.
+ANNOTATE_BATCH_SIZE = int(os.getenv("ANNOTATE_BATCH_SIZE", "20"))
+ANNOTATE_MAX_CONCURRENCY = int(os.getenv("ANNOTATE_MAX_CONCURRENCY", "4"))
+
+# Parts of the stage fingerprints: editing a prompt re-runs that stage for files built with the old text.
+ATOMISE_PROMPT_VERSION = lineage.prompt_version(ATOMISER_PROMPT)
+ANNOTATE_PROMPT_VERSION = lineage.prompt_version(ANNOTATION_GUIDE, ANNOTATOR_PROMPT, BATCH_ANNOTATOR_PROMPT)
+
+
+def _strip_json_fences(raw: str) -> str:
+    return re.sub(r'^```(?:json)?|```$', '', raw.strip(), flags=re.M).strip()
 
-def annotate_atom(text: str) -> dict:
-    """Annotate a single atom using the LLM."""
+
+def _parse_annotation(raw: str) -> dict:
+    """The annotation in a single-atom reply; raises if it is not a JSON object."""
+    payload = json.loads(_strip_json_fences(raw))
+    if not isinstance(payload, dict):
+        raise ValueError("Expected an annotation object")
+    return {
+        "insights": payload.get("insights", []),
+        "tags": payload.get("tags", []),
+    }
+
+
+def _annotate_single(text: str, refresh: bool = False) -> dict:
+    """Annotate one atom with the LLM; raises on a bad reply."""
     prompt = ANNOTATOR_PROMPT.replace("{atom_text}", text)
-    try:
-        response = gemini_model.generate_content(prompt)
-        raw = response.text.strip()
-        raw = re.sub(r'^```(?:json)?|```$', '', raw, flags=re.M).strip()
-        payload = json.loads(raw)
-        return {
-            "insights": payload.get("insights", []),
-            "tags": payload.get("tags", []),
+    response = cached_model.generate_content(prompt, stage="annotate", refresh=refresh, validate=_parse_annotation)
+    return _parse_annotation(response.text)
+
+
+def _parse_batch(raw: str, ids: List[str]) -> Dict[str, dict]:
+    """Annotations by atom id from a batch reply; raises if the reply misses any of `ids`."""
+    payload = json.loads(_strip_json_fences(raw))
+    if not isinstance(payload, dict):
+        raise ValueError("Expected an object keyed by atom id")
+    missing = set(ids) - set(payload)
+    if missing:
+        raise ValueError(f"Batch reply is missing {len(missing)} of {len(ids)} atoms")
+    return {
+        atom_id: {
+            "insights": payload[atom_id].get("insights", []),
+            "tags": payload[atom_id].get("tags", []),
         }
+        for atom_id in ids
+    }
+
+
+def annotate_batch(atoms: List[dict]) -> Dict[str, dict]:
+    """Annotate several atoms in one LLM call. Raises if the reply misses any atom id."""
+    items = [{"id": str(atom["id"]), "text": atom["text"]} for atom in atoms]
+    ids = [item["id"] for item in items]
+    prompt = BATCH_ANNOTATOR_PROMPT.replace("{atoms_json}", json.dumps(items, ensure_ascii=False))
+    response = cached_model.generate_content(prompt, stage="annotate", validate=lambda raw: _parse_batch(raw, ids))
+    return _parse_batch(response.text, ids)
+
+
+def annotate_atoms_batched(atoms: List[dict], batch_size: int = ANNOTATE_BATCH_SIZE,
+                           max_workers: int = ANNOTATE_MAX_CONCURRENCY,
+                           on_annotated: Optional[Callable[[dict, dict], None]] = None) -> Tuple[List[dict], dict]:
+    """
+    Annotate atoms N per LLM call, batches in parallel, splitting any failed batch in
+    half until it succeeds or reaches single atoms. Returns (annotations, report), with
+    annotations aligned to `atoms`. `on_annotated(atom, annotation)` is called as soon
+    as each atom succeeds; atoms that fail even alone get empty annotations and no callback.
+    Calls made for the halves of failed batches are also reported as `split_calls`.
+    """
+    started = time.monotonic()
+    stats = {"llm_calls": 0, "split_calls": 0, "failed_batches": 0, "failed_atoms": 0}
+    stats_lock = threading.Lock()
+
+    def count(key: str) -> None:
+        with stats_lock:
+            stats[key] += 1
+
+    def annotate_group(group: List[dict], split: bool = False) -> List[dict]:
+        llm_rate_limiter.acquire()
+        count("llm_calls")
+        if split:
+            count("split_calls")
+        if len(group) == 1:
+            try:
+                annotation = _annotate_single(group[0]["text"])
+            except Exception as e:
+                logger.error("Annotating atom %s failed: %s", group[0].get("id"), e)
+                count("failed_atoms")
+                return [{"insights": [], "tags": []}]
+            if on_annotated:
+                on_annotated(group[0], annotation)
+            return [annotation]
+        try:
+            results = annotate_batch(group)
+            annotations = [results[str(atom["id"])] for atom in group]
+        except Exception as e:
+            count("failed_batches")
+            logger.warning("Batch of %d atoms failed (%s); splitting", len(group), e)
+            mid = len(group) // 2
+            return annotate_group(group[:mid], True) + annotate_group(group[mid:], True)
+        if on_annotated:
+            for atom, annotation in zip(group, annotations):
+                on_annotated(atom, annotation)
+        return annotations
+
+    batch_size = max(1, batch_size)
+    batches = [atoms[i:i + batch_size] for i in range(0, len(atoms), batch_size)]
+    annotations: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for batch_annotations in pool.map(annotate_group, batches):
+            annotations.extend(batch_annotations)
+
+    report = {
+        "atoms": len(atoms),
+        "batch_size": batch_size,
+        "max_workers": max_workers,
+        "llm_calls": stats["llm_calls"],
+        "split_calls": stats["split_calls"],
+        # Against one call per atom; heavy splitting can cost more than that, never "save" less than nothing.
+        "calls_saved": max(len(atoms) - stats["llm_calls"], 0),
+        "failed_batches": stats["failed_batches"],
+        "failed_atoms": stats["failed_atoms"],
+        "wall_time_seconds": round(time.monotonic() - started, 3),
+    }
+    return annotations, report
+
+
+def atomise_upload(project_slug: str, filename: str) -> List[dict]:
+    """Return the atoms for an upload, normalizing and atomising it first if needed."""
+    atoms_path = get_atoms_path(project_slug, filename)
+    logger.info("Atoms path: %s", atoms_path)
+    try:
+        clean_text = normalize_upload(project_slug, filename)
+    except FileNotFoundError:
+        # Older projects can have atoms without the upload or cleaned text they came from.
+        restore_artifact(project_slug, filename, "atoms")
+        if os.path.exists(atoms_path):
+            logger.info("No source for %s; using its existing atoms", filename)
+            return read_artifact(atoms_path)
+        raise FileNotFoundError(f"Source file not found for project '{project_slug}': {filename}")
+
+    inputs = {"cleaned": lineage.content_hash(clean_text), "prompt": ATOMISE_PROMPT_VERSION, "model": cached_model.model_name}
+    expected = lineage.fingerprint("atoms", inputs)
+    restore_artifact(project_slug, filename, "atoms", expected)
+    if lineage.is_reusable(project_slug, filename, "atoms", expected, adopt_legacy=True, inputs=inputs):
+        return read_artifact(atoms_path)
+
+    atoms = run_llm_atomiser(clean_text, filename)
+    write_artifact(atoms_path, atoms)
+    lineage.record(project_slug, filename, "atoms", expected, inputs)
+    publish_artifact(project_slug, filename, "atoms")
+    return atoms
+
+
+def _merge_into_project(project_slug: str, filename: str, enriched: List[dict]) -> None:
+    """Bring the project graph up to date with a file's annotated atoms; a no-op when it already is."""
+    try:
+        merge_file_into_project(project_slug, filename, enriched)
     except Exception as e:
-        logger.error("annotate_atom error: %s", e)
-        return {"insights": [], "tags": []}
+        logger.error("Project graph merge failed for %s: %s", filename, e)
+
+
+def _seedable(project_slug: str, filename: str, inputs: dict) -> bool:
+    """True if an annotated file with no checkpoint can seed one: complete, and from this prompt and model."""
+    entry = lineage.get_entry(project_slug, filename, "annotated")
+    if entry is None:
+        return True  # written before lineage existed
+    return not entry.get("incomplete") and (
+        entry["inputs"].get("prompt"), entry["inputs"].get("model")) == (inputs["prompt"], inputs["model"])
+
+
+def annotate_file_atoms(project_slug: str, filename: str, atoms: List[dict],
+                        batch_size: int = ANNOTATE_BATCH_SIZE,
+                        max_workers: int = ANNOTATE_MAX_CONCURRENCY) -> List[dict]:
+    """
+    Annotate a file's atoms, reusing every atom already annotated with the same text.
+    Results are checkpointed per atom, so an interrupted run resumes where it stopped.
+    If any atom fails, the file is written but not fingerprinted or shared, and the
+    next run retries only the failed atoms.
+    """
+    annotated_path = get_annotated_path(project_slug, filename)
+    logger.info("Annotate path: %s", annotated_path)
+    inputs = {"atoms": lineage.content_hash(atoms), "prompt": ANNOTATE_PROMPT_VERSION, "model": cached_model.model_name}
+    expected = lineage.fingerprint("annotated", inputs)
+    restore_artifact(project_slug, filename, "annotated", expected)
+    if lineage.is_reusable(project_slug, filename, "annotated", expected):
+        enriched = read_artifact(annotated_path)
+        _merge_into_project(project_slug, filename, enriched)
+        return enriched
+
+    checkpoint = AnnotationCheckpoint(project_slug, filename, f"{inputs['prompt']}:{inputs['model']}")
+    previous = None
+    if os.path.exists(annotated_path):
+        previous = read_artifact(annotated_path)
+        if not checkpoint.exists and _seedable(project_slug, filename, inputs):
+            checkpoint.seed(previous)
+
+    pending = checkpoint.pending(atoms)
+    logger.info("Annotating %d of %d atoms for %s (%d reused)",
+                len(pending), len(atoms), filename, len(atoms) - len(pending))
+    _, report = annotate_atoms_batched(pending, batch_size, max_workers, on_annotated=checkpoint.append)
+
+    empty = {"insights": [], "tags": []}
+    enriched = [{**atom, **(checkpoint.lookup(atom) or empty)} for atom in atoms]
+    if report["failed_atoms"]:
+        # The failed atoms are not in the checkpoint, so the next run picks them up.
+        logger.warning("%d atoms of %s failed to annotate; not fingerprinting the file",
+                       report["failed_atoms"], filename)
+        write_artifact(annotated_path, enriched)
+        lineage.mark_incomplete(project_slug, filename, "annotated", inputs)
+    elif enriched != previous:
+        write_artifact(annotated_path, enriched)
+        lineage.record(project_slug, filename, "annotated", expected, inputs)
+        publish_artifact(project_slug, filename, "annotated")
+    else:
+        lineage.record(project_slug, filename, "annotated", expected, inputs)
+    _merge_into_project(project_slug, filename, enriched)
+    checkpoint.compact(atoms)
+
+    if pending:
+        report.update({
+            "filename": filename,
+            "reused_atoms": len(atoms) - len(pending),
+            # False until a rerun has annotated the atoms that failed.
+            "complete": not report["failed_atoms"],
+            "finished_at": datetime.now().isoformat(),
+        })
+        atomic_write_json(get_annotation_report_path(project_slug, filename), report, indent=2)
+        logger.info("Annotated %s: %d atoms in %d calls (%d saved), %.1fs",
+                    filename, report["atoms"], report["llm_calls"], report["calls_saved"], report["wall_time_seconds"])
+    return enriched
 
 
 @router.post("/atomise")
@@ -219,55 +472,37 @@ async def atomise_file(project_slug: str = Query(...), filename: str = Query(...
     if not filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Must be a PDF file")
 
-    atoms_path = get_atoms_path(project_slug, filename)
-    cleaned_path = get_cleaned_path(project_slug, filename)
-    upload_path = get_upload_path(project_slug, filename)
-    
-    logger.info("Atomise paths: atoms=%s cleaned=%s upload=%s", atoms_path, cleaned_path, upload_path)
-
     try:
-        if os.path.exists(atoms_path):
-            with open(atoms_path, "r", encoding="utf-8") as f:
-                return {"atoms": json.load(f)}
-
-        if os.path.exists(cleaned_path):
-            with open(cleaned_path, "r", encoding="utf-8") as f:
-                clean_text = f.read()
-        elif os.path.exists(upload_path):
-            full_text = extract_text_from_pdf(upload_path)
-            clean_text = run_llm_normalizer(full_text)
-            with open(cleaned_path, "w", encoding="utf-8") as f:
-                f.write(clean_text)
-        else:
-            raise HTTPException(status_code=404, detail=f"Source file not found for project '{project_slug}': {filename}")
-
-        atoms = run_llm_atomiser(clean_text, filename)
-        with open(atoms_path, "w", encoding="utf-8") as f:
-            json.dump(atoms, f, indent=2, ensure_ascii=False)
+        atoms = await run_in_threadpool(atomise_upload, project_slug, filename)
         return {"atoms": atoms}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error("Atomise failed for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/annotate")
-async def annotate_atoms(project_slug: str = Query(...), filename: str = Query(...), atoms: List[dict] = Body(...)):
+async def annotate_atoms(
+    project_slug: str = Query(...),
+    filename: str = Query(...),
+    atoms: List[dict] = Body(...),
+    batch_size: int = Query(ANNOTATE_BATCH_SIZE, ge=1),
+    parallelism: int = Query(ANNOTATE_MAX_CONCURRENCY, ge=1),
+):
     """Annotate atoms and cache the results."""
-    annotated_path = get_annotated_path(project_slug, filename)
-    logger.info("Annotate path: %s", annotated_path)
-
     try:
-        if os.path.exists(annotated_path):
-            with open(annotated_path, "r", encoding="utf-8") as f:
-                enriched = json.load(f)
-        else:
-            enriched = []
-            for atom in atoms:
-                tags = annotate_atom(atom["text"])
-                enriched.append({**atom, **tags})
-            with open(annotated_path, "w", encoding="utf-8") as f:
-                json.dump(enriched, f, indent=2, ensure_ascii=False)
-        return enriched
+        return await run_in_threadpool(annotate_file_atoms, project_slug, filename, atoms, batch_size, parallelism)
     except Exception as e:
         logger.error("Annotate failed for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/annotate/report")
+async def get_annotation_report(project_slug: str = Query(...), filename: str = Query(...)):
+    """Return calls saved, wall time and failed atoms for the last annotation run of a file."""
+    report_path = get_annotation_report_path(project_slug, filename)
+    if not os.path.exists(report_path):
+        raise HTTPException(status_code=404, detail="No annotation report for this file")
+    with open(report_path, "r", encoding="utf-8") as f:
+        return json.load(f)
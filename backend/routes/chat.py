@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
-from chat_assistant import ChatAssistant
+from chat_assistant import get_chat_assistant
 
 router = APIRouter()
 
@@ -16,8 +17,8 @@ async def chat_with_assistant(request: Request):
     if not message or not project_slug:
         raise HTTPException(status_code=400, detail="message and project_slug required")
 
-    assistant = ChatAssistant(project_slug)
-    return assistant.process_message(message, context)
+    assistant = get_chat_assistant(project_slug)
+    return await run_in_threadpool(assistant.process_message, message, context)
 
 
 @router.get("/chat/history")
@@ -25,5 +26,5 @@ async def get_chat_history(project_slug: str = None):
     """Get chat conversation history."""
     if not project_slug:
         raise HTTPException(status_code=400, detail="project_slug query param required")
-    assistant = ChatAssistant(project_slug)
-    return assistant.get_conversation_summary()
+    assistant = get_chat_assistant(project_slug)
+    return await run_in_threadpool(assistant.get_conversation_summary)
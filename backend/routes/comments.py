@@ -1,13 +1,12 @@
-import os
-import json
 import logging
 from datetime import datetime
 from typing import Dict, Optional, List
 
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from paths import get_comments_path
+from comment_store import get_comment_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -35,24 +34,17 @@ class CommentResponse(BaseModel):
 
 
 def load_comments(project_slug: str, filename: str) -> Dict:
-    comments_file = get_comments_path(project_slug, filename)
-    if os.path.exists(comments_file):
-        with open(comments_file, "r") as f:
-            return json.load(f)
-    return {"comments": {}, "metadata": {"filename": filename, "created": datetime.now().isoformat()}}
-
-
-def save_comments(project_slug: str, filename: str, comments_data: Dict) -> None:
-    comments_file = get_comments_path(project_slug, filename)
-    comments_data["metadata"]["updated"] = datetime.now().isoformat()
-    with open(comments_file, "w") as f:
-        json.dump(comments_data, f, indent=2)
+    return get_comment_store(project_slug, filename).snapshot()
 
 
 @router.get("/comments")
-async def get_comments(project_slug: str = Query(...), filename: str = Query(...)):
+async def get_comments(project_slug: str = Query(...), filename: str = Query(...),
+                       exchange_id: Optional[int] = Query(None, description="Only this exchange's comments")):
     try:
-        return load_comments(project_slug, filename)
+        # The store reads, locks and fsyncs files; keep that off the event loop.
+        if exchange_id is not None:
+            return await run_in_threadpool(lambda: get_comment_store(project_slug, filename).exchange(str(exchange_id)))
+        return await run_in_threadpool(load_comments, project_slug, filename)
     except Exception as e:
         logger.error("Failed to load comments for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=f"Failed to load comments: {str(e)}")
@@ -61,15 +53,14 @@ async def get_comments(project_slug: str = Query(...), filename: str = Query(...
 @router.post("/comments")
 async def add_comment(request: CommentRequest, project_slug: str = Query(...), filename: str = Query(...)) -> CommentResponse:
     try:
-        comments_data = load_comments(project_slug, filename)
         exchange_id = str(request.exchangeId)
-        if exchange_id not in comments_data["comments"]:
-            comments_data["comments"][exchange_id] = []
         comment_dict = request.comment.dict()
         comment_dict["created"] = datetime.now().isoformat()
-        comments_data["comments"][exchange_id].append(comment_dict)
-        save_comments(project_slug, filename, comments_data)
+        if not await run_in_threadpool(lambda: get_comment_store(project_slug, filename).add(exchange_id, comment_dict)):
+            raise HTTPException(status_code=409, detail=f"Comment {request.comment.id} already exists")
         return CommentResponse(success=True, message="Comment added successfully")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Failed to save comment for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=f"Failed to save comment: {str(e)}")
@@ -78,17 +69,8 @@ async def add_comment(request: CommentRequest, project_slug: str = Query(...), f
 @router.delete("/comments/{comment_id}")
 async def delete_comment(comment_id: int, project_slug: str = Query(...), filename: str = Query(...)) -> CommentResponse:
     try:
-        comments_data = load_comments(project_slug, filename)
-        found = False
-        for exchange_id, comments_list in comments_data["comments"].items():
-            original_length = len(comments_list)
-            comments_data["comments"][exchange_id] = [c for c in comments_list if c["id"] != comment_id]
-            if len(comments_data["comments"][exchange_id]) != original_length:
-                found = True
-        if not found:
+        if not await run_in_threadpool(lambda: get_comment_store(project_slug, filename).delete(comment_id)):
             raise HTTPException(status_code=404, detail="Comment not found")
-        comments_data["comments"] = {k: v for k, v in comments_data["comments"].items() if v}
-        save_comments(project_slug, filename, comments_data)
         return CommentResponse(success=True, message="Comment deleted successfully")
     except HTTPException:
         raise
@@ -100,7 +82,7 @@ async def delete_comment(comment_id: int, project_slug: str = Query(...), filena
 @router.get("/comments/export")
 async def export_comments(project_slug: str = Query(...), filename: str = Query(...)):
     try:
-        comments_data = load_comments(project_slug, filename)
+        comments_data = await run_in_threadpool(load_comments, project_slug, filename)
         synthesis_format = {
             "filename": filename,
             "total_comments": sum(len(comments) for comments in comments_data["comments"].values()),
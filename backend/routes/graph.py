@@ -1,12 +1,22 @@
 import os
 import json
 import logging
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException, Body, Query
+from starlette.concurrency import run_in_threadpool
 
-from llm import gemini_model
+from llm import cached_model
 from paths import get_graph_path
+from content_store import publish_artifact, restore_artifact
+import lineage
+from graph_builder import GRAPH_MAX_DEGREE, MIN_EDGE_WEIGHT, build_edges, build_weighted_edges
+from graph_format import GRAPH_FORMAT, read_graph, write_graph
+from semantic_edges import DEFAULT_THRESHOLD, DEFAULT_TOP_K, infer_semantic_edges, semantic_edges_available
+from project_graph import load_project_graph, rebuild_project_graph
+from theme_clustering import MAX_THEMES, cluster_atoms_locally, rename_themes
+from node_styles import style_nodes
+from theme_hierarchy import THEME_CLUSTER_PROMPT, THEME_MAP_BATCH_SIZE, cluster_atoms_hierarchically
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -14,71 +24,171 @@ logger = logging.getLogger(__name__)
 GRAPH_BUILDER_PROMPT = """You are an insight-web v2 architect.\n\nInput: list of annotated atoms (with insights array).\n\nGoals\n1. Exact edges: keep \"shared label\" edges (weight = min weight ≥ 0.7).\n2. Inference edges: create \"inferred_<type>\" edge when two atoms have semantically related insights (e.g., \"login friction\" ≈ \"wrong password\"); weight = average of the two insight weights, threshold ≥ 0.75.\n3. Auto-themes: group atoms into named themes (≤ 3 words) if ≥ 3 atoms share dominant insight patterns.\n4. Auto-journey: create lightweight \"as-is\" journey by ordering atoms chronologically and tagging each step with dominant pain + emotion.\n\nOutput JSON:\n{\n  \"nodes\": [...],\n  \"edges\": [...],\n  \"clusters\": {...},\n  \"themes\": [\n    {\"name\": \"login friction\", \"atoms\": [...], \"dominant_insights\": {\"pain\": \"login friction\", \"emotion\": \"frustration\"}, \"pain_score\": 0.95}\n  ],\n  \"journey\": [\n    {\"step\": \"login attempt\", \"pain\": \"wrong password\", \"emotion\": \"frustration\", \"atoms\": [...]}\n  ],\n  \"facets\": [...],\n  \"summary\": \"...\"\n}\n\nRules\n- Exact edge: same label, both weights ≥ 0.7.  \n- Inference edge: semantic similarity ≥ 0.75.  \n- Theme: ≥ 3 atoms.  \n- Journey: keep chronological order.  \n\nReturn strict JSON only."""
 
 
-def find_shared_insights(node1: dict, node2: dict) -> List[tuple]:
-    """Return intersection of (type, label) insight pairs between two nodes."""
-    set1 = {(i["type"], i["label"]) for i in node1.get("insights", [])}
-    set2 = {(i["type"], i["label"]) for i in node2.get("insights", [])}
-    return list(set1 & set2)
+def build_file_graph(project_slug: str, filename: str, atoms: List[dict],
+                     max_edges_per_label: Optional[int] = None,
+                     infer_edges: bool = False,
+                     infer_threshold: float = DEFAULT_THRESHOLD,
+                     infer_top_k: int = DEFAULT_TOP_K,
+                     scoring: str = "uniform",
+                     min_weight: float = MIN_EDGE_WEIGHT,
+                     max_degree: int = GRAPH_MAX_DEGREE) -> dict:
+    """
+    Build the shared-insight graph for a file's atoms and cache it. scoring="weighted"
+    scores edges from insight weights and caps node degree (0 = no cap); "uniform"
+    links every pair sharing an insight with weight 1.
+    """
+    graph_path = get_graph_path(project_slug, filename)
+    logger.info("Graph path: %s", graph_path)
+    inputs = {
+        "atoms": lineage.content_hash(atoms),
+        "format": GRAPH_FORMAT,
+        "params": {
+            "max_edges_per_label": max_edges_per_label, "infer_edges": infer_edges,
+            "infer_threshold": infer_threshold, "infer_top_k": infer_top_k,
+            "scoring": scoring, "min_weight": min_weight, "max_degree": max_degree,
+        },
+    }
+    expected = lineage.fingerprint("graph", inputs)
+    restore_artifact(project_slug, filename, "graph", expected)
+    if lineage.is_reusable(project_slug, filename, "graph", expected):
+        return read_graph(graph_path, project_slug, filename, atoms)
+
+    nodes = atoms
+    if scoring == "uniform":
+        edges = build_edges(nodes, max_edges_per_label)
+    else:
+        edges = build_weighted_edges(nodes, min_weight, max_degree or None, max_edges_per_label)
+    if infer_edges:
+        edges += infer_semantic_edges(nodes, infer_threshold, infer_top_k)
+
+    graph = {
+        "nodes": nodes,
+        "edges": edges,
+        "clusters": {},
+        "facets": [],
+        "themes": [],
+        "nodes_desc": "List of every atom.",
+        "edges_desc": "Links between atoms sharing high-weight insights.",
+        "clusters_desc": "Auto-groups per insight label (≥ 2 atoms).",
+    }
+
+    write_graph(graph_path, graph, project_slug, filename)
+    lineage.record(project_slug, filename, "graph", expected, inputs)
+    publish_artifact(project_slug, filename, "graph")
+    return graph
 
 
 @router.post("/graph")
-async def build_graph(project_slug: str = Query(...), filename: str = Query(...), atoms: List[dict] = Body(...)):
-    graph_path = get_graph_path(project_slug, filename)
-    logger.info("Graph path: %s", graph_path)
+async def build_graph(
+    project_slug: str = Query(...),
+    filename: str = Query(...),
+    atoms: List[dict] = Body(...),
+    max_edges_per_label: Optional[int] = Query(None, ge=1),
+    infer_edges: bool = Query(False, description="Add local inferred_<type> edges between related insights"),
+    infer_threshold: float = Query(DEFAULT_THRESHOLD, ge=0.0, le=1.0),
+    infer_top_k: int = Query(DEFAULT_TOP_K, ge=1),
+    scoring: str = Query("uniform", description="'weighted' scores edges from insight weights; 'uniform' gives every shared-insight pair weight 1"),
+    min_weight: float = Query(MIN_EDGE_WEIGHT, ge=0.0, le=1.0),
+    max_degree: int = Query(GRAPH_MAX_DEGREE, ge=0, description="Most edges per atom with weighted scoring; 0 keeps all"),
+):
+    if scoring not in ("weighted", "uniform"):
+        raise HTTPException(status_code=400, detail="scoring must be 'weighted' or 'uniform'")
+    if infer_edges and not semantic_edges_available():
+        raise HTTPException(status_code=501, detail="Semantic edge inference needs numpy and scipy installed")
     try:
-        if os.path.exists(graph_path):
-            with open(graph_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-
-        nodes = atoms
-        edges = []
-        for i in range(len(nodes)):
-            for j in range(i + 1, len(nodes)):
-                shared = find_shared_insights(nodes[i], nodes[j])
-                if shared:
-                    label, _ = shared[0]
-                    edges.append({
-                        "source": nodes[i]["id"],
-                        "target": nodes[j]["id"],
-                        "label": label,
-                        "weight": 1,
-                    })
-
-        graph = {
-            "nodes": nodes,
-            "edges": edges,
-            "clusters": {},
-            "facets": [],
-            "themes": [],
-            "nodes_desc": "List of every atom.",
-            "edges_desc": "Links between atoms sharing high-weight insights.",
-            "clusters_desc": "Auto-groups per insight label (≥ 2 atoms).",
-        }
-
-        with open(graph_path, "w", encoding="utf-8") as f:
-            json.dump(graph, f, indent=2, ensure_ascii=False)
-        return graph
+        return await run_in_threadpool(
+            build_file_graph, project_slug, filename, atoms,
+            max_edges_per_label, infer_edges, infer_threshold, infer_top_k,
+            scoring, min_weight, max_degree,
+        )
     except Exception as e:
         logger.error("Graph build failed for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-THEME_CLUSTER_PROMPT = '''You are a UX research theme clustering assistant.\n\nInput: a list of annotated atoms, each with speaker, text, insights, and tags.\n\nYour task:\n- Cluster the atoms into 3-8 high-level themes.\n- Each theme should have:\n  - a short, descriptive name (≤4 words)\n  - a 1-2 sentence summary\n  - a list of atom IDs belonging to the theme\n- Do not create overlapping themes.\n- Every atom must belong to exactly one theme.\n- Use only the information in the atoms and their annotations.\n\nReturn strict JSON:\n[\n  {\n    "name": "Theme name",\n    "summary": "Short summary of the theme.",\n    "atom_ids": ["uuid1", "uuid2", ...]\n  },\n  ...\n]\n\nHere are the annotated atoms:\n{atoms}\n'''
+@router.get("/project-graph")
+async def get_project_graph(project_slug: str = Query(...)):
+    """Return the graph merged across every transcript in the project."""
+    return await run_in_threadpool(lambda: load_project_graph(project_slug).to_dict())
+
+
+@router.post("/project-graph/rebuild")
+async def rebuild_graph_for_project(project_slug: str = Query(...)):
+    """Recreate the project graph from every file's annotated atoms."""
+    try:
+        return await run_in_threadpool(rebuild_project_graph, project_slug)
+    except Exception as e:
+        logger.error("Project graph rebuild failed for %s: %s", project_slug, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Above this many atoms, mode=llm switches to batched map-reduce clustering.
+THEME_SINGLE_PROMPT_MAX_ATOMS = int(os.getenv("THEME_SINGLE_PROMPT_MAX_ATOMS", "200"))
+
+
+def _parse_themes(raw: str):
+    raw = raw.strip()
+    if raw.startswith("```json"):
+        raw = raw[len("```json"):].strip()
+    if raw.endswith("```"):
+        raw = raw[:-3].strip()
+    return json.loads(raw)
+
+
+def _parse_theme_list(raw: str) -> list:
+    """The themes in a clustering reply; raises unless it is a JSON list of objects."""
+    themes = _parse_themes(raw)
+    if not isinstance(themes, list) or not all(isinstance(theme, dict) for theme in themes):
+        raise ValueError("Expected a JSON list of themes")
+    return themes
+
+
+def _parse_renamed_themes(raw: str) -> list:
+    """The themes in a rename_themes reply; each needs an integer index and a name."""
+    themes = _parse_theme_list(raw)
+    for theme in themes:
+        int(theme["index"])
+        if not isinstance(theme.get("name"), str):
+            raise ValueError("Expected a name for every renamed theme")
+    return themes
+
+
+def _generate_theme_text(prompt: str, refresh: bool = False, validate=_parse_theme_list) -> str:
+    return cached_model.generate_content(prompt, stage="themes", refresh=refresh, validate=validate).text
+
+
+def _generate_theme_names(prompt: str) -> str:
+    return _generate_theme_text(prompt, validate=_parse_renamed_themes)
 
 
 @router.post("/themes/initial")
-async def generate_initial_themes(atoms: List[dict]):
+async def generate_initial_themes(
+    atoms: List[dict],
+    mode: str = Query("llm", description="'llm' asks the model to cluster (batched for large inputs); 'hierarchical' always batches; 'local' clusters deterministically from the insight labels"),
+    rename: bool = Query(False, description="With mode=local, ask the LLM to rename the finished themes"),
+    max_themes: int = Query(MAX_THEMES, ge=1),
+    project_slug: Optional[str] = Query(None, description="Save hierarchical progress under this project so a failed run resumes"),
+    batch_size: int = Query(THEME_MAP_BATCH_SIZE, ge=1),
+):
+    if mode not in ("llm", "hierarchical", "local"):
+        raise HTTPException(status_code=400, detail="mode must be 'llm', 'hierarchical' or 'local'")
+    if mode == "hierarchical" or (mode == "llm" and len(atoms) > THEME_SINGLE_PROMPT_MAX_ATOMS):
+        try:
+            return await run_in_threadpool(cluster_atoms_hierarchically, atoms, _generate_theme_text, project_slug, batch_size)
+        except Exception as e:
+            logger.error("Hierarchical theme clustering error: %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+    if mode == "local":
+        themes = await run_in_threadpool(cluster_atoms_locally, atoms, max_themes)
+        if rename and themes:
+            themes = await run_in_threadpool(rename_themes, themes, atoms, _generate_theme_names)
+        return themes
+
     prompt = THEME_CLUSTER_PROMPT.replace("{atoms}", json.dumps(atoms, ensure_ascii=False))
     try:
-        response = gemini_model.generate_content(prompt)
-        raw = response.text.strip()
-        logger.info("GEMINI RAW RESPONSE (Themer V1): %s", repr(raw))
-        if raw.startswith("```json"):
-            raw = raw[len("```json"):].strip()
-        if raw.endswith("```"):
-            raw = raw[:-3].strip()
-        themes = json.loads(raw)
-        return themes
+        response = await run_in_threadpool(cached_model.generate_content, prompt, stage="themes", validate=_parse_themes)
+        logger.info("GEMINI RAW RESPONSE (Themer V1): %s", repr(response.text.strip()))
+        return _parse_themes(response.text)
     except Exception as e:
         logger.error("Theme clustering error: %s", e)
         return []
@@ -89,26 +199,8 @@ async def enhance_graph(request: dict):
     nodes = request.get("nodes", [])
     if not nodes:
         return []
-    prompt = '''\
-Analyze these user research insights and assign each one:
-1. A color (hex code) - red for pain points, green for positive behaviors, blue for technical issues, orange for comparisons, purple for emotions
-2. An emoji icon that represents the content
-3. A short 1-2 word label that captures the essence
-4. A category (pain, behavior, technical, comparison, emotion, other)
-
-Return JSON array with: [{"id": "...", "color": "#ff4757", "icon": "😤", "label": "frustration", "category": "pain"}]
-
-Insights: {insights}
-'''.replace("{insights}", json.dumps(nodes, ensure_ascii=False))
     try:
-        response = gemini_model.generate_content(prompt)
-        raw = response.text.strip()
-        if raw.startswith("```json"):
-            raw = raw[len("```json"):].strip()
-        if raw.endswith("```"):
-            raw = raw[:-3].strip()
-        styled_nodes = json.loads(raw)
-        return styled_nodes
+        return await run_in_threadpool(style_nodes, nodes)
     except Exception as e:
-        print("enhance_graph error:", e)
+        logger.error("enhance_graph error: %s", e)
         return []
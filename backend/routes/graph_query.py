@@ -0,0 +1,103 @@
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Body
+from starlette.concurrency import run_in_threadpool
+
+from graph_index import GraphIndex, load_graph_index
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+async def _index(project_slug: str, filename: Optional[str]) -> GraphIndex:
+    """Load (or reuse) the index for a file's graph, or the project graph without a filename."""
+    index = await run_in_threadpool(load_graph_index, project_slug, filename)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Graph not built yet")
+    return index
+
+
+@router.get("/graph/query/neighbourhood")
+async def query_neighbourhood(
+    project_slug: str = Query(...),
+    atom_id: str = Query(...),
+    filename: Optional[str] = Query(None),
+    hops: int = Query(1, ge=1, le=5),
+    max_nodes: int = Query(500, ge=1),
+):
+    """Atoms within `hops` edges of an atom, with the edges between them."""
+    index = await _index(project_slug, filename)
+    result = index.neighbourhood(atom_id, hops, max_nodes)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Atom '{atom_id}' not in graph")
+    return result
+
+
+@router.get("/graph/query/top-edges")
+async def query_top_edges(
+    project_slug: str = Query(...),
+    filename: Optional[str] = Query(None),
+    n: int = Query(100, ge=1),
+    edge_label: Optional[str] = Query(None),
+):
+    """The heaviest edges and the atoms they connect."""
+    index = await _index(project_slug, filename)
+    return index.top_edges(n, edge_label)
+
+
+@router.get("/graph/query/subgraph")
+async def query_subgraph(
+    project_slug: str = Query(...),
+    filename: Optional[str] = Query(None),
+    label: Optional[str] = Query(None, description="Insight label, e.g. 'login friction'"),
+    theme: Optional[str] = Query(None, description="Name of a theme stored with the graph"),
+    max_edges: Optional[int] = Query(None, ge=1),
+):
+    """Atoms carrying an insight label, or belonging to a stored theme, and the edges among them."""
+    if (label is None) == (theme is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of label or theme")
+    index = await _index(project_slug, filename)
+    if label is not None:
+        return index.label_subgraph(label, max_edges)
+    atom_ids = index.theme_atom_ids(theme)
+    if atom_ids is None:
+        raise HTTPException(status_code=404, detail=f"Theme '{theme}' not in graph")
+    return index.atoms_subgraph(atom_ids, max_edges)
+
+
+@router.post("/graph/query/subgraph")
+async def query_atoms_subgraph(
+    project_slug: str = Query(...),
+    filename: Optional[str] = Query(None),
+    atom_ids: List[str] = Body(...),
+    max_edges: Optional[int] = Query(None, ge=1),
+):
+    """Subgraph on the given atoms, e.g. the atom_ids of a theme from /themes/initial."""
+    index = await _index(project_slug, filename)
+    return index.atoms_subgraph(atom_ids, max_edges)
+
+
+@router.get("/graph/query/nodes")
+async def query_nodes(
+    project_slug: str = Query(...),
+    filename: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """One page of the graph's nodes."""
+    index = await _index(project_slug, filename)
+    return index.page_nodes(offset, limit)
+
+
+@router.get("/graph/query/edges")
+async def query_edges(
+    project_slug: str = Query(...),
+    filename: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    edge_label: Optional[str] = Query(None),
+):
+    """One page of the graph's edges, optionally of one label."""
+    index = await _index(project_slug, filename)
+    return index.page_edges(offset, limit, edge_label)
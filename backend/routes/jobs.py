@@ -0,0 +1,90 @@
+import json
+import asyncio
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import StreamingResponse
+
+from jobs import job_manager, TERMINAL_STATUSES
+from shared_utils import normalize_upload
+from routes.atoms import atomise_upload, annotate_file_atoms
+from routes.graph import build_file_graph
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+JOB_EVENT_POLL_SECONDS = 0.5
+
+job_manager.register("normalize", lambda slug, filename, payload: {"content": normalize_upload(slug, filename)})
+job_manager.register("atomise", lambda slug, filename, payload: {"atoms": atomise_upload(slug, filename)})
+job_manager.register("annotate", lambda slug, filename, payload: annotate_file_atoms(slug, filename, payload["atoms"]))
+job_manager.register("graph", lambda slug, filename, payload: build_file_graph(slug, filename, payload["atoms"]))
+
+# Stages that need the caller's atoms in the request body.
+ATOM_STAGES = ("annotate", "graph")
+
+
+@router.post("/jobs/{stage}")
+async def submit_job(
+    stage: str,
+    project_slug: str = Query(...),
+    filename: str = Query(...),
+    atoms: Optional[List[dict]] = Body(None),
+):
+    """Queue a pipeline stage for a file and return its job id straight away."""
+    if stage not in job_manager.stages:
+        raise HTTPException(status_code=400, detail=f"Unknown stage '{stage}'. Expected one of: {', '.join(job_manager.stages)}")
+    if stage in ATOM_STAGES and atoms is None:
+        raise HTTPException(status_code=400, detail=f"Stage '{stage}' needs a list of atoms in the request body")
+    if stage not in ATOM_STAGES and not filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Must be a PDF file")
+
+    payload = {"atoms": atoms} if stage in ATOM_STAGES else {}
+    job = job_manager.submit(project_slug, stage, filename, payload)
+    return job.summary()
+
+
+@router.get("/jobs")
+async def list_jobs(project_slug: str = Query(...)):
+    """List the jobs recorded for a project, newest first."""
+    return {"jobs": [job.summary() for job in job_manager.list_jobs(project_slug)]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, project_slug: str = Query(...), include_result: bool = Query(True)):
+    """Poll a job's status; finished jobs include their result."""
+    job = job_manager.get(project_slug, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    data = job.summary()
+    if include_result and job.status in TERMINAL_STATUSES:
+        data["result"] = job.result
+    return data
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, project_slug: str = Query(...)):
+    """Server-sent events: one message per status change, ending when the job finishes."""
+    if not job_manager.get(project_slug, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        while True:
+            job = job_manager.get(project_slug, job_id)
+            if job is None:
+                # The job's file was deleted (e.g. with its project); nothing more will happen.
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job not found'})}\n\n"
+                return
+            if job.status != last_status:
+                last_status = job.status
+                data = job.summary()
+                if job.status in TERMINAL_STATUSES:
+                    data["result"] = job.result
+                yield f"event: status\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if job.status in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
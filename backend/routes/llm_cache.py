@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from llm import cached_model
+
+router = APIRouter(prefix="/llm/cache", tags=["llm"])
+
+
+@router.get("/stats")
+async def get_llm_cache_stats():
+    """Return entry count, size and hit/miss counters for the LLM response cache."""
+    return {"enabled": cached_model.enabled, "disabled_stages": sorted(cached_model.disabled_stages),
+            **cached_model.cache.stats()}
+
+
+@router.delete("")
+async def clear_llm_cache():
+    """Drop every cached LLM response."""
+    cached_model.cache.clear()
+    return {"ok": True}
@@ -1,4 +1,3 @@
-import json
 import logging
 from typing import List, Dict, Any
 
@@ -7,6 +6,7 @@ from pydantic import BaseModel
 
 from quality_guard import QualityGuard
 from paths import get_quality_report_path
+from persistence import atomic_write_json
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -32,8 +32,7 @@ async def run_quality_validation(request: QualityGuardRequest = Body(...)):
 
         # Save the validation report to the project's quality directory
         report_path = get_quality_report_path(request.project_slug)
-        with open(report_path, 'w', encoding='utf-8') as f:
-            json.dump(validation_report, f, indent=2, default=str)
+        atomic_write_json(report_path, validation_report, indent=2, default=str)
         
         logger.info(f"Quality report for {request.project_slug} saved to {report_path}")
         return validation_report
@@ -1,20 +1,30 @@
 import os
 import shutil
-import json
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from fastapi.responses import PlainTextResponse, JSONResponse
+from typing import Literal, Optional
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from paths import (
-    DATA_DIR,
-    get_upload_path,
     get_cleaned_path,
     get_atoms_path,
     get_annotated_path,
     get_graph_path,
-    get_project_path
+    get_project_path,
+    get_annotation_checkpoint_path,
+    get_annotation_report_path,
+    get_comments_path,
+    get_comment_log_path,
 )
-from shared_utils import run_llm_normalizer, extract_text_from_pdf
+from shared_utils import normalize_upload
+from content_store import store_upload, add_upload, remove_upload
+from project_graph import remove_file_from_project
+from graph_format import read_graph
+from artifact_serving import content_etag, file_response, not_modified
+from project_index import ensure_project_index, rebuild_project_index, remove_project
+from chat_assistant import forget_chat_assistant
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -22,83 +32,71 @@ logger = logging.getLogger(__name__)
 @router.post("/upload")
 async def upload_pdfs(project_slug: str = Query(...), files: list[UploadFile] = File(...)):
     saved_files: list[str] = []
+    reused: dict[str, list[str]] = {}
     for file in files:
         try:
-            file_path = get_upload_path(project_slug, file.filename)
-            logger.info("Saving upload to %s", os.path.abspath(file_path))
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            content_hash = await run_in_threadpool(store_upload, file.file)
+            changed, reused_stages = await run_in_threadpool(add_upload, project_slug, file.filename, content_hash)
+            logger.info("Saved upload %s as content %s", file.filename, content_hash[:12])
+            if changed:
+                logger.info("Upload %s replaced different content; dropped its cached stages", file.filename)
+            if reused_stages:
+                reused[file.filename] = reused_stages
             saved_files.append(file.filename)
         except Exception as e:
             logger.error("Error saving %s: %s", file.filename, e)
             raise HTTPException(status_code=500, detail=str(e))
-    return {"message": f"Saved {len(saved_files)} file(s)", "files": saved_files}
+    return {"message": f"Saved {len(saved_files)} file(s)", "files": saved_files, "reused": reused}
 
 
 @router.post("/normalize")
 async def normalize_file(project_slug: str = Query(...), filename: str = Query(...)):
     if not filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Must be a PDF file")
-    
-    cleaned_path = get_cleaned_path(project_slug, filename)
-    logger.info("Resolved cleaned path: %s", os.path.abspath(cleaned_path))
-    if os.path.exists(cleaned_path):
-        with open(cleaned_path, "r", encoding="utf-8") as f:
-            return {"content": f.read()}
-
-    pdf_path = get_upload_path(project_slug, filename)
-    logger.info("Resolved upload path: %s", os.path.abspath(pdf_path))
-    if not os.path.exists(pdf_path):
-        raise HTTPException(status_code=404, detail=f"File '{filename}' not found in project '{project_slug}'")
 
     try:
-        raw_text = extract_text_from_pdf(pdf_path)
-        cleaned_text = run_llm_normalizer(raw_text)
-        with open(cleaned_path, "w", encoding="utf-8") as f:
-            f.write(cleaned_text)
+        cleaned_text = await run_in_threadpool(normalize_upload, project_slug, filename)
         return {"content": cleaned_text}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error("Normalization failed for %s: %s", filename, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/projects")
-async def list_projects():
-    """Return information about projects and their files."""
-    projects = {}
-    if not os.path.exists(DATA_DIR):
-        return {}
-
-    for project_slug in os.listdir(DATA_DIR):
-        project_path = get_project_path(project_slug)
-        if not os.path.isdir(project_path):
-            continue
-
-        upload_path = os.path.join(project_path, 'uploads')
-        if not os.path.exists(upload_path):
-            continue
-
-        files_in_project = {}
-        for filename in os.listdir(upload_path):
-            if not filename.lower().endswith(".pdf"):
-                continue
-            
-            files_in_project[filename] = {
-                "cleaned": os.path.exists(get_cleaned_path(project_slug, filename)),
-                "atoms": os.path.exists(get_atoms_path(project_slug, filename)),
-                "annotated": os.path.exists(get_annotated_path(project_slug, filename)),
-                "graph": os.path.exists(get_graph_path(project_slug, filename)),
-            }
-        if files_in_project:
-            projects[project_slug] = files_in_project
-
-    logger.info("Projects listed: %s", list(projects.keys()))
+async def list_projects(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Projects per page; all of them when omitted"),
+    stage: Optional[Literal["cleaned", "atoms", "annotated", "graph"]] = Query(None),
+    done: Optional[bool] = Query(None, description="With stage: list only files whose stage is (or is not) done"),
+):
+    """Return information about projects and their files, read from the project index."""
+    if (stage is None) != (done is None):
+        raise HTTPException(status_code=400, detail="stage and done must be given together")
+
+    def read_page():
+        return ensure_project_index().list_projects(offset, limit, stage, done)
+
+    projects, total = await run_in_threadpool(read_page)
+    response.headers["X-Total-Count"] = str(total)
     return projects
 
 
+@router.post("/projects/index/rebuild")
+async def rebuild_index():
+    """Recreate the project index from the files on disk, e.g. after editing DATA_DIR by hand."""
+    try:
+        return await run_in_threadpool(rebuild_project_index)
+    except Exception as e:
+        logger.error("Project index rebuild failed: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/cached/{stage}/{filename}")
-async def get_cached(stage: str, filename: str, project_slug: str = Query(...)):
-    """Return cached results for a file if available."""
+async def get_cached(request: Request, stage: str, filename: str, project_slug: str = Query(...)):
+    """Return cached results for a file if available, straight from disk and revalidated by ETag."""
     paths = {
         "cleaned": get_cleaned_path(project_slug, filename),
         "atoms": get_atoms_path(project_slug, filename),
@@ -109,11 +107,48 @@ async def get_cached(stage: str, filename: str, project_slug: str = Query(...)):
     if not path or not os.path.exists(path):
         logger.error("Cache miss for project=%s, stage=%s, filename=%s", project_slug, stage, filename)
         raise HTTPException(status_code=404, detail="not cached")
-    
+
     logger.info("Returning cached %s from %s", stage, os.path.abspath(path))
-    if stage == "cleaned":
-        return PlainTextResponse(open(path, encoding="utf-8").read())
-    return JSONResponse(json.load(open(path, encoding="utf-8")))
+    if stage == "graph":
+        # Stored compact with node payloads in the annotated file, so both make up its version.
+        etag = await run_in_threadpool(content_etag, path, paths["annotated"])
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        graph = await run_in_threadpool(read_graph, path, project_slug, filename)
+        return JSONResponse(graph, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    media_type = "text/plain; charset=utf-8" if stage == "cleaned" else "application/json"
+    return await run_in_threadpool(file_response, request, path, media_type)
+
+
+@router.delete("/files/{filename}")
+async def delete_file(filename: str, project_slug: str = Query(...)):
+    """Delete one transcript and everything derived from it within a project."""
+    def remove_files():
+        removed = remove_upload(project_slug, filename)
+        for path in (
+            get_annotation_checkpoint_path(project_slug, filename),
+            get_annotation_report_path(project_slug, filename),
+            get_comments_path(project_slug, filename),
+            get_comment_log_path(project_slug, filename),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        return removed
+
+    try:
+        removed = await run_in_threadpool(remove_files)
+        if not removed:
+            raise HTTPException(status_code=404, detail=f"File '{filename}' not found in project '{project_slug}'")
+        nodes_removed = await run_in_threadpool(remove_file_from_project, project_slug, filename)
+        return {"ok": True, "removed": removed, "project_graph_nodes_removed": nodes_removed}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to delete %s from %s: %s", filename, project_slug, e)
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.delete("/projects/{project_slug}")
@@ -124,6 +159,8 @@ async def delete_project(project_slug: str):
         logger.info("Deleting project directory %s", os.path.abspath(project_path))
         if os.path.exists(project_path) and os.path.isdir(project_path):
             shutil.rmtree(project_path)
+        remove_project(project_slug)
+        forget_chat_assistant(project_slug)
         return {"ok": True, "message": f"Project '{project_slug}' deleted."}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,178 @@
+"""
+Local "inference edges" between atoms with semantically related insights.
+
+GRAPH_BUILDER_PROMPT describes inferred_<type> edges (e.g. "login friction" ~
+"wrong password"). Rather than asking the LLM, this works in two steps:
+1. Distinct insight labels of each type become hashed TF-IDF vectors (words plus
+   character trigrams), and sparse top-k cosine neighbours above the threshold
+   give pairs of related labels.
+2. For each related label pair, atoms carrying one label are ranked against atoms
+   carrying the other by the cosine of their quote vectors, and each atom keeps its
+   top-k partners.
+Similarity matrices are computed one block of rows at a time, so memory stays
+bounded by the block size.
+"""
+
+import re
+import math
+import zlib
+import logging
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ModuleNotFoundError:  # pragma: no cover
+    np = None  # type: ignore
+    sparse = None  # type: ignore
+
+from graph_builder import insight_keys, insight_weight
+
+logger = logging.getLogger(__name__)
+
+HASH_DIMENSIONS = 1 << 18
+# Cosine between label vectors needed before two labels count as related. Hashed
+# TF-IDF is lexical, so this sits below the 0.75 the LLM prompt uses.
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_TOP_K = 5
+BLOCK_SIZE = 512
+# Share of the edge score that comes from label similarity rather than quote similarity.
+LABEL_WEIGHT = 0.7
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def semantic_edges_available() -> bool:
+    """True when numpy and scipy are installed."""
+    return np is not None and sparse is not None
+
+
+def _features(text: str, char_ngrams: bool) -> List[str]:
+    """Word unigrams, plus character trigrams so 'password' and 'passwords' overlap."""
+    features = []
+    for word in TOKEN_RE.findall(text.lower()):
+        features.append(f"w:{word}")
+        if char_ngrams:
+            padded = f"#{word}#"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def vectorize(docs: List[str], char_ngrams: bool = True):
+    """Hashed TF-IDF vectors for `docs`, L2-normalised, as a CSR matrix (rows = docs)."""
+    rows, cols, values = [], [], []
+    doc_freq: Dict[int, int] = {}
+    for row, doc in enumerate(docs):
+        counts: Dict[int, int] = {}
+        for feature in _features(doc, char_ngrams):
+            column = zlib.crc32(feature.encode("utf-8")) % HASH_DIMENSIONS
+            counts[column] = counts.get(column, 0) + 1
+        for column, count in counts.items():
+            rows.append(row)
+            cols.append(column)
+            values.append(1.0 + math.log(count))
+            doc_freq[column] = doc_freq.get(column, 0) + 1
+
+    n_docs = max(len(docs), 1)
+    idf = np.array([math.log((1 + n_docs) / (1 + doc_freq[c])) + 1.0 for c in cols], dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32) * idf, (rows, cols)),
+        shape=(len(docs), HASH_DIMENSIONS),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+def _row_top_k(scores, k: int):
+    """Column indices of the k largest entries in each row of a dense score block."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=int)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def top_k_neighbours(matrix, top_k: int, threshold: float, block_size: int = BLOCK_SIZE) -> List[Tuple[int, int, float]]:
+    """
+    Return (i, j, cosine) with i < j for each row's top-k neighbours at or above
+    `threshold`. Similarities are computed one block of rows at a time.
+    """
+    n_rows = matrix.shape[0]
+    transposed = matrix.T.tocsc()
+    pairs: Dict[Tuple[int, int], float] = {}
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        scores = (matrix[start:stop] @ transposed).toarray()
+        scores[np.arange(stop - start), np.arange(start, stop)] = -1.0
+        for offset, row_candidates in enumerate(_row_top_k(scores, top_k)):
+            i = start + offset
+            for j in row_candidates:
+                score = float(scores[offset, j])
+                if score >= threshold:
+                    key = (min(i, int(j)), max(i, int(j)))
+                    pairs[key] = max(pairs.get(key, 0.0), score)
+    return [(i, j, score) for (i, j), score in sorted(pairs.items())]
+
+
+def infer_semantic_edges(nodes: List[dict], threshold: float = DEFAULT_THRESHOLD,
+                         top_k: int = DEFAULT_TOP_K, block_size: int = BLOCK_SIZE) -> List[dict]:
+    """
+    Emit inferred_<type> edges between atoms whose insight labels of that type are
+    related (label cosine >= threshold) but not identical. Each atom keeps at most
+    top_k partners per related label pair, ranked by quote similarity. Edge weight is
+    the average of the two insight weights; `similarity` is the blended score.
+    """
+    if not semantic_edges_available():
+        raise RuntimeError("Semantic edge inference needs numpy and scipy installed")
+
+    keys = [insight_keys(node) for node in nodes]
+    postings: Dict[str, Dict[str, List[int]]] = {}
+    weights: Dict[Tuple[int, str, str], float] = {}
+    for position, node in enumerate(nodes):
+        for insight in node.get("insights", []):
+            insight_type, label = insight["type"], insight["label"]
+            members = postings.setdefault(insight_type, {}).setdefault(label, [])
+            if not members or members[-1] != position:
+                members.append(position)
+            weights[(position, insight_type, label)] = insight_weight(insight)
+
+    text_vectors = None
+    best: Dict[Tuple[int, int], dict] = {}
+    for insight_type, label_postings in sorted(postings.items()):
+        labels = sorted(label_postings)
+        if len(labels) < 2:
+            continue
+        related = top_k_neighbours(vectorize(labels), top_k, threshold, block_size)
+        if related and text_vectors is None:
+            text_vectors = vectorize([str(node.get("text", "")) for node in nodes], char_ngrams=False)
+
+        for a, b, label_similarity in related:
+            label_a, label_b = labels[a], labels[b]
+            side_a, side_b = label_postings[label_a], label_postings[label_b]
+            vectors_b = text_vectors[side_b].T.tocsc()
+            for start in range(0, len(side_a), block_size):
+                block = side_a[start:start + block_size]
+                text_scores = (text_vectors[block] @ vectors_b).toarray()
+                scores = LABEL_WEIGHT * label_similarity + (1 - LABEL_WEIGHT) * text_scores
+                # Keep each atom's top-k partners from both directions of the block.
+                chosen = {(r, int(c)) for r, row in enumerate(_row_top_k(scores, top_k)) for c in row}
+                chosen |= {(int(r), c) for c, col in enumerate(_row_top_k(scores.T, top_k)) for r in col}
+                for r, c in chosen:
+                    i, j = block[r], side_b[c]
+                    if i == j or any(k[0] == insight_type for k in keys[i] & keys[j]):
+                        continue  # same atom, or already linked by an exact edge of this type
+                    pair = (min(i, j), max(i, j))
+                    score = float(scores[r, c])
+                    if pair in best and best[pair]["similarity"] >= score:
+                        continue
+                    best[pair] = {
+                        "source": nodes[pair[0]]["id"],
+                        "target": nodes[pair[1]]["id"],
+                        "label": f"inferred_{insight_type}",
+                        "weight": round((weights[(i, insight_type, label_a)] + weights[(j, insight_type, label_b)]) / 2, 3),
+                        "similarity": round(score, 3),
+                    }
+
+    edges = [best[pair] for pair in sorted(best)]
+    logger.info("Inferred %d semantic edges across %d atoms", len(edges), len(nodes))
+    return edges
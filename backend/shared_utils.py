@@ -1,6 +1,17 @@
+import os
+import re
 import time
-import fitz
-from llm import gemini_model
+import itertools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from llm import cached_model, llm_rate_limiter
+from pdf_pages import iter_pdf_pages
+from paths import get_cleaned_path, get_upload_path
+from content_store import get_upload_hash, publish_artifact, restore_artifact
+import lineage
+from persistence import atomic_write_text
 
 LLM_PROMPT_NORMALIZER = """You are a senior UX research assistant.
 
@@ -36,20 +47,45 @@ Here is the raw transcript:
 ---
 Return only the cleaned, speaker-separated transcript."""
 
-def run_llm_normalizer(raw_text: str) -> str:
-    """Use Gemini to clean and structure raw transcript text."""
-    if len(raw_text) > 50000:
-        print(f"\u26A0\uFE0F Text very long ({len(raw_text)} chars), truncating to 50k")
-        raw_text = raw_text[:50000] + "\n\n[... text truncated due to length ...]"
-    prompt = LLM_PROMPT_NORMALIZER.replace("{raw_text}", raw_text)
+# Transcripts longer than one chunk are normalized in pieces, concurrently.
+NORMALIZE_CHUNK_CHARS = 12000
+NORMALIZE_OVERLAP_CHARS = 800
+NORMALIZE_MAX_CONCURRENCY = int(os.getenv("NORMALIZE_MAX_CONCURRENCY", "4"))
+
+LLM_PROMPT_NORMALIZER_CHUNK_NOTE = """This is part {part} of a longer transcript. The other parts are cleaned separately and joined afterwards.
+- Speaker labels seen in the raw transcript so far: {speakers}. Keep the same label for the same person; when you assign pseudonyms, continue the numbering consistently.
+"""
+
+# Parts after the first also clean the end of the previous part; comparing the labels
+# both parts gave those turns maps this part's speakers onto the previous part's.
+NORMALIZE_CONTEXT_MARKER = "=== END OF PRECEDING CONTEXT ==="
+LLM_PROMPT_NORMALIZER_CONTEXT_NOTE = """- The "Preceding context" below is the end of the previous part. Clean it too, using the same speaker labels as in this part, and output it first. Then output a line containing only """ + NORMALIZE_CONTEXT_MARKER + """, then the cleaned part.
+
+Preceding context:
+---
+{context}
+---
+"""
+
+# "ERIC:", "Speaker 2:", "AJENA [inferred]:" at the start of a line.
+SPEAKER_LABEL_RE = re.compile(r"^\s*([A-Za-z][\w .'-]{0,40}?)(\s*\[inferred\])?\s*:", re.MULTILINE)
+
+
+def _normalize_prompt(prompt: str, raw_text: str) -> Tuple[str, bool]:
+    """
+    Send one normalizer prompt to Gemini, retrying once and falling back to the raw text.
+    Returns (text, ok); ok is False for the fallback.
+    """
     for attempt in range(2):
         try:
             print(f"\U0001F9E0 Normalizing attempt {attempt + 1}")
-            response = gemini_model.generate_content(prompt)
+            llm_rate_limiter.acquire()
+            response = cached_model.generate_content(prompt, stage="normalize", refresh=attempt > 0,
+                                                     validate=lambda text: len(text.strip()) > 10)
             result = response.text.strip()
             if result and len(result) > 10:
                 print(f"\u2705 Normalization successful ({len(result)} chars)")
-                return result
+                return result, True
             raise ValueError("Normalizer returned empty or very short result")
         except Exception as e:
             print(f"\u274C Normalization error (attempt {attempt + 1}): {e}")
@@ -57,12 +93,274 @@ def run_llm_normalizer(raw_text: str) -> str:
                 time.sleep(1)
                 continue
     print("\U0001F6AB Normalization failed, returning raw text")
-    return f"[Normalization failed - returning raw text]\n\n{raw_text}"
+    return f"[Normalization failed - returning raw text]\n\n{raw_text}", False
+
+
+def _transcript_units(text: str, max_chars: int) -> List[str]:
+    """Split text into paragraphs and speaker turns, hard-splitting any unit longer than max_chars."""
+    units: List[str] = []
+    current: List[str] = []
+    for line in text.split("\n"):
+        if (not line.strip() or SPEAKER_LABEL_RE.match(line)) and current:
+            units.append("\n".join(current))
+            current = []
+        if line.strip():
+            current.append(line)
+    if current:
+        units.append("\n".join(current))
+
+    sized: List[str] = []
+    for unit in units:
+        while len(unit) > max_chars:
+            cut = unit.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sized.append(unit[:cut])
+            unit = unit[cut:].lstrip("\n")
+        sized.append(unit)
+    return sized
+
+
+def _pack_units(units: List[str], max_chars: int) -> List[List[str]]:
+    """Group units greedily into chunks of at most max_chars."""
+    chunks: List[List[str]] = [[]]
+    size = 0
+    for unit in units:
+        if chunks[-1] and size + len(unit) > max_chars:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(unit)
+        size += len(unit) + 2
+    return chunks
+
+
+def _overlap_context(units: List[str], overlap_chars: int) -> str:
+    """The tail of a chunk, whole units up to overlap_chars (or the end of its last unit)."""
+    context_units: List[str] = []
+    for unit in reversed(units):
+        if sum(len(u) for u in context_units) + len(unit) > overlap_chars:
+            break
+        context_units.insert(0, unit)
+    if not context_units:
+        context_units = [units[-1][-overlap_chars:]]
+    return "\n\n".join(context_units)
+
+
+def iter_transcript_chunks(pieces: Iterable[str], max_chars: int = NORMALIZE_CHUNK_CHARS,
+                           overlap_chars: int = NORMALIZE_OVERLAP_CHARS) -> Iterator[Tuple[str, str]]:
+    """
+    Split the concatenation of `pieces` (e.g. PDF pages) on paragraph and speaker
+    boundaries into (context, chunk) pairs, yielding each chunk as soon as enough
+    text after it has arrived. `context` is the tail of the previous chunk (up to
+    overlap_chars), given to the model for speaker continuity only; every unit of
+    the text lands in exactly one chunk.
+    """
+    buffer = ""
+    previous: Optional[List[str]] = None
+
+    def split(final: bool) -> List[List[str]]:
+        nonlocal buffer
+        # Only whole lines are split; the last chunk may still grow, so it goes back in the buffer.
+        cut = len(buffer) if final else buffer.rfind("\n") + 1
+        chunks = _pack_units(_transcript_units(buffer[:cut], max_chars), max_chars)
+        keep = [] if final else chunks.pop()
+        buffer = ("\n\n".join(keep) + "\n" if keep else "") + buffer[cut:]
+        return chunks
+
+    def pairs(chunks: List[List[str]]) -> Iterator[Tuple[str, str]]:
+        nonlocal previous
+        for units in chunks:
+            yield (_overlap_context(previous, overlap_chars) if previous else "", "\n\n".join(units))
+            previous = units
+
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= 2 * max_chars:
+            yield from pairs(split(final=False))
+    yield from pairs(split(final=True))
+
+
+def split_transcript(text: str, max_chars: int = NORMALIZE_CHUNK_CHARS,
+                     overlap_chars: int = NORMALIZE_OVERLAP_CHARS) -> List[Tuple[str, str]]:
+    """All (context, chunk) pairs of a transcript; see iter_transcript_chunks."""
+    return list(iter_transcript_chunks([text], max_chars, overlap_chars))
+
+
+def _count_speakers(text: str, counts: Counter, spellings: Dict[str, str]) -> None:
+    for match in SPEAKER_LABEL_RE.finditer(text):
+        label = match.group(1).strip()
+        key = re.sub(r"\s+", " ", label).lower()
+        spellings.setdefault(key, label)
+        counts[key] += 1
+
+
+def detect_speakers(text: str, limit: int = 12) -> List[str]:
+    """Return the most frequent speaker labels found at the start of lines."""
+    counts: Counter = Counter()
+    spellings: Dict[str, str] = {}
+    _count_speakers(text, counts, spellings)
+    return [spellings[key] for key, _ in counts.most_common(limit)]
+
+
+def _label_key(label: str) -> str:
+    return re.sub(r"\s+", " ", label.strip()).lower()
+
+
+def _rename_speakers(text: str, renames: Dict[str, str]) -> str:
+    """Replace speaker labels by key, keeping any [inferred] marker."""
+    def replace(match: re.Match) -> str:
+        label = match.group(1).strip()
+        new = renames.get(_label_key(label))
+        return match.group(0).replace(label, new, 1) if new and new != label else match.group(0)
+
+    return SPEAKER_LABEL_RE.sub(replace, text) if renames else text
+
+
+def _speaker_turns(text: str) -> List[str]:
+    return [match.group(1).strip() for match in SPEAKER_LABEL_RE.finditer(text)]
+
+
+def reconcile_speakers(parts: List[Tuple[str, str]]) -> List[str]:
+    """
+    Make speaker labels consistent across separately normalized parts. Each part is
+    (cleaned preceding context, cleaned part). The context turns are the previous
+    part's last turns, so pairing their labels from the end says which of this part's
+    labels (e.g. "Speaker 1") is which of the previous part's (e.g. "Speaker 2").
+    A label that would then clash with a different person's gets a new pseudonym.
+    """
+    reconciled: List[str] = []
+    used = set()
+    for i, (context, text) in enumerate(parts):
+        renames: Dict[str, str] = {}
+        context_turns = _speaker_turns(context)
+        if i > 0 and context_turns:
+            previous_turns = _speaker_turns(reconciled[-1])[-len(context_turns):]
+            votes: Dict[str, Counter] = {}
+            for ours, theirs in zip(reversed(context_turns), reversed(previous_turns)):
+                votes.setdefault(_label_key(ours), Counter())[theirs] += 1
+            claimed: Dict[str, Tuple[int, str]] = {}
+            for key, counter in votes.items():
+                target, count = counter.most_common(1)[0]
+                if count * 2 > sum(counter.values()):
+                    target_key = _label_key(target)
+                    if target_key not in claimed or claimed[target_key][0] < count:
+                        claimed[target_key] = (count, key)
+            # Two of our labels can't both become the same person; the better-supported one wins.
+            renames = {key: votes[key].most_common(1)[0][0] for _, key in claimed.values()}
+        targets = {_label_key(target) for target in renames.values()}
+        numbers = [int(m.group(1)) for label in used for m in [re.fullmatch(r"speaker (\d+)", label)] if m]
+        next_number = max(numbers, default=0) + 1
+        for label in dict.fromkeys(_speaker_turns(text)):
+            key = _label_key(label)
+            if key not in renames and key in targets and re.fullmatch(r"speaker \d+", key):
+                # This part's "Speaker 2" is someone else than the person now called "Speaker 2".
+                renames[key] = f"Speaker {next_number}"
+                next_number += 1
+        text = _rename_speakers(text, renames)
+        used.update(_label_key(label) for label in _speaker_turns(text))
+        reconciled.append(text)
+    return reconciled
+
+
+def unify_speaker_labels(text: str) -> str:
+    """Rewrite speaker labels that differ only by case or spacing to their first spelling."""
+    canonical: Dict[str, str] = {}
+
+    def replace(match: re.Match) -> str:
+        label = match.group(1).strip()
+        key = re.sub(r"\s+", " ", label).lower()
+        first = canonical.setdefault(key, label)
+        return match.group(0).replace(label, first, 1) if first != label else match.group(0)
+
+    return SPEAKER_LABEL_RE.sub(replace, text)
+
+
+def normalize_pages(pages: Iterable[str]) -> Tuple[str, bool]:
+    """
+    Clean and structure a transcript arriving in pieces (e.g. PDF pages, as they are
+    extracted). Each chunk goes to Gemini as soon as it is complete, so normalizing
+    overlaps with reading the rest of the file; a short transcript is one prompt.
+    Returns (text, complete); complete is False if any part fell back to raw text.
+    """
+    pages = iter(pages)
+    head: List[str] = []
+    for page in pages:
+        head.append(page)
+        if sum(map(len, head)) > NORMALIZE_CHUNK_CHARS:
+            break
+    else:
+        raw_text = "".join(head)
+        return _normalize_prompt(LLM_PROMPT_NORMALIZER.replace("{raw_text}", raw_text), raw_text)
+
+    def normalize_chunk(part: int, context: str, chunk: str, speakers: str) -> Tuple[str, str, bool]:
+        """Returns (cleaned context, cleaned chunk, ok)."""
+        note = (LLM_PROMPT_NORMALIZER_CHUNK_NOTE
+                .replace("{part}", str(part + 1))
+                .replace("{speakers}", speakers))
+        if context:
+            note += LLM_PROMPT_NORMALIZER_CONTEXT_NOTE.replace("{context}", context)
+        prompt = LLM_PROMPT_NORMALIZER.replace("Here is the raw transcript:", note + "\nHere is the raw transcript:", 1)
+        text, ok = _normalize_prompt(prompt.replace("{raw_text}", chunk), chunk)
+        cleaned_context, marker, cleaned_chunk = text.partition(NORMALIZE_CONTEXT_MARKER)
+        if not (ok and context and marker):
+            return "", text, ok  # no usable context: this part keeps its own labels
+        return cleaned_context.strip(), cleaned_chunk.strip(), ok
+
+    counts: Counter = Counter()
+    spellings: Dict[str, str] = {}
+    futures = []
+    with ThreadPoolExecutor(max_workers=NORMALIZE_MAX_CONCURRENCY) as pool:
+        for part, (context, chunk) in enumerate(iter_transcript_chunks(itertools.chain(head, pages))):
+            _count_speakers(chunk, counts, spellings)
+            speakers = ", ".join(spellings[key] for key, _ in counts.most_common(12)) or "none detected yet"
+            futures.append(pool.submit(normalize_chunk, part, context, chunk, speakers))
+        print(f"\U0001F4CF Text long, normalizing {len(futures)} chunks")
+        results = [future.result() for future in futures]
+    parts = reconcile_speakers([(context, text) for context, text, _ in results])
+    return unify_speaker_labels("\n\n".join(parts)), all(ok for _, _, ok in results)
+
+
+def run_llm_normalizer(raw_text: str) -> str:
+    """Use Gemini to clean and structure raw transcript text, chunking long transcripts."""
+    return normalize_pages([raw_text])[0]
+
 
 def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF using PyMuPDF."""
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text() + "\n"
-    return full_text
+    """Extract text from a PDF using PyMuPDF, one page per line block."""
+    return "".join(f"{text}\n" for text in iter_pdf_pages(pdf_path))
+
+
+# Part of the cleaned stage's fingerprint: editing the prompts or chunking re-normalizes transcripts.
+NORMALIZE_PROMPT_VERSION = lineage.prompt_version(
+    LLM_PROMPT_NORMALIZER, LLM_PROMPT_NORMALIZER_CHUNK_NOTE, LLM_PROMPT_NORMALIZER_CONTEXT_NOTE,
+    str(NORMALIZE_CHUNK_CHARS), str(NORMALIZE_OVERLAP_CHARS),
+)
+
+
+def normalize_upload(project_slug: str, filename: str) -> str:
+    """Return the cleaned transcript for an upload, normalizing and caching it if needed."""
+    cleaned_path = get_cleaned_path(project_slug, filename)
+    inputs = {
+        "upload": get_upload_hash(project_slug, filename),
+        "prompt": NORMALIZE_PROMPT_VERSION,
+        "model": cached_model.model_name,
+    }
+    expected = lineage.fingerprint("cleaned", inputs)
+    restore_artifact(project_slug, filename, "cleaned", expected)
+    if lineage.is_reusable(project_slug, filename, "cleaned", expected, adopt_legacy=True, inputs=inputs):
+        with open(cleaned_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    pdf_path = get_upload_path(project_slug, filename)
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"File '{filename}' not found in project '{project_slug}'")
+
+    # Pages are cleaned chunk by chunk as they come off the extraction pool.
+    cleaned_text, complete = normalize_pages(f"{text}\n" for text in iter_pdf_pages(pdf_path))
+    atomic_write_text(cleaned_path, cleaned_text)
+    if not complete:
+        # Keep the raw-text fallback for this run only: no fingerprint, not shared, renormalized next time.
+        lineage.mark_incomplete(project_slug, filename, "cleaned", inputs)
+        return cleaned_text
+    lineage.record(project_slug, filename, "cleaned", expected, inputs)
+    publish_artifact(project_slug, filename, "cleaned")
+    return cleaned_text
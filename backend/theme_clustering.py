@@ -0,0 +1,254 @@
+"""
+Deterministic local theme clustering for /themes/initial.
+
+Insight labels become nodes of a co-occurrence graph: two (type, label) pairs are
+linked when the same atom carries both, weighted by the smaller insight weight.
+Louvain-style community detection groups the labels, and each atom joins the
+community holding most of its insight weight. Themes are named after their
+dominant labels. The same atoms always give the same themes, and no LLM call is
+needed unless the caller asks for the final clusters to be renamed.
+"""
+
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from graph_builder import insight_weight
+
+logger = logging.getLogger(__name__)
+
+MAX_THEMES = 8
+UNTHEMED_NAME = "Other observations"
+# Insight types that make the most telling theme names, tried in order before any other type.
+NAMING_TYPES = ("pain", "root_cause", "impact")
+
+LabelKey = Tuple[str, str]
+
+
+def _atom_labels(atom: dict) -> Dict[LabelKey, float]:
+    """(type, label) -> strongest weight for the insights on one atom."""
+    labels: Dict[LabelKey, float] = {}
+    for insight in atom.get("insights", []):
+        if "type" not in insight or "label" not in insight:
+            continue
+        key = (str(insight["type"]), str(insight["label"]))
+        labels[key] = max(labels.get(key, 0.0), insight_weight(insight))
+    return labels
+
+
+def build_label_graph(atom_labels: List[Dict[LabelKey, float]]) -> Dict[LabelKey, Dict[LabelKey, float]]:
+    """Co-occurrence graph over labels; every label appears, even if it has no neighbours."""
+    graph: Dict[LabelKey, Dict[LabelKey, float]] = {}
+    for labels in atom_labels:
+        keys = sorted(labels)
+        for key in keys:
+            graph.setdefault(key, {})
+        for a in range(len(keys)):
+            for b in range(a + 1, len(keys)):
+                weight = min(labels[keys[a]], labels[keys[b]])
+                graph[keys[a]][keys[b]] = graph[keys[a]].get(keys[b], 0.0) + weight
+                graph[keys[b]][keys[a]] = graph[keys[b]].get(keys[a], 0.0) + weight
+    return graph
+
+
+def _local_moving(graph: List[Dict[int, float]]) -> Tuple[List[int], bool]:
+    """One Louvain level: move nodes between communities while modularity improves."""
+    n = len(graph)
+    degree = [sum(neighbours.values()) for neighbours in graph]
+    total_weight = sum(degree)
+    community = list(range(n))
+    if total_weight == 0:
+        return community, False
+    community_degree = degree[:]
+    improved = False
+    for _ in range(50):
+        moved = False
+        for node in range(n):
+            current = community[node]
+            links: Dict[int, float] = {}
+            for other, weight in graph[node].items():
+                if other != node:
+                    links[community[other]] = links.get(community[other], 0.0) + weight
+            community_degree[current] -= degree[node]
+            best = current
+            best_gain = links.get(current, 0.0) - community_degree[current] * degree[node] / total_weight
+            for candidate in sorted(links):
+                gain = links[candidate] - community_degree[candidate] * degree[node] / total_weight
+                if gain > best_gain + 1e-12:
+                    best, best_gain = candidate, gain
+            community_degree[best] += degree[node]
+            if best != current:
+                community[node] = best
+                moved = improved = True
+        if not moved:
+            break
+    relabel: Dict[int, int] = {}
+    return [relabel.setdefault(c, len(relabel)) for c in community], improved
+
+
+def _aggregate(graph: List[Dict[int, float]], community: List[int]) -> List[Dict[int, float]]:
+    """Collapse each community into one node, summing the weights between them."""
+    size = max(community) + 1 if community else 0
+    collapsed: List[Dict[int, float]] = [{} for _ in range(size)]
+    for node, neighbours in enumerate(graph):
+        source = community[node]
+        for other, weight in neighbours.items():
+            target = community[other]
+            collapsed[source][target] = collapsed[source].get(target, 0.0) + weight
+    return collapsed
+
+
+def detect_communities(graph: Dict[LabelKey, Dict[LabelKey, float]]) -> Dict[LabelKey, int]:
+    """Louvain community detection with a fixed node order, so results are repeatable."""
+    nodes = sorted(graph)
+    index = {node: i for i, node in enumerate(nodes)}
+    level = [{index[other]: weight for other, weight in graph[node].items()} for node in nodes]
+    membership = list(range(len(nodes)))
+    while True:
+        community, improved = _local_moving(level)
+        if not improved:
+            break
+        membership = [community[c] for c in membership]
+        level = _aggregate(level, community)
+    return {node: membership[index[node]] for node in nodes}
+
+
+def _ranked_labels(label_counts: Counter) -> List[str]:
+    """Labels by frequency, with pain/root-cause/impact labels ahead of the rest."""
+    def priority(item):
+        (insight_type, label), count = item
+        rank = NAMING_TYPES.index(insight_type) if insight_type in NAMING_TYPES else len(NAMING_TYPES)
+        return (rank, -count, label)
+    ranked: List[str] = []
+    for (_, label), _ in sorted(label_counts.items(), key=priority):
+        if label not in ranked:
+            ranked.append(label)
+    return ranked
+
+
+def _theme_name(ranked: List[str], taken: set) -> str:
+    """Name a theme after its leading label, adding the runner-up if the name is taken."""
+    name = ranked[0] if ranked else UNTHEMED_NAME
+    if name.lower() in taken and len(ranked) > 1:
+        name = f"{ranked[0]} & {ranked[1]}"
+    return name
+
+
+def cluster_atoms_locally(atoms: List[dict], max_themes: int = MAX_THEMES) -> List[dict]:
+    """
+    Group annotated atoms into at most `max_themes` themes without calling the LLM.
+    Returns [{name, summary, atom_ids, dominant_labels}], largest theme first.
+    """
+    atom_labels = [_atom_labels(atom) for atom in atoms]
+    graph = build_label_graph(atom_labels)
+    communities = detect_communities(graph)
+
+    # Each atom joins the community carrying most of its insight weight.
+    members: Dict[int, List[int]] = {}
+    unthemed: List[int] = []
+    for position, labels in enumerate(atom_labels):
+        if not labels:
+            unthemed.append(position)
+            continue
+        scores: Dict[int, float] = {}
+        for key, weight in labels.items():
+            scores[communities[key]] = scores.get(communities[key], 0.0) + weight
+        best = min(scores, key=lambda c: (-scores[c], c))
+        members.setdefault(best, []).append(position)
+
+    groups = [sorted(positions) for _, positions in sorted(members.items())]
+
+    def connection(a: List[int], b: List[int]) -> float:
+        labels_a = {key for p in a for key in atom_labels[p]}
+        labels_b = {key for p in b for key in atom_labels[p]}
+        return sum(graph[x].get(y, 0.0) for x in labels_a for y in labels_b)
+
+    # Fold the smallest group into the one it is most connected to until few enough remain.
+    limit = max(1, max_themes - (1 if unthemed else 0))
+    while len(groups) > limit:
+        groups.sort(key=lambda g: (-len(g), g[0]))
+        smallest = groups.pop()
+        target = max(range(len(groups)), key=lambda i: (connection(smallest, groups[i]), len(groups[i]), -i))
+        groups[target] = sorted(groups[target] + smallest)
+    groups.sort(key=lambda g: (-len(g), g[0]))
+
+    themes = []
+    taken: set = set()
+    for group in groups:
+        label_counts: Counter = Counter()
+        for position in group:
+            label_counts.update(atom_labels[position].keys())
+        ranked = _ranked_labels(label_counts)
+        name = _theme_name(ranked, taken)
+        taken.add(name.lower())
+        dominant = ranked[:3]
+        speakers = {atoms[p].get("speaker") for p in group if atoms[p].get("speaker")}
+        themes.append({
+            "name": name,
+            "summary": f"{len(group)} quotes from {len(speakers) or 'unknown'} speaker(s), mostly about {', '.join(dominant)}.",
+            "atom_ids": [atoms[p]["id"] for p in group],
+            "dominant_labels": dominant,
+        })
+    if unthemed:
+        themes.append({
+            "name": UNTHEMED_NAME,
+            "summary": f"{len(unthemed)} quotes without annotated insights.",
+            "atom_ids": [atoms[p]["id"] for p in unthemed],
+            "dominant_labels": [],
+        })
+    return themes
+
+
+THEME_RENAME_PROMPT = """You are a UX research theme naming assistant.
+
+Below are themes that were already clustered. For each one you get its index, its
+dominant insight labels and a few example quotes. Do not move quotes between themes.
+
+For every theme, return:
+- a short, descriptive name (≤4 words)
+- a 1-2 sentence summary
+
+Return strict JSON:
+[
+  {"index": 0, "name": "Theme name", "summary": "Short summary of the theme."}
+]
+
+Themes:
+{themes}
+"""
+
+
+def rename_themes(themes: List[dict], atoms: List[dict], generate) -> List[dict]:
+    """
+    Ask the LLM for better names and summaries for finished clusters; membership is
+    never changed. `generate(prompt)` returns the reply text. Falls back to the
+    local names on any error.
+    """
+    text_by_id = {atom.get("id"): atom.get("text", "") for atom in atoms}
+    described = [
+        {
+            "index": index,
+            "dominant_labels": theme.get("dominant_labels", []),
+            "examples": [text_by_id.get(atom_id, "") for atom_id in theme["atom_ids"][:3]],
+        }
+        for index, theme in enumerate(themes)
+    ]
+    prompt = THEME_RENAME_PROMPT.replace("{themes}", json.dumps(described, ensure_ascii=False))
+    try:
+        raw = generate(prompt).strip()
+        if raw.startswith("```json"):
+            raw = raw[len("```json"):].strip()
+        if raw.endswith("```"):
+            raw = raw[:-3].strip()
+        renamed = {int(item["index"]): item for item in json.loads(raw)}
+    except Exception as e:
+        logger.error("Theme renaming failed, keeping local names: %s", e)
+        return themes
+    result = []
+    for index, theme in enumerate(themes):
+        update: Optional[dict] = renamed.get(index)
+        if update:
+            theme = {**theme, "name": update.get("name") or theme["name"], "summary": update.get("summary") or theme["summary"]}
+        result.append(theme)
+    return result
@@ -0,0 +1,210 @@
+"""
+Hierarchical map-reduce theme clustering for atom sets too large for one prompt.
+
+Map: atoms are split into batches and each batch is clustered with
+THEME_CLUSTER_PROMPT, batches in parallel. Reduce: the batch-level themes (names,
+summaries and sizes only, never the atoms) are merged by the LLM, in groups when
+there are many, until 3-8 themes remain. Every atom id is assigned exactly once.
+Map results and completed reduce levels are saved under <project>/themes/ when a
+project is given, so a failed reduce step resumes without redoing the map step.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from paths import get_theme_progress_path
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+THEME_MAP_BATCH_SIZE = int(os.getenv("THEME_MAP_BATCH_SIZE", "150"))
+THEME_MAX_CONCURRENCY = int(os.getenv("THEME_MAX_CONCURRENCY", "4"))
+# Above this many themes, a reduce pass merges them in groups of this size.
+THEME_REDUCE_FAN_IN = 40
+MIN_THEMES = 3
+MAX_THEMES = 8
+MAX_ATTEMPTS = 3
+MAX_REDUCE_LEVELS = 6
+
+THEME_CLUSTER_PROMPT = '''You are a UX research theme clustering assistant.\n\nInput: a list of annotated atoms, each with speaker, text, insights, and tags.\n\nYour task:\n- Cluster the atoms into 3-8 high-level themes.\n- Each theme should have:\n  - a short, descriptive name (≤4 words)\n  - a 1-2 sentence summary\n  - a list of atom IDs belonging to the theme\n- Do not create overlapping themes.\n- Every atom must belong to exactly one theme.\n- Use only the information in the atoms and their annotations.\n\nReturn strict JSON:\n[\n  {\n    "name": "Theme name",\n    "summary": "Short summary of the theme.",\n    "atom_ids": ["uuid1", "uuid2", ...]\n  },\n  ...\n]\n\nHere are the annotated atoms:\n{atoms}\n'''
+
+THEME_REDUCE_PROMPT = '''You are a UX research theme clustering assistant.\n\nInput: themes that were found separately in different parts of the same research project. Each has an index, a name, a summary and the number of quotes it holds.\n\nYour task:\n- Merge them into {target} high-level themes, combining themes that describe the same thing.\n- Each merged theme should have:\n  - a short, descriptive name (≤4 words)\n  - a 1-2 sentence summary\n  - the indices of the input themes it combines\n- Every input index must appear in exactly one merged theme.\n\nReturn strict JSON:\n[\n  {\n    "name": "Theme name",\n    "summary": "Short summary of the theme.",\n    "theme_indices": [0, 3, ...]\n  },\n  ...\n]\n\nHere are the themes:\n{themes}\n'''
+
+# generate(prompt, refresh) -> reply text; refresh=True bypasses any cached reply.
+Generate = Callable[[str, bool], str]
+
+
+def _parse_json_list(raw: str) -> list:
+    raw = raw.strip()
+    if raw.startswith("```json"):
+        raw = raw[len("```json"):].strip()
+    if raw.endswith("```"):
+        raw = raw[:-3].strip()
+    parsed = json.loads(raw)
+    if not isinstance(parsed, list):
+        raise ValueError("Expected a JSON list of themes")
+    return parsed
+
+
+def _ask(generate: Generate, prompt: str, parse: Callable[[list], List[dict]]) -> List[dict]:
+    """Call the LLM and parse the reply, retrying without the cache on a bad reply."""
+    last_error: Optional[Exception] = None
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return parse(_parse_json_list(generate(prompt, attempt > 0)))
+        except Exception as e:
+            last_error = e
+            logger.warning("Theme clustering attempt %d failed: %s", attempt + 1, e)
+    raise RuntimeError(f"Theme clustering failed after {MAX_ATTEMPTS} attempts: {last_error}")
+
+
+def _assign_atoms(raw_themes: list, atom_ids: List[str]) -> List[dict]:
+    """Keep each known atom id in the first theme that claims it; leftovers get their own theme."""
+    remaining = set(atom_ids)
+    themes = []
+    for theme in raw_themes:
+        ids = []
+        for atom_id in theme.get("atom_ids", []):
+            atom_id = str(atom_id)
+            if atom_id in remaining:
+                remaining.discard(atom_id)
+                ids.append(atom_id)
+        if ids:
+            themes.append({"name": str(theme.get("name", "")), "summary": str(theme.get("summary", "")), "atom_ids": ids})
+    if remaining:
+        themes.append({
+            "name": "Other observations",
+            "summary": "Quotes the model did not place in any theme.",
+            "atom_ids": [atom_id for atom_id in atom_ids if atom_id in remaining],
+        })
+    return themes
+
+
+def _merge_groups(raw_merged: list, themes: List[dict]) -> List[dict]:
+    """Turn a reduce reply into themes; indices the model dropped stay as they were."""
+    remaining = set(range(len(themes)))
+    merged = []
+    for group in raw_merged:
+        indices = []
+        for index in group.get("theme_indices", []):
+            if isinstance(index, int) and index in remaining:
+                remaining.discard(index)
+                indices.append(index)
+        if indices:
+            merged.append({
+                "name": str(group.get("name") or themes[indices[0]]["name"]),
+                "summary": str(group.get("summary") or themes[indices[0]]["summary"]),
+                "atom_ids": [atom_id for index in indices for atom_id in themes[index]["atom_ids"]],
+            })
+    merged.extend(themes[index] for index in sorted(remaining))
+    return merged
+
+
+def _fold_to_limit(themes: List[dict], limit: int) -> List[dict]:
+    """Last resort when the reduce step will not converge: keep the largest themes, pool the rest."""
+    if len(themes) <= limit:
+        return themes
+    ranked = sorted(themes, key=lambda t: -len(t["atom_ids"]))
+    kept, rest = ranked[:limit - 1], ranked[limit - 1:]
+    kept.append({
+        "name": "Other themes",
+        "summary": "; ".join(t["name"] for t in rest),
+        "atom_ids": [atom_id for t in rest for atom_id in t["atom_ids"]],
+    })
+    return kept
+
+
+class ThemeProgress:
+    """Map and reduce results for one clustering run, saved after every step when a project is given."""
+
+    def __init__(self, project_slug: Optional[str], run_key: str):
+        self.path = get_theme_progress_path(project_slug, run_key) if project_slug else None
+        self.map_results: Dict[str, List[dict]] = {}
+        self.levels: List[List[dict]] = []
+        self._lock = threading.Lock()
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.map_results = data.get("map", {})
+            self.levels = data.get("levels", [])
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        atomic_write_json(self.path, {"map": self.map_results, "levels": self.levels})
+
+    def record_batch(self, index: int, themes: List[dict]) -> None:
+        with self._lock:
+            self.map_results[str(index)] = themes
+            self._save()
+
+    def record_level(self, themes: List[dict]) -> None:
+        with self._lock:
+            self.levels.append(themes)
+            self._save()
+
+
+def run_key(atoms: List[dict], batch_size: int) -> str:
+    """Identify a run by its atoms and batch size, so changed input starts afresh."""
+    digest = hashlib.sha256(str(batch_size).encode("utf-8"))
+    for atom in atoms:
+        digest.update(json.dumps(atom, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def cluster_atoms_hierarchically(atoms: List[dict], generate: Generate,
+                                 project_slug: Optional[str] = None,
+                                 batch_size: int = THEME_MAP_BATCH_SIZE,
+                                 max_workers: int = THEME_MAX_CONCURRENCY) -> List[dict]:
+    """Cluster atoms batch by batch, then merge the batch themes until 3-8 remain."""
+    batch_size = max(1, batch_size)
+    progress = ThemeProgress(project_slug, run_key(atoms, batch_size))
+    batches = [atoms[i:i + batch_size] for i in range(0, len(atoms), batch_size)]
+
+    def map_batch(index: int) -> List[dict]:
+        cached = progress.map_results.get(str(index))
+        if cached is not None:
+            return cached
+        batch = batches[index]
+        ids = [str(atom["id"]) for atom in batch]
+        prompt = THEME_CLUSTER_PROMPT.replace("{atoms}", json.dumps(batch, ensure_ascii=False))
+        themes = _ask(generate, prompt, lambda raw: _assign_atoms(raw, ids))
+        progress.record_batch(index, themes)
+        logger.info("Theme map batch %d/%d: %d themes", index + 1, len(batches), len(themes))
+        return themes
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        themes = [theme for batch_themes in pool.map(map_batch, range(len(batches))) for theme in batch_themes]
+
+    if progress.levels:
+        themes = progress.levels[-1]
+        logger.info("Resuming theme reduce after level %d", len(progress.levels))
+
+    def reduce_group(group: List[dict], target: str) -> List[dict]:
+        described = [
+            {"index": i, "name": t["name"], "summary": t["summary"], "quotes": len(t["atom_ids"])}
+            for i, t in enumerate(group)
+        ]
+        prompt = (THEME_REDUCE_PROMPT.replace("{target}", target)
+                  .replace("{themes}", json.dumps(described, ensure_ascii=False)))
+        return _ask(generate, prompt, lambda raw: _merge_groups(raw, group))
+
+    while len(themes) > MAX_THEMES and len(progress.levels) < MAX_REDUCE_LEVELS:
+        if len(themes) <= THEME_REDUCE_FAN_IN:
+            reduced = reduce_group(themes, f"{MIN_THEMES}-{MAX_THEMES}")
+        else:
+            groups = [themes[i:i + THEME_REDUCE_FAN_IN] for i in range(0, len(themes), THEME_REDUCE_FAN_IN)]
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                reduced = [t for group in pool.map(lambda g: reduce_group(g, str(MAX_THEMES)), groups) for t in group]
+        if len(reduced) >= len(themes):
+            logger.warning("Theme reduce made no progress at %d themes", len(themes))
+            break
+        themes = reduced
+        progress.record_level(themes)
+
+    return _fold_to_limit(themes, MAX_THEMES)